@@ -0,0 +1,35 @@
+"""07_stored-paths-indexes
+
+Revision ID: 2a6c9e4f7b18
+Revises: 8f3b6d2e1a97
+Create Date: 2026-10-18 19:24:51.602187
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '2a6c9e4f7b18'
+down_revision: Union[str, None] = '8f3b6d2e1a97'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # indexes are built concurrently to keep the tables writable, which requires autocommit
+    with op.get_context().autocommit_block():
+        op.create_index('ix_blobs_path_bytes', 'blobs', [sa.text('path COLLATE "C"')],
+                        unique=False, postgresql_concurrently=True)
+        op.create_index('ix_files_filepath_bytes', 'files', [sa.text('filepath COLLATE "C"')],
+                        unique=False, postgresql_where=sa.text('digest IS NULL'),
+                        postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_files_filepath_bytes', table_name='files',
+                      postgresql_concurrently=True)
+        op.drop_index('ix_blobs_path_bytes', table_name='blobs', postgresql_concurrently=True)
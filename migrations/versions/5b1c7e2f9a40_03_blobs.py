@@ -0,0 +1,39 @@
+"""03_blobs
+
+Revision ID: 5b1c7e2f9a40
+Revises: 936ea6066466
+Create Date: 2026-10-18 14:05:12.318406
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5b1c7e2f9a40'
+down_revision: Union[str, None] = '936ea6066466'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('blobs',
+    sa.Column('digest', sa.String(length=64), nullable=False),
+    sa.Column('path', sa.String(length=256), nullable=False),
+    sa.Column('size', sa.BigInteger(), nullable=False),
+    sa.Column('refcount', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('digest'),
+    sa.UniqueConstraint('path')
+    )
+    # existing files keep their content under their filepath
+    op.add_column('files', sa.Column('digest', sa.String(length=64), nullable=True))
+    op.create_foreign_key('files_digest_fkey', 'files', 'blobs', ['digest'], ['digest'],
+                          deferrable=True, initially='DEFERRED')
+
+
+def downgrade() -> None:
+    op.drop_constraint('files_digest_fkey', 'files', type_='foreignkey')
+    op.drop_column('files', 'digest')
+    op.drop_table('blobs')
@@ -0,0 +1,34 @@
+"""06_user-usage
+
+Revision ID: 8f3b6d2e1a97
+Revises: e7a94b3c2d15
+Create Date: 2026-10-18 18:11:05.318524
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8f3b6d2e1a97'
+down_revision: Union[str, None] = 'e7a94b3c2d15'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('user_usage',
+                    sa.Column('username', sa.String(length=16), nullable=False),
+                    sa.Column('size', sa.BigInteger(), nullable=False),
+                    sa.Column('files', sa.Integer(), nullable=False),
+                    sa.ForeignKeyConstraint(['username'], ['users.username'], ondelete='CASCADE'),
+                    sa.PrimaryKeyConstraint('username'))
+    # files with unknown size, uploaded before sizes were recorded, are counted as empty
+    op.execute('INSERT INTO user_usage (username, size, files) '
+               'SELECT username, COALESCE(SUM(size), 0), COUNT(*) FROM files GROUP BY username')
+
+
+def downgrade() -> None:
+    op.drop_table('user_usage')
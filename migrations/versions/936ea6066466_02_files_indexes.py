@@ -0,0 +1,34 @@
+"""02_files-indexes
+
+Revision ID: 936ea6066466
+Revises: 0e22a553ae01
+Create Date: 2026-10-18 10:12:41.503118
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '936ea6066466'
+down_revision: Union[str, None] = '0e22a553ae01'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # indexes are built concurrently to keep the table writable, which requires autocommit
+    with op.get_context().autocommit_block():
+        op.create_index('ix_files_username_id', 'files', ['username', 'id'], unique=False,
+                        postgresql_concurrently=True)
+        op.create_index('ix_files_username_filepath', 'files', ['username', 'filepath'],
+                        unique=False, postgresql_ops={'filepath': 'text_pattern_ops'},
+                        postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_files_username_filepath', table_name='files',
+                      postgresql_concurrently=True)
+        op.drop_index('ix_files_username_id', table_name='files', postgresql_concurrently=True)
@@ -0,0 +1,47 @@
+"""08_upload-sessions
+
+Revision ID: b5e0d7a3c961
+Revises: 2a6c9e4f7b18
+Create Date: 2026-10-18 21:07:33.845120
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b5e0d7a3c961'
+down_revision: Union[str, None] = '2a6c9e4f7b18'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('upload_sessions',
+                    sa.Column('id', sa.String(length=32), nullable=False),
+                    sa.Column('username', sa.String(length=16), nullable=False),
+                    sa.Column('filepath', sa.String(length=256), nullable=False),
+                    sa.Column('multipart_id', sa.String(), nullable=False),
+                    sa.Column('size', sa.BigInteger(), nullable=False),
+                    sa.Column('part_size', sa.Integer(), nullable=False),
+                    sa.Column('received', sa.BigInteger(), nullable=False),
+                    sa.Column('expires_at', sa.DateTime(timezone=True), nullable=False),
+                    sa.ForeignKeyConstraint(['username'], ['users.username'], ondelete='CASCADE'),
+                    sa.PrimaryKeyConstraint('id'),
+                    sa.UniqueConstraint('filepath'))
+    op.create_index(op.f('ix_upload_sessions_expires_at'), 'upload_sessions', ['expires_at'])
+    op.create_table('upload_parts',
+                    sa.Column('session_id', sa.String(length=32), nullable=False),
+                    sa.Column('number', sa.Integer(), nullable=False),
+                    sa.Column('etag', sa.String(), nullable=False),
+                    sa.ForeignKeyConstraint(['session_id'], ['upload_sessions.id'],
+                                            ondelete='CASCADE'),
+                    sa.PrimaryKeyConstraint('session_id', 'number'))
+
+
+def downgrade() -> None:
+    op.drop_table('upload_parts')
+    op.drop_index(op.f('ix_upload_sessions_expires_at'), table_name='upload_sessions')
+    op.drop_table('upload_sessions')
@@ -0,0 +1,30 @@
+"""04_files-size-modified
+
+Revision ID: c3d8a1f04e72
+Revises: 5b1c7e2f9a40
+Create Date: 2026-10-18 15:22:47.905114
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c3d8a1f04e72'
+down_revision: Union[str, None] = '5b1c7e2f9a40'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('files', sa.Column('size', sa.BigInteger(), nullable=True))
+    op.add_column('files', sa.Column('modified_at', sa.DateTime(timezone=True), nullable=True))
+    # sizes of deduplicated files are known, modification times of existing files are not
+    op.execute('UPDATE files SET size = blobs.size FROM blobs WHERE files.digest = blobs.digest')
+
+
+def downgrade() -> None:
+    op.drop_column('files', 'modified_at')
+    op.drop_column('files', 'size')
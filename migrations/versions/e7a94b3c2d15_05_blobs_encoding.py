@@ -0,0 +1,26 @@
+"""05_blobs-encoding
+
+Revision ID: e7a94b3c2d15
+Revises: c3d8a1f04e72
+Create Date: 2026-10-18 17:03:29.741850
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e7a94b3c2d15'
+down_revision: Union[str, None] = 'c3d8a1f04e72'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('blobs', sa.Column('encoding', sa.String(length=16), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('blobs', 'encoding')
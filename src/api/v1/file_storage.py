@@ -1,29 +1,256 @@
 """Contains API endpoints for file listing, uploading and downloading"""
+import asyncio
+from collections import Counter
+from contextlib import suppress
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+import hashlib
 import os
-from typing import Annotated, Any, List, Optional
+import re
+from typing import Annotated, Any, AsyncIterator, List, Optional, Tuple
+import uuid
 
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, Query
+from fastapi import APIRouter, Depends, Header, HTTPException, Request, status, UploadFile, Query
 from fastapi import File as FAFile
-from fastapi.responses import StreamingResponse
-from sqlalchemy.exc import IntegrityError
+from fastapi.responses import RedirectResponse, Response, StreamingResponse
+from pydantic import ValidationError
+from sqlalchemy.exc import DataError, IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from api.v1.user import check_token
+from core.config import app_settings
+from core.responses import SendfileResponse
 from db.db import get_session
-from schemas.file_storage import File, FileCreate
+from schemas.file_storage import (BlobCreate, File, FileCount, FileCreate, FileMetadata,
+                                  FilePage, FileUploadResult, PresignedUrl, StorageUsage,
+                                  UploadSession, UploadSessionCreate)
 from schemas.user import Token
-from services.file_storage import files_crud
-from storage.storage import MinioClient
+from services.file_cache import file_cache
+from services.file_storage import blobs_crud, files_crud, uploads_crud, usage_crud
+from storage.archive import stream_zip
+from storage.base import StorageError
+from storage.cache import object_cache
+from storage.compression import decompress, decompress_stream
+from storage.storage import storage_client
 
 
 router = APIRouter()
-minio = MinioClient()
+RANGE_PATTERN = re.compile(r'^bytes=(\d*)-(\d*)$')
 
 
-@router.get('/files', response_model=Optional[List[File]])
+async def read_chunks(file: UploadFile) -> AsyncIterator[bytes]:
+    """Reads an uploaded file chunk by chunk.
+
+    Args:
+        file (UploadFile): uploaded file.
+
+    Yields:
+        bytes: next chunk of the file.
+    """
+    while chunk := await file.read(app_settings.upload_chunk_size):
+        yield chunk
+
+
+async def hash_file(file: UploadFile) -> Tuple[str, int]:
+    """Computes SHA-256 digest of an uploaded file and rewinds the file.
+
+    Args:
+        file (UploadFile): uploaded file.
+
+    Returns:
+        Tuple[str, int]: hex digest and size of the file in bytes.
+    """
+    file_hash = hashlib.sha256()
+    size = 0
+    async for chunk in read_chunks(file):
+        file_hash.update(chunk)
+        size += len(chunk)
+    await file.seek(0)
+    return file_hash.hexdigest(), size
+
+
+def build_filepath(username: str, filepath: Optional[str], filename: str) -> str:
+    """Builds a path to an uploaded file in the storage.
+
+    Args:
+        username (str): name of the user;
+        filepath (str, optional): path to the file or its directory (ends with '/')
+            relative to the user`s root;
+        filename (str): name of the uploaded file.
+
+    Returns:
+        str: path to the file in the storage.
+    """
+    if not filepath:
+        return os.path.join(username, filename)
+    if os.path.basename(filepath): # file
+        return os.path.join(username, filepath)
+    return os.path.join(username, filepath, filename)
+
+
+def check_filepath_length(filepath: str) -> None:
+    """Checks that a path to a file in the storage fits into its database column.
+
+    Args:
+        filepath (str): path to the file in the storage.
+
+    Raises:
+        HTTPException (422): if the path is longer than app_settings.max_filepath_length.
+    """
+    if len(filepath) > app_settings.max_filepath_length:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                            detail=f'File path must be at most '
+                                   f'{app_settings.max_filepath_length} characters long')
+
+
+def check_quota(used: int, size: int = 0) -> None:
+    """Checks that files of a user fit into app_settings.user_quota.
+
+    Args:
+        used (int): total size of the user`s files in bytes;
+        size (int, optional): size of files to be added in bytes. Defaults to 0.
+
+    Raises:
+        HTTPException (413): if the files do not fit into the quota.
+    """
+    if 0 < app_settings.user_quota < used + size:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                            detail=f'Storage quota of {app_settings.user_quota} bytes '
+                                   'is exceeded')
+
+
+async def read_usage(database: AsyncSession, username: str) -> int:
+    """Returns total size of files of a user. The transaction is ended, so a database
+        connection is not held while content is streamed afterwards.
+
+    Args:
+        database (AsyncSession): database session;
+        username (str): name of the user.
+
+    Returns:
+        int: total size of the user`s files in bytes.
+    """
+    usage_db = await usage_crud.read_by_username(database=database, username=username)
+    await database.commit()
+    return usage_db.size if usage_db is not None else 0
+
+
+async def limit_chunks(chunks: AsyncIterator[bytes], used: int) -> AsyncIterator[bytes]:
+    """Passes file content through, failing as soon as it exceeds the user`s quota.
+
+    Args:
+        chunks (AsyncIterator[bytes]): content of the file;
+        used (int): total size of the user`s files in bytes.
+
+    Raises:
+        HTTPException (413): if the content does not fit into the quota.
+
+    Yields:
+        bytes: next chunk of the content.
+    """
+    size = 0
+    async for chunk in chunks:
+        size += len(chunk)
+        check_quota(used, size)
+        yield chunk
+
+
+async def store_file(database: AsyncSession, username: str, filepath: str,
+                     chunks: AsyncIterator[bytes], size: Optional[int] = None) -> File:
+    """Streams file content into the storage and registers the file in the database.
+
+    The content is hashed while it is streamed and stored once for all files with the same
+    SHA-256 digest. The database records are written after the whole content is received but
+    before the upload is completed, so a failed insert or a client disconnection aborts
+    the upload, and so does the content being already stored. Content smaller than one part
+    is not sent to the storage at all in that case.
+
+    If quotas are enabled, the declared size is checked before anything is streamed and
+    the upload is aborted as soon as the content exceeds the remaining quota. The final check
+    is made against usage updated in the same transaction as the file record.
+
+    Args:
+        database (AsyncSession): database session;
+        username (str): name of the user;
+        filepath (str): path to the file in the storage;
+        chunks (AsyncIterator[bytes]): content of the file;
+        size (int, optional): declared size of the file in bytes. Defaults to None.
+
+    Raises:
+        HTTPException (406): if file with such filepath already exists;
+        HTTPException (413): if the file does not fit into the user`s quota.
+
+    Returns:
+        File: file information including record id and filepath in the storage.
+    """
+    if app_settings.user_quota:
+        used = await read_usage(database=database, username=username)
+        check_quota(used, size or 0)
+        chunks = limit_chunks(chunks, used)
+    blob_path = storage_client.new_blob_path()
+    try:
+        async with storage_client.upload_stream(
+                filepath=blob_path, compress=app_settings.upload_compression) as upload:
+            async for chunk in chunks:
+                await upload.write(chunk)
+            file_db = await files_crud.create(database=database,
+                                              obj_in=FileCreate(username=username,
+                                                                filepath=filepath,
+                                                                digest=upload.digest,
+                                                                size=upload.size),
+                                              commit=False)
+            check_quota(await usage_crud.add(database=database, username=username,
+                                             size=upload.size, files=1))
+            blob_db, = await blobs_crud.acquire_many(
+                database=database,
+                objs_in=[BlobCreate(digest=upload.digest, path=blob_path, size=upload.size,
+                                    encoding=upload.encoding)])
+            if blob_db.path != blob_path: # the content is already stored
+                await upload.abort()
+        await database.commit()
+        file_cache.invalidate([(username, file_db.id, file_db.filepath)])
+        return File(id=file_db.id, filepath=file_db.filepath)
+    except IntegrityError as exc:
+        raise HTTPException(status_code=status.HTTP_406_NOT_ACCEPTABLE,
+                            detail=f"File with filepath '{filepath}' already exists") from exc
+
+
+@router.get('/files', response_model=FilePage)
 async def get_files(database: AsyncSession = Depends(get_session),
+                    user: Token = Depends(check_token),
+                    limit: Annotated[int, Query(ge=1, le=app_settings.max_files_page_size)] =
+                        app_settings.files_page_size,
+                    cursor: Optional[int] = None,
+                    prefix: Optional[str] = None) -> Any:
+    """Returns a page of uploaded files
+
+    Args:
+        database (AsyncSession, optional): database session. Defaults to Depends(get_session);
+        user (Token, optional): user information including username and authentication token.
+            Defaults to Depends(check_token);
+        limit (int, optional): max number of files in the page.
+            Defaults to app_settings.files_page_size;
+        cursor (int, optional): next_cursor of the previous page. Defaults to None;
+        prefix (str, optional): directory or beginning of filepaths relative to the user`s root.
+            Defaults to None.
+
+    Returns:
+        FilePage: list with information about each uploaded file including unique identification
+            number of the file and its path in the storage, and cursor of the next page.
+    """
+    file_db = await files_crud.read_page_by_username(
+        database=database, username=user.username, limit=limit + 1, cursor=cursor,
+        prefix=os.path.join(user.username, prefix) if prefix else None)
+    next_cursor = file_db[limit - 1].id if len(file_db) > limit else None
+    return FilePage(files=[File(id=record.id, filepath=record.filepath)
+                           for record in file_db[:limit]],
+                    next_cursor=next_cursor)
+
+
+@router.get('/files/usage', response_model=StorageUsage)
+async def get_usage(database: AsyncSession = Depends(get_session),
                     user: Token = Depends(check_token)) -> Any:
-    """Returns list of uploaded files
+    """Returns storage used by files of a user.
 
     Args:
         database (AsyncSession, optional): database session. Defaults to Depends(get_session);
@@ -31,14 +258,13 @@ async def get_files(database: AsyncSession = Depends(get_session),
             Defaults to Depends(check_token).
 
     Returns:
-        List[File]: list with information about each uploaded file including unique identification
-            number of the file and its path in the storage.
+        StorageUsage: total size and number of the user`s files and the quota.
     """
-    file_db = await files_crud.read_many_by_username(database=database, username=user.username)
-    if file_db is not None:
-        return [File(id=record.id, filepath=record.filepath) for record in file_db]
-    return []
-
+    usage_db = await usage_crud.read_by_username(database=database, username=user.username)
+    usage = StorageUsage(quota=app_settings.user_quota or None)
+    if usage_db is not None:
+        usage.size, usage.files = usage_db.size, usage_db.files
+    return usage
 
 
 @router.post('/files/upload', status_code=status.HTTP_201_CREATED)
@@ -56,61 +282,1033 @@ async def upload_file(database: AsyncSession = Depends(get_session),
         file (UploadFile): file to be uploaded into the storage.
 
     Raises:
-        HTTPException (406): if file with such filepath already exists.
+        HTTPException (406): if file with such filepath already exists;
+        HTTPException (413): if the file does not fit into the user`s quota.
 
     Returns:
         File: file information including record id and filepath in the storage.
     """
-    if not filepath:
-        filepath = os.path.join(user.username, file.filename)
+    filepath = build_filepath(user.username, filepath, file.filename)
+    return await store_file(database=database, username=user.username, filepath=filepath,
+                            chunks=read_chunks(file), size=file.size)
+
+
+@router.post('/files/upload/batch', response_model=List[FileUploadResult])
+async def upload_files_batch(database: AsyncSession = Depends(get_session),
+                             user: Token = Depends(check_token),
+                             directory: Annotated[str | None, Query(pattern='^[A-Za-z]')] = None,
+                             files: List[UploadFile] = FAFile(...)) -> Any:
+    """Uploads several files into the storage in one request.
+
+    Files are hashed and registered in the database with a single insert, content which is
+    not stored yet is uploaded into the storage concurrently, once for files with the same
+    content. Records of files failed to upload are removed before the commit. The whole batch
+    is rejected before anything is uploaded if the files do not fit into the user`s quota.
+
+    Args:
+        database (AsyncSession, optional): database session. Defaults to Depends(get_session);
+        user (Token, optional): user information including username and authentication token.
+            Defaults to Depends(check_token);
+        directory (str, optional): directory of the files in the storage. Defaults to None;
+        files (List[UploadFile]): files to be uploaded into the storage.
+
+    Raises:
+        HTTPException (413): if there are more than app_settings.max_batch_files files
+            or they do not fit into the user`s quota.
+
+    Returns:
+        List[FileUploadResult]: result of each file upload in the order of the files,
+            including record id for uploaded files and failure reason for the rest.
+    """
+    if len(files) > app_settings.max_batch_files:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                            detail=f'At most {app_settings.max_batch_files} files are allowed')
+    directory = os.path.join(directory, '') if directory else None
+    filepaths = [build_filepath(user.username, directory, file.filename) for file in files]
+    # a filepath repeated in the batch is uploaded only once
+    uploads = {}
+    for file, filepath in zip(files, filepaths):
+        uploads.setdefault(filepath, file)
+    semaphore = asyncio.Semaphore(app_settings.batch_upload_concurrency)
+
+    async def hash_upload(file: UploadFile) -> Tuple[str, int]:
+        async with semaphore:
+            return await hash_file(file)
+
+    hashes = dict(zip(uploads, await asyncio.gather(*[hash_upload(file)
+                                                       for file in uploads.values()])))
+    created = await files_crud.create_many(
+        database=database, objs_in=[FileCreate(username=user.username, filepath=filepath,
+                                               digest=hashes[filepath][0],
+                                               size=hashes[filepath][1])
+                                    for filepath in uploads])
+    file_ids = {record.filepath: record.id for record in created}
+    if file_ids:
+        check_quota(await usage_crud.add(
+            database=database, username=user.username,
+            size=sum(hashes[filepath][1] for filepath in file_ids), files=len(file_ids)))
+    # each distinct content is uploaded at most once, from the first file having it
+    sources = {}
+    for filepath in file_ids:
+        sources.setdefault(hashes[filepath][0], filepath)
+    references = Counter(hashes[filepath][0] for filepath in file_ids)
+    blob_paths = {digest: storage_client.new_blob_path() for digest in sources}
+    blobs = await blobs_crud.acquire_many(
+        database=database, objs_in=[BlobCreate(digest=digest, path=blob_paths[digest],
+                                               size=hashes[filepath][1],
+                                               refcount=references[digest])
+                                    for digest, filepath in sources.items()]) if sources else []
+    new_digests = [blob.digest for blob in blobs if blob.path == blob_paths[blob.digest]]
+    encodings = {}
+
+    async def upload(digest: str) -> Optional[str]:
+        async with semaphore:
+            try:
+                async with storage_client.upload_stream(
+                        filepath=blob_paths[digest],
+                        compress=app_settings.upload_compression) as upload_stream:
+                    async for chunk in read_chunks(uploads[sources[digest]]):
+                        await upload_stream.write(chunk)
+            except OSError as exc:
+                return f'Upload failed: {exc}'
+        if upload_stream.encoding is not None:
+            encodings[digest] = upload_stream.encoding
+        return None
+
+    errors = dict(zip(new_digests, await asyncio.gather(*[upload(digest)
+                                                           for digest in new_digests])))
+    await blobs_crud.set_encodings(database=database, encodings=encodings)
+    failed = {filepath: file_id for filepath, file_id in file_ids.items()
+              if errors.get(hashes[filepath][0])}
+    failed_ids = list(failed.values())
+    if failed_ids:
+        await usage_crud.add(database=database, username=user.username,
+                             size=-sum(hashes[filepath][1] for filepath in failed),
+                             files=-len(failed))
+        # blobs of the failed content were inserted by this transaction and are deleted
+        digests = await files_crud.delete_many_by_ids(database=database, entity_ids=failed_ids)
+        await blobs_crud.release_many(database=database, digests=digests)
+    await database.commit()
+    file_cache.invalidate((user.username, file_id, filepath)
+                          for filepath, file_id in file_ids.items())
+    results = {}
+    for filepath in uploads:
+        if filepath not in file_ids:
+            results[filepath] = FileUploadResult(
+                filepath=filepath, detail=f"File with filepath '{filepath}' already exists")
+        elif error := errors.get(hashes[filepath][0]):
+            results[filepath] = FileUploadResult(filepath=filepath, detail=error)
+        else:
+            results[filepath] = FileUploadResult(filepath=filepath, id=file_ids[filepath])
+    return [results[filepath] if file is uploads[filepath] else
+            FileUploadResult(filepath=filepath, detail='Duplicate filepath in the batch')
+            for file, filepath in zip(files, filepaths)]
+
+
+@router.post('/files/upload/stream', status_code=status.HTTP_201_CREATED)
+async def upload_file_stream(request: Request,
+                             filepath: Annotated[str, Query(pattern='^[A-Za-z]')],
+                             database: AsyncSession = Depends(get_session),
+                             user: Token = Depends(check_token)) -> Any:
+    """Uploads a file passed as a raw request body into the storage.
+
+    The body is sent to the storage as multipart parts while it is still being received,
+    so memory used by the request does not depend on the file size.
+
+    Args:
+        request (Request): request with file content as its body;
+        filepath (str): path to the file in the storage;
+        database (AsyncSession, optional): database session. Defaults to Depends(get_session);
+        user (Token, optional): user information including username and authentication token.
+            Defaults to Depends(check_token).
+
+    Raises:
+        HTTPException (422): if filepath points to a directory;
+        HTTPException (406): if file with such filepath already exists;
+        HTTPException (413): if the file does not fit into the user`s quota.
+
+    Returns:
+        File: file information including record id and filepath in the storage.
+    """
+    if not os.path.basename(filepath):
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                            detail="File path must include a file name")
+    content_length = request.headers.get('content-length', '')
+    return await store_file(database=database, username=user.username,
+                            filepath=os.path.join(user.username, filepath),
+                            chunks=request.stream(),
+                            size=int(content_length) if content_length.isdigit() else None)
+
+
+async def read_file(database: AsyncSession, username: str, filepath: Optional[str],
+                    file_id: Optional[int]) -> FileMetadata:
+    """Searches for a file of a user by its filepath or unique identifier.
+        Found files are cached for app_settings.file_cache_ttl seconds.
+
+    Args:
+        database (AsyncSession): database session;
+        username (str): name of the user;
+        filepath (str, optional): path to the file in the storage;
+        file_id (int, optional): unique identifier of the file.
+
+    Raises:
+        HTTPException (422): if both filepath and file ID is not provided;
+        HTTPException (404): if requested file does not exist.
+
+    Returns:
+        FileMetadata: metadata of the requested file.
+    """
+    if not filepath and not file_id:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                            detail="File ID or file path must be provided")
+    metadata = file_cache.get(username=username, file_id=file_id, filepath=filepath)
+    if metadata is not None:
+        return metadata
+    version = file_cache.version
+    if filepath:
+        file_db = await files_crud.read_one_by_filepath(database=database, username=username,
+                                                        filepath=filepath)
+    elif file_id:
+        file_db = await files_crud.read_one_by_id(database=database, username=username,
+                                                  entity_id=file_id)
+    if file_db is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+    metadata = FileMetadata.model_validate(file_db, from_attributes=True)
+    file_cache.set(metadata, version=version)
+    return metadata
+
+
+def parse_range(range_header: str, size: int) -> Optional[Tuple[int, int]]:
+    """Parses the Range header of a request. Only a single byte range is supported,
+        other forms of the header are ignored and the whole file is sent.
+
+    Args:
+        range_header (str): value of the Range header;
+        size (int): size of the requested file in bytes.
+
+    Raises:
+        HTTPException (416): if the range can not be satisfied.
+
+    Returns:
+        Optional[Tuple[int, int]]: first and last (inclusive) byte positions of the range.
+    """
+    match = RANGE_PATTERN.match(range_header.strip())
+    if match is None or match.groups() == ('', ''):
+        return None
+    start, end = match.groups()
+    if not start: # suffix range, e.g. bytes=-500
+        start, end = size - min(int(end), size), size - 1
+        if int(match.group(2)) == 0:
+            start = size
+    elif end and int(end) < int(start):
+        return None
     else:
-        if os.path.basename(filepath): # file
-            filepath = os.path.join(user.username, filepath)
+        start, end = int(start), min(int(end), size - 1) if end else size - 1
+    if start >= size:
+        raise HTTPException(status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+                            headers={'Content-Range': f'bytes */{size}'})
+    return start, end
+
+
+def is_not_modified(etag: str, last_modified: datetime, if_none_match: Optional[str],
+                    if_modified_since: Optional[str]) -> bool:
+    """Evaluates conditional headers of a request. If-Modified-Since is ignored
+        if If-None-Match is present.
+
+    Args:
+        etag (str): ETag of the file;
+        last_modified (datetime): modification time of the file;
+        if_none_match (str, optional): value of the If-None-Match header;
+        if_modified_since (str, optional): value of the If-Modified-Since header.
+
+    Returns:
+        bool: True if the client has the current version of the file.
+    """
+    if if_none_match is not None:
+        tags = [tag.strip().removeprefix('W/') for tag in if_none_match.split(',')]
+        return '*' in tags or etag in tags
+    if if_modified_since is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        return last_modified.replace(microsecond=0) <= since
+    return False
+
+
+def accepts_encoding(accept_encoding: Optional[str], encoding: str) -> bool:
+    """Checks if a client accepts a content coding.
+
+    Args:
+        accept_encoding (str, optional): value of the Accept-Encoding header;
+        encoding (str): content coding.
+
+    Returns:
+        bool: True if the coding is listed with a non-zero quality value.
+    """
+    for item in (accept_encoding or '').split(','):
+        coding, _, params = item.partition(';')
+        if coding.strip().lower() != encoding:
+            continue
+        quality = params.strip().removeprefix('q=')
+        try:
+            return not params.strip() or float(quality) > 0
+        except ValueError:
+            return False
+    return False
+
+
+@router.get('/files/download', status_code=status.HTTP_200_OK)
+async def download_file(database: AsyncSession = Depends(get_session),
+                        user: Token = Depends(check_token),
+                        filepath: Optional[str] = None,
+                        file_id: Optional[int] = None,
+                        range_header: Annotated[Optional[str], Header(alias='Range')] = None,
+                        if_range: Annotated[Optional[str], Header()] = None,
+                        if_none_match: Annotated[Optional[str], Header()] = None,
+                        if_modified_since: Annotated[Optional[str], Header()] = None,
+                        accept_encoding: Annotated[Optional[str], Header()] = None) -> Any:
+    """Downloads a file. The file is relayed from the storage chunk by chunk, a single byte range
+        may be requested with the Range header to resume a download or seek in a media file.
+
+    ETag, size and modification time of files stored by their digest are taken from
+    the database, so a conditional request for an unchanged file is answered with 304
+    without querying the storage. Content of such files is immutable, small ones are served
+    from the object cache.
+
+    Compressed content is sent as is with Content-Encoding and a weak ETag if the client
+    accepts its codec, otherwise it is decompressed. Ranges are always taken from
+    the original content. Content stored on the local disk is sent from the file, with sendfile
+    if the ASGI server supports it.
+
+    Args:
+        database (AsyncSession, optional): database session. Defaults to Depends(get_session);
+        user (Token, optional): user information including username and authentication token.
+            Defaults to Depends(check_token);
+        filepath (str, optional): path to the file in the storage. Defaults to None;
+        file_id (int, optional): unique identifier of the file. Defaults to None;
+        range_header (str, optional): requested byte range. Defaults to None;
+        if_range (str, optional): ETag or modification date the range is valid for,
+            the whole file is sent if it has changed since. Defaults to None;
+        if_none_match (str, optional): ETags of versions of the file the client has.
+            Defaults to None;
+        if_modified_since (str, optional): modification date of the version of the file
+            the client has. Defaults to None;
+        accept_encoding (str, optional): content codings accepted by the client.
+            Defaults to None.
+
+    Raises:
+        HTTPException (422): if both filepath and file ID is not provided;
+        HTTPException (404): if requested file does not exist;
+        HTTPException (416): if requested range can not be satisfied.
+
+    Returns:
+        StreamingResponse | SendfileResponse | Response: requested file or its part,
+            or an empty 304 response.
+    """
+    file_db = await read_file(database=database, username=user.username, filepath=filepath,
+                              file_id=file_id)
+    if None not in (file_db.digest, file_db.size, file_db.modified_at):
+        etag, size, modified_at = f'"{file_db.digest}"', file_db.size, file_db.modified_at
+    else:
+        try:
+            stat = await storage_client.stat_file(filepath=file_db.storage_path)
+        except FileNotFoundError as exc:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND) from exc
+        etag, size, modified_at = f'"{stat.etag}"', stat.size, stat.last_modified
+    last_modified = format_datetime(modified_at, usegmt=True)
+    headers = {'ETag': etag, 'Last-Modified': last_modified}
+    if is_not_modified(etag, modified_at, if_none_match, if_modified_since):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    headers |= {'Content-Disposition': f"attachment; filename={file_db.filepath.split('/')[-1]}",
+                'Accept-Ranges': 'bytes'}
+    byte_range = None
+    if range_header and (if_range is None or if_range in (etag, last_modified)):
+        byte_range = parse_range(range_header, size)
+    start, end = byte_range if byte_range is not None else (0, size - 1)
+    response_status = status.HTTP_200_OK
+    if byte_range is not None:
+        headers['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response_status = status.HTTP_206_PARTIAL_CONTENT
+    encoding = file_db.encoding
+    pass_through = encoding is not None and byte_range is None and \
+        accepts_encoding(accept_encoding, encoding)
+    if encoding is not None:
+        headers['Vary'] = 'Accept-Encoding'
+    if pass_through:
+        headers |= {'Content-Encoding': encoding, 'ETag': f'W/{etag}'}
+    try: # the file may have been deleted after its metadata was cached
+        if encoding is None or pass_through:
+            local_file = await storage_client.open_local(filepath=file_db.storage_path)
+            if local_file is not None: # sent from the page cache, possibly with sendfile
+                return SendfileResponse(local_file, offset=start,
+                                        count=end - start + 1 if byte_range else None,
+                                        status_code=response_status, headers=headers)
+        if file_db.digest is not None and object_cache.fits(size):
+            content = await storage_client.read_file_cached(filepath=file_db.storage_path)
+            if encoding is not None and not pass_through:
+                content = decompress(content, encoding)
+            return Response(content[start:end + 1] if byte_range else content,
+                            status_code=response_status, headers=headers)
+        if pass_through: # size of the stored content is not known
+            file = await storage_client.download_stream(filepath=file_db.storage_path)
+            return StreamingResponse(file, headers=headers)
+        headers['Content-Length'] = str(end - start + 1)
+        if encoding is not None:
+            file = decompress_stream(await storage_client.download_stream(
+                filepath=file_db.storage_path), encoding, offset=start, length=end - start + 1)
         else:
-            filepath = os.path.join(user.username, filepath, file.filename)
+            file = await storage_client.download_stream(
+                filepath=file_db.storage_path, offset=start,
+                length=end - start + 1 if byte_range else 0)
+    except FileNotFoundError as exc:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND) from exc
+    return StreamingResponse(file, status_code=response_status, headers=headers)
+
+
+@router.get('/files/download/archive', status_code=status.HTTP_200_OK)
+async def download_archive(database: AsyncSession = Depends(get_session),
+                           user: Token = Depends(check_token),
+                           prefix: Optional[str] = None,
+                           file_id: Annotated[Optional[List[int]], Query()] = None) -> Any:
+    """Downloads several files as a zip archive built while it is being sent.
+
+    Args:
+        database (AsyncSession, optional): database session. Defaults to Depends(get_session);
+        user (Token, optional): user information including username and authentication token.
+            Defaults to Depends(check_token);
+        prefix (str, optional): directory or beginning of filepaths relative to the user`s root.
+            Defaults to None;
+        file_id (List[int], optional): unique identifiers of the files. Defaults to None.
+
+    Raises:
+        HTTPException (422): if neither prefix nor file IDs are provided;
+        HTTPException (404): if no requested files exist;
+        HTTPException (413): if more than app_settings.max_archive_files files are requested.
+
+    Returns:
+        StreamingResponse: zip archive with files named by their paths relative to the user`s root.
+    """
+    if file_id:
+        file_db = await files_crud.read_many_by_ids(database=database, username=user.username,
+                                                    entity_ids=file_id)
+    elif prefix:
+        file_db = await files_crud.read_page_by_username(
+            database=database, username=user.username, limit=app_settings.max_archive_files + 1,
+            prefix=os.path.join(user.username, prefix))
+    else:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                            detail="File IDs or prefix must be provided")
+    if not file_db:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+    if len(file_db) > app_settings.max_archive_files:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                            detail=f'At most {app_settings.max_archive_files} files are allowed')
+    members = [(os.path.relpath(record.filepath, user.username), record.storage_path,
+                record.encoding, record.modified_at) for record in file_db]
+    filename = os.path.basename(os.path.normpath(prefix)) if prefix and not file_id else 'files'
+    return StreamingResponse(stream_zip(members), media_type='application/zip',
+                             headers={'Content-Disposition':
+                                      f'attachment; filename={filename}.zip'})
+
+
+@router.post('/files/upload/presigned', response_model=PresignedUrl)
+async def presign_upload(filepath: Annotated[str, Query(pattern='^[A-Za-z]')],
+                         database: AsyncSession = Depends(get_session),
+                         user: Token = Depends(check_token)) -> Any:
+    """Returns a short-lived URL to upload a file directly into the storage with a PUT request,
+        the upload is registered by POST /files/upload/complete afterwards.
+
+    Args:
+        filepath (str): path to the file in the storage;
+        database (AsyncSession, optional): database session. Defaults to Depends(get_session);
+        user (Token, optional): user information including username and authentication token.
+            Defaults to Depends(check_token).
+
+    Raises:
+        HTTPException (422): if filepath points to a directory or is too long;
+        HTTPException (406): if file with such filepath already exists;
+        HTTPException (413): if the user`s quota is used up;
+        HTTPException (501): if the storage does not support presigned URLs;
+        HTTPException (502): if the storage failed to sign the URL.
+
+    Returns:
+        PresignedUrl: upload URL, path to the file in the storage and URL lifetime in seconds.
+    """
+    if not os.path.basename(filepath):
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                            detail="File path must include a file name")
+    if app_settings.user_quota:
+        # the size of a presigned upload is not known until it is completed
+        check_quota(await read_usage(database=database, username=user.username), 1)
+    filepath = os.path.join(user.username, filepath)
+    check_filepath_length(filepath)
+    if await files_crud.read_one_by_filepath(database=database, username=user.username,
+                                             filepath=filepath) is not None:
+        raise HTTPException(status_code=status.HTTP_406_NOT_ACCEPTABLE,
+                            detail=f"File with filepath '{filepath}' already exists")
     try:
-        file_db = await files_crud.create(database=database,
-                                          obj_in=FileCreate(username=user.username,
-                                                            filepath=filepath))
-        await minio.upload_file(filepath=filepath, content=await file.read())
-        return File(id=file_db.id, filepath=file_db.filepath)
+        url = await storage_client.presigned_upload_url(filepath=filepath)
+    except NotImplementedError as exc:
+        raise HTTPException(status_code=status.HTTP_501_NOT_IMPLEMENTED,
+                            detail=str(exc)) from exc
+    except StorageError as exc:
+        raise HTTPException(status_code=status.HTTP_502_BAD_GATEWAY,
+                            detail=f'Signing failed: {exc}') from exc
+    return PresignedUrl(url=url, filepath=filepath,
+                        expires_in=app_settings.presigned_url_expires)
+
+
+@router.post('/files/upload/complete', status_code=status.HTTP_201_CREATED)
+async def complete_upload(filepath: str,
+                          database: AsyncSession = Depends(get_session),
+                          user: Token = Depends(check_token)) -> Any:
+    """Registers a file uploaded directly into the storage with a presigned URL.
+        A file which does not fit into the user`s quota is removed from the storage.
+
+    Args:
+        filepath (str): path to the file in the storage returned with the presigned URL;
+        database (AsyncSession, optional): database session. Defaults to Depends(get_session);
+        user (Token, optional): user information including username and authentication token.
+            Defaults to Depends(check_token).
+
+    Raises:
+        HTTPException (404): if the file is not in the user`s directory or was not uploaded;
+        HTTPException (422): if the filepath is invalid, the file is removed;
+        HTTPException (406): if file with such filepath already exists;
+        HTTPException (413): if the file does not fit into the user`s quota.
+
+    Returns:
+        File: file information including record id and filepath in the storage.
+    """
+    if not filepath.startswith(os.path.join(user.username, '')):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+    try:
+        stat = await storage_client.stat_file(filepath=filepath)
+    except FileNotFoundError as exc:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                            detail=f"File '{filepath}' was not uploaded") from exc
+    try:
+        file_create = FileCreate(username=user.username, filepath=filepath, size=stat.size)
+    except ValidationError as exc: # e.g. a path too long, uploaded with an URL signed earlier
+        await storage_client.remove_files([filepath])
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                            detail=str(exc)) from exc
+    try:
+        file_db = await files_crud.create(database=database, obj_in=file_create, commit=False)
+        try:
+            check_quota(await usage_crud.add(database=database, username=user.username,
+                                             size=stat.size, files=1))
+        except HTTPException:
+            await database.rollback()
+            await storage_client.remove_files([filepath])
+            raise
+        await database.commit()
     except IntegrityError as exc:
         raise HTTPException(status_code=status.HTTP_406_NOT_ACCEPTABLE,
                             detail=f"File with filepath '{filepath}' already exists") from exc
+    file_cache.invalidate([(user.username, file_db.id, file_db.filepath)])
+    return File(id=file_db.id, filepath=file_db.filepath)
 
 
-@router.get('/files/download', status_code=status.HTTP_200_OK)
-async def download_file(database: AsyncSession = Depends(get_session),
-                        user: Token = Depends(check_token),
-                        filepath: Optional[str] = None,
-                        file_id: Optional[int] = None) -> Any:
-    """Downloads a file.
+@router.get('/files/download/presigned', response_model=PresignedUrl)
+async def presign_download(database: AsyncSession = Depends(get_session),
+                           user: Token = Depends(check_token),
+                           filepath: Optional[str] = None,
+                           file_id: Optional[int] = None,
+                           redirect: bool = False) -> Any:
+    """Returns a short-lived URL to download a file directly from the storage.
 
     Args:
         database (AsyncSession, optional): database session. Defaults to Depends(get_session);
         user (Token, optional): user information including username and authentication token.
             Defaults to Depends(check_token);
         filepath (str, optional): path to the file in the storage. Defaults to None;
-        file_id (int, optional): unique identifier of the file. Defaults to None.
+        file_id (int, optional): unique identifier of the file. Defaults to None;
+        redirect (bool, optional): redirect to the URL instead of returning it.
+            Defaults to False.
 
     Raises:
         HTTPException (422): if both filepath and file ID is not provided;
+        HTTPException (404): if requested file does not exist;
+        HTTPException (501): if the storage does not support presigned URLs;
+        HTTPException (502): if the storage failed to sign the URL.
+
+    Returns:
+        PresignedUrl | RedirectResponse: download URL, path to the file in the storage
+            and URL lifetime in seconds, or a redirect to the URL.
+    """
+    file_db = await read_file(database=database, username=user.username, filepath=filepath,
+                              file_id=file_id)
+    try:
+        url = await storage_client.presigned_download_url(
+            filepath=file_db.storage_path, filename=os.path.basename(file_db.filepath),
+            encoding=file_db.encoding)
+    except NotImplementedError as exc:
+        raise HTTPException(status_code=status.HTTP_501_NOT_IMPLEMENTED,
+                            detail=str(exc)) from exc
+    except StorageError as exc:
+        raise HTTPException(status_code=status.HTTP_502_BAD_GATEWAY,
+                            detail=f'Signing failed: {exc}') from exc
+    if redirect:
+        return RedirectResponse(url, status_code=status.HTTP_302_FOUND)
+    return PresignedUrl(url=url, filepath=file_db.filepath,
+                        expires_in=app_settings.presigned_url_expires)
+
+
+def upload_state(session_db: Any) -> UploadSession:
+    """Returns the state of a resumable upload for a client.
+
+    Args:
+        session_db (Any): database record of the upload.
+
+    Returns:
+        UploadSession: upload identifier, filepath, size, offset and expiration time.
+    """
+    return UploadSession(id=session_db.id, filepath=session_db.filepath, size=session_db.size,
+                         offset=session_db.received, part_size=session_db.part_size,
+                         expires_at=session_db.expires_at)
+
+
+async def read_upload(database: AsyncSession, username: str, upload_id: str) -> Any:
+    """Searches for a resumable upload of a user which has not expired.
+
+    Args:
+        database (AsyncSession): database session;
+        username (str): name of the user;
+        upload_id (str): unique identifier of the upload.
+
+    Raises:
+        HTTPException (404): if the upload does not exist or has expired.
+
+    Returns:
+        Any: database record of the upload.
+    """
+    session_db = await uploads_crud.read_active(database=database, username=username,
+                                                upload_id=upload_id)
+    if session_db is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                            detail=f"Upload '{upload_id}' does not exist or has expired")
+    return session_db
+
+
+async def purge_expired_uploads(database: AsyncSession, username: Optional[str] = None,
+                                limit: int = 100) -> int:
+    """Deletes expired resumable uploads and discards their uploaded parts.
+
+    Args:
+        database (AsyncSession): database session;
+        username (str, optional): purge uploads of this user only. Defaults to None;
+        limit (int, optional): max number of purged uploads. Defaults to 100.
+
+    Returns:
+        int: number of the purged uploads.
+    """
+    expired = await uploads_crud.delete_expired(database=database, limit=limit,
+                                                username=username)
+    await database.commit()
+    for filepath, multipart_id in expired:
+        with suppress(FileNotFoundError):
+            await storage_client.abort_multipart(filepath, multipart_id)
+    return len(expired)
+
+
+@router.post('/files/uploads', response_model=UploadSession,
+             status_code=status.HTTP_201_CREATED)
+async def create_upload(filepath: Annotated[str, Query(pattern='^[A-Za-z]')],
+                        size: Annotated[int, Query(gt=0)],
+                        database: AsyncSession = Depends(get_session),
+                        user: Token = Depends(check_token)) -> Any:
+    """Starts a resumable upload of a file sent in chunks by separate requests.
+
+    Chunks are sent with PUT /files/uploads from the offset of the upload and stored as
+    multipart parts, each finished part is recorded at once. After a failed request
+    the client asks for the offset with GET /files/uploads and resends the content from it,
+    then registers the file with POST /files/uploads/complete. Uploads are discarded
+    app_settings.upload_session_ttl seconds after they last received a part.
+
+    Args:
+        filepath (str): path to the file in the storage;
+        size (int): size of the file in bytes;
+        database (AsyncSession, optional): database session. Defaults to Depends(get_session);
+        user (Token, optional): user information including username and authentication token.
+            Defaults to Depends(check_token).
+
+    Raises:
+        HTTPException (422): if filepath points to a directory or is too long;
+        HTTPException (406): if file with such filepath already exists or is being uploaded;
+        HTTPException (413): if the file does not fit into the user`s quota.
+
+    Returns:
+        UploadSession: upload identifier, filepath, size, offset and expiration time.
+    """
+    if not os.path.basename(filepath):
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                            detail="File path must include a file name")
+    if app_settings.user_quota:
+        check_quota(await read_usage(database=database, username=user.username), size)
+    filepath = os.path.join(user.username, filepath)
+    check_filepath_length(filepath)
+    if await files_crud.read_one_by_filepath(database=database, username=user.username,
+                                             filepath=filepath) is not None:
+        raise HTTPException(status_code=status.HTTP_406_NOT_ACCEPTABLE,
+                            detail=f"File with filepath '{filepath}' already exists")
+    await purge_expired_uploads(database=database, username=user.username)
+    multipart_id = await storage_client.create_multipart(filepath)
+    try:
+        session_db = await uploads_crud.create(
+            database=database,
+            obj_in=UploadSessionCreate(id=uuid.uuid4().hex, username=user.username,
+                                       filepath=filepath, multipart_id=multipart_id, size=size,
+                                       part_size=app_settings.upload_part_size))
+    except IntegrityError as exc:
+        await database.rollback()
+        await storage_client.abort_multipart(filepath, multipart_id)
+        raise HTTPException(status_code=status.HTTP_406_NOT_ACCEPTABLE,
+                            detail=f"File with filepath '{filepath}' is being uploaded") from exc
+    return upload_state(session_db)
+
+
+@router.get('/files/uploads', response_model=UploadSession)
+async def get_upload(upload_id: str,
+                     database: AsyncSession = Depends(get_session),
+                     user: Token = Depends(check_token)) -> Any:
+    """Returns the state of a resumable upload, the offset the next chunk is to be sent from.
+
+    Args:
+        upload_id (str): unique identifier of the upload;
+        database (AsyncSession, optional): database session. Defaults to Depends(get_session);
+        user (Token, optional): user information including username and authentication token.
+            Defaults to Depends(check_token).
+
+    Raises:
+        HTTPException (404): if the upload does not exist or has expired.
+
+    Returns:
+        UploadSession: upload identifier, filepath, size, offset and expiration time.
+    """
+    return upload_state(await read_upload(database=database, username=user.username,
+                                          upload_id=upload_id))
+
+
+@router.put('/files/uploads', response_model=UploadSession)
+async def upload_chunk(request: Request, upload_id: str,
+                       offset: Annotated[int, Query(ge=0)],
+                       database: AsyncSession = Depends(get_session),
+                       user: Token = Depends(check_token)) -> Any:
+    """Stores a chunk of a resumable upload passed as a raw request body.
+
+    The body is cut into parts of the upload part size sent to the storage while the body
+    is still being received, and each part is recorded as soon as it is stored, so
+    an interrupted request keeps its finished parts. The rest of a chunk shorter than a part
+    is stored only if it ends the file, otherwise it is discarded and the returned offset
+    tells the client where to continue from.
+
+    Args:
+        request (Request): request with the chunk as its body;
+        upload_id (str): unique identifier of the upload;
+        offset (int): position of the chunk in the file, must be the offset of the upload;
+        database (AsyncSession, optional): database session. Defaults to Depends(get_session);
+        user (Token, optional): user information including username and authentication token.
+            Defaults to Depends(check_token).
+
+    Raises:
+        HTTPException (404): if the upload does not exist or has expired;
+        HTTPException (409): if offset is not the offset of the upload, or the upload has been
+            advanced by another request meanwhile;
+        HTTPException (413): if the chunk exceeds the declared size of the file.
+
+    Returns:
+        UploadSession: upload identifier, filepath, size, new offset and expiration time.
+    """
+    session_db = await read_upload(database=database, username=user.username,
+                                   upload_id=upload_id)
+    state = upload_state(session_db)
+    multipart_id = session_db.multipart_id
+    await database.commit() # a database connection is not held while the chunk is received
+    if offset != state.offset:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT,
+                            detail=f'Upload offset is {state.offset}')
+    content_length = request.headers.get('content-length', '')
+    if content_length.isdigit() and offset + int(content_length) > state.size:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                            detail=f'Upload size is {state.size} bytes')
+
+    async def store_part(part: bytes) -> None:
+        number = state.offset // state.part_size + 1 # all parts but the last one are whole
+        etag = await storage_client.upload_part(state.filepath, multipart_id, number, part)
+        updated = await uploads_crud.add_part(database=database, upload_id=upload_id,
+                                              number=number, etag=etag, size=len(part),
+                                              received=state.offset)
+        if updated is None:
+            await database.rollback()
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT,
+                                detail='Upload has been advanced by another request')
+        await database.commit()
+        state.offset, state.expires_at = updated
+
+    buffer = bytearray()
+    try:
+        async for chunk in request.stream():
+            if state.offset + len(buffer) + len(chunk) > state.size:
+                raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                                    detail=f'Upload size is {state.size} bytes')
+            buffer.extend(chunk)
+            while len(buffer) >= state.part_size:
+                part = bytes(buffer[:state.part_size])
+                del buffer[:state.part_size]
+                await store_part(part)
+        if buffer and state.offset + len(buffer) == state.size:
+            await store_part(bytes(buffer))
+    except FileNotFoundError as exc: # the upload has been canceled meanwhile
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                            detail=f"Upload '{upload_id}' does not exist") from exc
+    return state
+
+
+@router.post('/files/uploads/complete', status_code=status.HTTP_201_CREATED)
+async def complete_resumable_upload(upload_id: str,
+                                    database: AsyncSession = Depends(get_session),
+                                    user: Token = Depends(check_token)) -> Any:
+    """Joins the parts of a fully received resumable upload and registers the file.
+        A file which does not fit into the user`s quota is removed from the storage.
+
+    Args:
+        upload_id (str): unique identifier of the upload;
+        database (AsyncSession, optional): database session. Defaults to Depends(get_session);
+        user (Token, optional): user information including username and authentication token.
+            Defaults to Depends(check_token).
+
+    Raises:
+        HTTPException (404): if the upload does not exist or has expired;
+        HTTPException (409): if the upload has not received the whole file;
+        HTTPException (406): if file with such filepath has been created meanwhile;
+        HTTPException (413): if the file does not fit into the user`s quota.
+
+    Returns:
+        File: file information including record id and filepath in the storage.
+    """
+    session_db = await read_upload(database=database, username=user.username,
+                                   upload_id=upload_id)
+    filepath, size = session_db.filepath, session_db.size
+    if session_db.received != size:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT,
+                            detail=f'Upload has received {session_db.received} of {size} bytes')
+    parts = await uploads_crud.read_parts(database=database, upload_id=upload_id)
+    multipart_id = session_db.multipart_id
+    await database.commit()
+    try:
+        await storage_client.complete_multipart(filepath, multipart_id, parts)
+    except FileNotFoundError: # completed by a request which failed before the commit
+        if (await storage_client.stat_file(filepath=filepath)).size != size:
+            raise
+    try:
+        file_db = await files_crud.create(database=database,
+                                          obj_in=FileCreate(username=user.username,
+                                                            filepath=filepath, size=size),
+                                          commit=False)
+        try:
+            check_quota(await usage_crud.add(database=database, username=user.username,
+                                             size=size, files=1))
+        except HTTPException:
+            await database.rollback()
+            await uploads_crud.delete_by_id(database=database, upload_id=upload_id)
+            await database.commit()
+            await storage_client.remove_files([filepath])
+            raise
+        await uploads_crud.delete_by_id(database=database, upload_id=upload_id)
+        await database.commit()
+    except IntegrityError as exc:
+        # the content under the filepath is not removed, it may belong to the existing file
+        await database.rollback()
+        await uploads_crud.delete_by_id(database=database, upload_id=upload_id)
+        await database.commit()
+        raise HTTPException(status_code=status.HTTP_406_NOT_ACCEPTABLE,
+                            detail=f"File with filepath '{filepath}' already exists") from exc
+    file_cache.invalidate([(user.username, file_db.id, file_db.filepath)])
+    return File(id=file_db.id, filepath=file_db.filepath)
+
+
+@router.delete('/files/uploads', status_code=status.HTTP_204_NO_CONTENT)
+async def cancel_upload(upload_id: str,
+                        database: AsyncSession = Depends(get_session),
+                        user: Token = Depends(check_token)) -> None:
+    """Cancels a resumable upload and discards its uploaded parts.
+
+    Args:
+        upload_id (str): unique identifier of the upload;
+        database (AsyncSession, optional): database session. Defaults to Depends(get_session);
+        user (Token, optional): user information including username and authentication token.
+            Defaults to Depends(check_token).
+
+    Raises:
+        HTTPException (404): if the upload does not exist or has expired.
+    """
+    session_db = await read_upload(database=database, username=user.username,
+                                   upload_id=upload_id)
+    with suppress(FileNotFoundError):
+        await storage_client.abort_multipart(session_db.filepath, session_db.multipart_id)
+    await uploads_crud.delete_by_id(database=database, upload_id=upload_id)
+    await database.commit()
+
+
+async def resolve_source(database: AsyncSession, username: str, filepath: Optional[str],
+                         file_id: Optional[int],
+                         prefix: Optional[str]) -> Tuple[Optional[str], Optional[str]]:
+    """Resolves files of a user a bulk operation is applied to.
+
+    Args:
+        database (AsyncSession): database session;
+        username (str): name of the user;
+        filepath (str, optional): path to the file in the storage;
+        file_id (int, optional): unique identifier of the file;
+        prefix (str, optional): directory or beginning of filepaths relative to the user`s root.
+
+    Raises:
+        HTTPException (422): if neither file ID, filepath nor prefix is provided;
         HTTPException (404): if requested file does not exist.
 
     Returns:
-        StreamingResponse: requested file.
+        Tuple[Optional[str], Optional[str]]: filepath of the file or filepath prefix
+            of the files in the storage, the other one is None.
     """
-    if filepath:
-        file_db = await files_crud.read_one_by_filepath(database=database, username=user.username,
-                                                        filepath=filepath)
-    elif file_id:
-        file_db = await files_crud.read_one_by_id(database=database, username=user.username,
-                                                  entity_id=file_id)
+    if prefix:
+        return None, os.path.join(username, prefix)
+    if not filepath and not file_id:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                            detail="File ID, file path or prefix must be provided")
+    file_db = await read_file(database=database, username=username, filepath=filepath,
+                              file_id=file_id)
+    return file_db.filepath, None
+
+
+@router.delete('/files', response_model=FileCount)
+async def delete_files(database: AsyncSession = Depends(get_session),
+                       user: Token = Depends(check_token),
+                       filepath: Optional[str] = None,
+                       file_id: Optional[int] = None,
+                       prefix: Optional[str] = None) -> Any:
+    """Deletes a file or all files with a filepath prefix.
+
+    Records of the files are deleted with a single statement in one transaction together with
+    the user`s usage and references to their content. Content left without references is
+    removed from the storage after the commit with batched delete requests.
+
+    Args:
+        database (AsyncSession, optional): database session. Defaults to Depends(get_session);
+        user (Token, optional): user information including username and authentication token.
+            Defaults to Depends(check_token);
+        filepath (str, optional): path to the file in the storage. Defaults to None;
+        file_id (int, optional): unique identifier of the file. Defaults to None;
+        prefix (str, optional): directory or beginning of filepaths relative to the user`s root.
+            Defaults to None.
+
+    Raises:
+        HTTPException (422): if neither file ID, filepath nor prefix is provided;
+        HTTPException (404): if no requested files exist.
+
+    Returns:
+        FileCount: number of the deleted files.
+    """
+    filepath, prefix = await resolve_source(database=database, username=user.username,
+                                            filepath=filepath, file_id=file_id, prefix=prefix)
+    file_db = await files_crud.delete_by_path(database=database, username=user.username,
+                                              filepath=filepath, prefix=prefix)
+    if not file_db:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+    await usage_crud.add(database=database, username=user.username,
+                         size=-sum(record.size or 0 for record in file_db), files=-len(file_db))
+    blob_paths = await blobs_crud.release_many(
+        database=database, digests=[record.digest for record in file_db
+                                    if record.digest is not None])
+    changes = [(user.username, record.id, record.filepath) for record in file_db]
+    await file_cache.notify(database=database, changes=changes)
+    await database.commit()
+    file_cache.invalidate(changes)
+    await storage_client.remove_files(blob_paths + [record.filepath for record in file_db
+                                                  if record.digest is None])
+    return FileCount(files=len(file_db))
+
+
+@router.post('/files/move', response_model=FileCount)
+async def move_files(destination: Annotated[str, Query(pattern='^[A-Za-z]')],
+                     database: AsyncSession = Depends(get_session),
+                     user: Token = Depends(check_token),
+                     filepath: Optional[str] = None,
+                     file_id: Optional[int] = None,
+                     prefix: Optional[str] = None) -> Any:
+    """Moves a file, or all files with a filepath prefix replacing the prefix by destination.
+
+    Records of the files are renamed with a single statement in one transaction. Content
+    shared by files is stored by its digest and is not touched, files stored under their
+    filepaths are copied inside the storage before the commit and removed afterwards.
+
+    Args:
+        destination (str): new path to the file relative to the user`s root, or its directory
+            (ends with '/'), or new prefix of the files;
+        database (AsyncSession, optional): database session. Defaults to Depends(get_session);
+        user (Token, optional): user information including username and authentication token.
+            Defaults to Depends(check_token);
+        filepath (str, optional): path to the file in the storage. Defaults to None;
+        file_id (int, optional): unique identifier of the file. Defaults to None;
+        prefix (str, optional): directory or beginning of filepaths relative to the user`s root.
+            Defaults to None.
+
+    Raises:
+        HTTPException (422): if neither file ID, filepath nor prefix is provided, destination
+            is the file path, overlaps the prefix or new filepaths are too long;
+        HTTPException (404): if no requested files exist;
+        HTTPException (406): if a file with a new filepath already exists;
+        HTTPException (502): if files failed to be copied inside the storage.
+
+    Returns:
+        FileCount: number of the moved files.
+    """
+    filepath, prefix = await resolve_source(database=database, username=user.username,
+                                            filepath=filepath, file_id=file_id, prefix=prefix)
+    if prefix is None:
+        destination = build_filepath(user.username, destination, os.path.basename(filepath))
+        # the content stored under the filepath would be removed after being copied onto itself
+        if destination == filepath:
+            raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                                detail="Destination must differ from the file path")
     else:
+        destination = os.path.join(user.username, destination)
+        # files would be matched by both prefixes while they are renamed
+        if destination.startswith(prefix) or prefix.startswith(destination):
+            raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                                detail="Destination must not overlap the prefix")
+    try:
+        file_db = await files_crud.move_by_path(database=database, username=user.username,
+                                                destination=destination, filepath=filepath,
+                                                prefix=prefix)
+    except IntegrityError as exc:
+        raise HTTPException(status_code=status.HTTP_406_NOT_ACCEPTABLE,
+                            detail="Files with such filepaths already exist") from exc
+    except DataError as exc:
         raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
-                            detail="File ID or file path must be provided")
-    if file_db is None:
+                            detail="File paths are too long") from exc
+    if not file_db:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
-    file = await minio.download_file(filepath=file_db.filepath)
-    return StreamingResponse(file, headers={"Content-Disposition":
-        f"attachment; filename={file_db.filepath.split('/')[-1]}"})
+    sources = {record.id: filepath if prefix is None
+               else prefix + record.filepath[len(destination):] for record in file_db}
+    # a pair with equal paths would have its only copy removed
+    copies = [(sources[record.id], record.filepath) for record in file_db
+              if record.digest is None and sources[record.id] != record.filepath]
+    try:
+        await storage_client.copy_files(copies)
+    except OSError as exc:
+        await database.rollback()
+        await storage_client.remove_files([new_filepath for _, new_filepath in copies])
+        raise HTTPException(status_code=status.HTTP_502_BAD_GATEWAY,
+                            detail=f'Copy failed: {exc}') from exc
+    changes = [change for record in file_db
+               for change in ((user.username, record.id, sources[record.id]),
+                              (user.username, record.id, record.filepath))]
+    await file_cache.notify(database=database, changes=changes)
+    await database.commit()
+    file_cache.invalidate(changes)
+    await storage_client.remove_files([old_filepath for old_filepath, _ in copies])
+    return FileCount(files=len(file_db))
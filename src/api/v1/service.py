@@ -1,78 +1,133 @@
 """Contains service endpoints"""
-import time
-from typing import Dict
+from typing import Any, Dict, Optional, Union
 
-from fastapi import APIRouter, Depends, HTTPException, status
-from miniopy_async.error import MinioException, S3Error
-from sqlalchemy.ext.asyncio import AsyncSession
+from fastapi import APIRouter, Response, status
+from fastapi.responses import PlainTextResponse
 from sqlalchemy.sql import text
 
-from db.db import get_session
-from schemas.service import ServicePing
-from storage.storage import MinioClient
+from api.v1.user import token_cache
+from core.config import app_settings
+from core.health import HealthMonitor
+from core.metrics import PREFIX, render_metrics, render_stats
+from db.db import engine
+from services.file_cache import file_cache
+from services.reconciler import reconciler
+from schemas.service import (CacheStats, DatabasePoolStats, ObjectCacheStats,
+                             ReconciliationStats, ServicePing, StoragePoolStats)
+from storage.cache import object_cache
+from storage.storage import storage_client
 
 
 router = APIRouter()
 
 
-async def ping_database(database: AsyncSession) -> Dict[str, float]:
-    """Checks connection to a database.
+async def ping_database() -> None:
+    """Checks connection to a database"""
+    async with engine.connect() as connection:
+        await connection.execute(text('SELECT 1'))
 
-    Args:
-        database (AsyncSession): the database session.
+
+async def ping_storage() -> None:
+    """Checks connection to the storage.
 
     Raises:
-        HTTPException: if database is unavailable.
+        StorageError: if the storage is not available.
+    """
+    await storage_client.check()
+
+
+health_monitor = HealthMonitor(probes={'db': ping_database, 'storage': ping_storage},
+                               interval=app_settings.health_check_interval,
+                               timeout=app_settings.health_check_timeout)
+
+
+@router.get('/ping', response_model=ServicePing)
+async def ping(response: Response) -> Dict[str, Any]:
+    """Checks the status of additional services. Services are probed concurrently,
+        results are cached for app_settings.health_check_interval seconds.
+
+    Args:
+        response (Response): response, its status is set to 503 if all services are unavailable.
 
     Returns:
-        Dict[str, float]: database ping time in seconds.
+        Dict[str, Any]: overall status and dictionary with ping time in seconds for each service.
     """
-    try:
-        start_time = time.time()
-        await database.execute(text('SELECT 1'))
-        end_time = time.time()
-        return {'db': f'{round((end_time - start_time), 2)}'}
-    except OSError as exc:
-        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-                            detail="Database is unavailable") from exc
+    results = await health_monitor.results()
+    available = [result is not None for result in results.values()]
+    if all(available):
+        service_status = 'ok'
+    elif any(available):
+        service_status = 'degraded'
+    else:
+        service_status = 'unavailable'
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    return {'status': service_status} | results
+
+
+@router.get('/storage/pool', response_model=StoragePoolStats)
+async def storage_pool() -> Dict[str, int]:
+    """Returns statistics of the storage connection pool.
 
+    Returns:
+        Dict[str, int]: pool limits and numbers of connections in use and idle.
+    """
+    return storage_client.pool_stats()
 
-async def ping_storage() -> Dict[str, float]:
-    """Checks connection to a S3 storage.
 
-    Raises:
-        HTTPException: if storage is unavailable.
+@router.get('/database/pool', response_model=DatabasePoolStats)
+async def database_pool() -> Dict[str, Union[int, float]]:
+    """Returns statistics of the database connection pool of the current worker.
 
     Returns:
-        Dict[str, float]: storage ping time in seconds.
+        Dict[str, Union[int, float]]: pool limits, connections usage and checkout latency.
     """
-    try:
-        start_time = time.time()
-        await MinioClient().check_bucket()
-        end_time = time.time()
-        return {'storage': f'{round((end_time - start_time), 2)}'}
-    except (MinioException, S3Error) as exc:
-        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-                            detail="Storage is unavailable") from exc
+    return engine.pool.stats()
 
 
-@router.get('/ping', response_model=ServicePing)
-async def ping(database: AsyncSession = Depends(get_session)) -> Dict[str, float]:
-    """Checks the status of additional services.
+@router.get('/cache', response_model=Dict[str, CacheStats])
+async def cache() -> Dict[str, Dict[str, int]]:
+    """Returns statistics of in-process caches of the current worker.
 
-    Args:
-        database (AsyncSession, optional): the database session. Defaults to Depends(get_session).
+    Returns:
+        Dict[str, Dict[str, int]]: statistics of each cache by its name.
+    """
+    return {'tokens': token_cache.stats(), 'files': file_cache.stats()}
 
-    Raises:
-        HTTPException: if any of the services is unavailable.
+
+@router.get('/cache/objects', response_model=Dict[str, ObjectCacheStats])
+async def object_cache_stats() -> Dict[str, Dict[str, Union[int, float]]]:
+    """Returns statistics of the object cache tiers of the current worker.
+
+    Returns:
+        Dict[str, Dict[str, Union[int, float]]]: statistics of each tier by its name,
+            empty if the object cache is disabled.
+    """
+    return object_cache.stats()
+
+
+@router.get('/reconciliation', response_model=Optional[ReconciliationStats])
+async def reconciliation() -> Optional[Dict[str, Any]]:
+    """Returns statistics of the last reconciliation of file records with the storage
+        run by the current worker.
+
+    Returns:
+        Optional[Dict[str, Any]]: numbers of compared paths and found and repaired mismatches,
+            None if the worker has not reconciled yet.
+    """
+    return reconciler.last_run or None
+
+
+@router.get('/metrics', response_class=PlainTextResponse)
+async def metrics() -> PlainTextResponse:
+    """Returns request metrics and connection pool utilization of the current worker
+        in the Prometheus text format.
 
     Returns:
-        Dict[str, float]: dictionary with ping time in seconds for each service.
+        PlainTextResponse: metrics exposition.
     """
-    try:
-        database_ping_time = await ping_database(database)
-        storage_ping_time = await ping_storage()
-        return database_ping_time | storage_ping_time
-    except HTTPException as exc:
-        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-                            detail=exc.detail) from exc
+    pools = render_stats(f'{PREFIX}_database_pool', 'Database connection pool statistics',
+                         engine.pool.stats()) + \
+        render_stats(f'{PREFIX}_storage_pool', 'Storage connection pool statistics',
+                     storage_client.pool_stats())
+    return PlainTextResponse(render_metrics(pools),
+                             media_type='text/plain; version=0.0.4; charset=utf-8')
@@ -1,36 +1,116 @@
 """Contains API endpoints for user registration and authentication"""
-from typing import Any
+from datetime import datetime, timezone
+from typing import Any, Optional
 
-import bcrypt
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.exc import IntegrityError
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from core.cache import MISSING, TTLCache
+from core.config import app_settings
+from core.metrics import stage_timer
+from core.passwords import HasherBusyError, password_hasher
+from core.tokens import token_signer
 from db.db import get_session
 from schemas.user import Token, TokenCreate, UserCreate
-from services.user import token_crud, users_crud
+from services.revocations import revocation_list
+from services.user import revoked_crud, token_crud, users_crud
+from storage.base import BLOBS_DIRECTORY
 
 
 router = APIRouter()
+# validated tokens, and unknown ones if negative caching is enabled (cached as None)
+token_cache: TTLCache[str, Optional[Token]] = TTLCache(maxsize=app_settings.token_cache_size,
+                                                       ttl=app_settings.token_cache_ttl)
 
 
 async def check_token(token: str, database: AsyncSession = Depends(get_session)) -> None:
     """Checks authorization token of specific user.
 
+    Signed tokens are verified by their signature, expiration and the revocation list without
+    querying the database. Results for tokens stored in the database are cached for
+    app_settings.token_cache_ttl seconds to avoid querying the database on every request.
+
     Args:
         token (str): user`s authorization token;
         database (AsyncSession, optional): database session. Defaults to Depends(get_session).
 
     Raises:
-        HTTPException (401): if authorization token does not exists.
+        HTTPException (401): if authorization token does not exists, is forged, expired
+            or revoked;
+        HTTPException (503): if the revocation list has never been loaded and the database
+            is not available.
 
     Returns:
         Token: authorization info - username and its token.
     """
-    token_db = await token_crud.read_by_token(database=database, token=token)
-    if not token_db:
+    with stage_timer('auth'):
+        if token_signer.is_signed(token):
+            claims = token_signer.verify(token)
+            if claims is not None:
+                try:
+                    await revocation_list.load()
+                except (SQLAlchemyError, OSError) as exc:
+                    # revoked tokens must not be accepted before the list is loaded
+                    raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                                        detail='Revoked tokens are not loaded',
+                                        headers={'Retry-After': '1'}) from exc
+            if claims is None or revocation_list.is_revoked(claims.jti):
+                raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED)
+            return Token(username=claims.username, token=token,
+                         expires_at=datetime.fromtimestamp(claims.expires_at, timezone.utc))
+        cached = token_cache.get(token)
+        if cached is MISSING:
+            token_db = await token_crud.read_by_token(database=database, token=token)
+            if token_db:
+                cached = Token(username=token_db.username, token=token_db.token)
+                token_cache.set(token, cached)
+            else:
+                cached = None
+                if app_settings.token_cache_negative_ttl > 0:
+                    token_cache.set(token, None, ttl=app_settings.token_cache_negative_ttl)
+    if cached is None:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED)
-    return Token(username=token_db.username, token=token_db.token)
+    return cached
+
+
+async def hash_password(password: str) -> str:
+    """Hashes a password in the hashing thread pool.
+
+    Args:
+        password (str): plain password.
+
+    Raises:
+        HTTPException (503): if the hashing thread pool is saturated.
+
+    Returns:
+        str: password hash.
+    """
+    try:
+        return await password_hasher.hash(password)
+    except HasherBusyError as exc:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                            detail=str(exc), headers={'Retry-After': '1'}) from exc
+
+
+async def verify_password(password: str, hashed: str) -> bool:
+    """Checks a password against its hash in the hashing thread pool.
+
+    Args:
+        password (str): plain password;
+        hashed (str): password hash.
+
+    Raises:
+        HTTPException (503): if the hashing thread pool is saturated.
+
+    Returns:
+        bool: True if the password matches the hash.
+    """
+    try:
+        return await password_hasher.verify(password, hashed)
+    except HasherBusyError as exc:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                            detail=str(exc), headers={'Retry-After': '1'}) from exc
 
 
 @router.post("/register", status_code=status.HTTP_201_CREATED)
@@ -42,11 +122,15 @@ async def register_user(user: UserCreate, database: AsyncSession = Depends(get_s
         database (AsyncSession, optional): database session. Defaults to Depends(get_session).
 
     Raises:
-        HTTPException (406): if user with such username already exists.
+        HTTPException (406): if user with such username already exists or it is reserved;
+        HTTPException (503): if the password hashing thread pool is saturated.
     """
+    if user.username == BLOBS_DIRECTORY: # files of the user would share the storage directory
+        raise HTTPException(status_code=status.HTTP_406_NOT_ACCEPTABLE,
+                            detail=f"Username '{user.username}' is reserved")
     try:
         user_create = UserCreate(username=user.username,
-                                 password=bcrypt.hashpw(user.password.encode(), bcrypt.gensalt()))
+                                 password=await hash_password(user.password))
         await users_crud.create(database=database, obj_in=user_create)
     except IntegrityError as exc:
         raise HTTPException(status_code=status.HTTP_406_NOT_ACCEPTABLE,
@@ -55,7 +139,9 @@ async def register_user(user: UserCreate, database: AsyncSession = Depends(get_s
 
 @router.post("/auth", response_model=Token, status_code=status.HTTP_200_OK)
 async def authenticate_user(user: UserCreate, database: AsyncSession = Depends(get_session)) -> Any:
-    """Generates authentication token for a specific user.
+    """Generates authentication token for a specific user. A new signed token is issued
+        by each authentication if app_settings.token_signing_key_id is set, otherwise the token
+        stored in the database is returned.
 
     Args:
         user (UserBase): user data containing username and password;
@@ -63,7 +149,8 @@ async def authenticate_user(user: UserCreate, database: AsyncSession = Depends(g
 
     Raises:
         HTTPException (404): if user with requested username does not exist;
-        HTTPException (401): if password is incorrect.
+        HTTPException (401): if password is incorrect;
+        HTTPException (503): if the password hashing thread pool is saturated.
 
     Returns:
         token data containing user`s username and token.
@@ -72,11 +159,40 @@ async def authenticate_user(user: UserCreate, database: AsyncSession = Depends(g
     if user_db is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
                             detail=f"User with username '{user.username}' not found")
-    if not bcrypt.checkpw(user.password.encode(), user_db.password.encode()):
+    if not await verify_password(user.password, user_db.password):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,
                             detail='Password is incorrect')
+    if token_signer.enabled:
+        token, claims = token_signer.sign(user.username)
+        return Token(username=user.username, token=token,
+                     expires_at=datetime.fromtimestamp(claims.expires_at, timezone.utc))
     token_db = await token_crud.read_by_username(database=database, username=user.username)
     if token_db is None:
         token_db = await token_crud.create(database=database,
                                            obj_in=TokenCreate(username=user.username))
+        # the new token may have been cached as unknown
+        token_cache.invalidate(token_db.token)
     return Token(username=token_db.username, token=token_db.token)
+
+
+@router.delete("/token", status_code=status.HTTP_204_NO_CONTENT)
+async def revoke_token(user: Token = Depends(check_token),
+                       database: AsyncSession = Depends(get_session)) -> None:
+    """Revokes authentication token of a user, a new one is issued by the next authentication.
+        Other application workers may accept the token until their cache entries expire,
+        or until they reload the revocation list if the token is signed.
+
+    Args:
+        user (Token, optional): user information including username and authentication token.
+            Defaults to Depends(check_token);
+        database (AsyncSession, optional): database session. Defaults to Depends(get_session).
+    """
+    if token_signer.is_signed(user.token):
+        claims = token_signer.verify(user.token)
+        if claims is not None: # the token may have expired meanwhile
+            await revoked_crud.revoke(database=database, jti=claims.jti,
+                                      expires_at=user.expires_at)
+            revocation_list.add(claims.jti, claims.expires_at)
+        return
+    await token_crud.delete_by_token(database=database, token=user.token)
+    token_cache.invalidate(user.token)
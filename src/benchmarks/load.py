@@ -0,0 +1,496 @@
+"""Measures latency, throughput and memory use of the main endpoints under concurrent load.
+
+    The application is driven in-process through ASGI, so neither a server nor the network
+    is involved. Files are kept by the local storage backend in a temporary directory standing
+    in for MinIO (--storage minio uses the configured MinIO instead), records are kept in
+    a separate '<database>_bench' database created and dropped by the benchmark.
+
+    The synthetic scenario registers and authenticates a user per concurrent client, then
+    uploads, lists and downloads files of each size at each concurrency level. Sent requests
+    can be written into a JSON lines trace and replayed later, e.g. to compare two commits:
+        python -m benchmarks.load --sizes 1024 1048576 --concurrency 1 16 --requests 200 \\
+            --record trace.jsonl
+        python -m benchmarks.load --replay trace.jsonl --output before.json
+        (check out the other commit)
+        python -m benchmarks.load --replay trace.jsonl --baseline before.json --tolerance 0.2
+
+    Each trace line is a request: {"request_id": "000001", "method": "POST",
+    "path": "/api/v1/files/upload/stream", "params": {"filepath": "bench/a"}, "user": 0,
+    "size": 1024, "offset": 0.5}. The token of the user with the given index is added
+    to the parameters and '{username}' in them is replaced with the name of the user,
+    a random body of the given size is sent and offset is the time in seconds since the trace
+    start the request is sent at. Users are registered and authenticated before the replay.
+
+    Run from the src directory. The exit code is 1 if p95 latency of any endpoint exceeds
+    the baseline by more than the tolerance.
+"""
+import argparse
+import asyncio
+from contextlib import suppress
+from dataclasses import asdict, dataclass, field
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional, Tuple
+import uuid
+
+from fastapi import FastAPI
+from httpx import AsyncClient
+from sqlalchemy import text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+
+PASSWORD = 'bench_password'
+RSS_SAMPLE_INTERVAL = 0.005 # seconds between memory samples
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+
+@dataclass
+class TraceRequest:
+    """Request sent by the benchmark, a line of a trace.
+
+    Args:
+        request_id (str): number of the request in the trace;
+        method (str): HTTP method;
+        path (str): URL path;
+        params (Dict[str, Any]): query parameters except the token;
+        user (int): index of the user sending the request;
+        size (int): size of the random request body, 0 for no body;
+        offset (float): seconds since the trace start the request is sent at.
+    """
+    request_id: str
+    method: str
+    path: str
+    params: Dict[str, Any] = field(default_factory=dict)
+    user: int = 0
+    size: int = 0
+    offset: float = 0.
+
+
+def current_rss() -> int:
+    """Returns resident memory of the process in bytes, its peak if the current value
+        is not available (outside Linux).
+
+    Returns:
+        int: resident set size in bytes.
+    """
+    try:
+        with open('/proc/self/statm', 'rb') as statm:
+            return int(statm.read().split()[1]) * PAGE_SIZE
+    except OSError:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class RssSampler:
+    """Samples resident memory in background while the context manager is active"""
+    def __init__(self) -> None:
+        self.peak = 0
+        self._task: Optional[asyncio.Task] = None
+
+    async def _sample(self) -> None:
+        while True:
+            self.peak = max(self.peak, current_rss())
+            await asyncio.sleep(RSS_SAMPLE_INTERVAL)
+
+    async def __aenter__(self) -> 'RssSampler':
+        self.peak = current_rss()
+        self._task = asyncio.create_task(self._sample())
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        self._task.cancel()
+        with suppress(asyncio.CancelledError):
+            await self._task
+        self._task = None
+        self.peak = max(self.peak, current_rss())
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    """Returns a percentile of values by the nearest-rank method.
+
+    Args:
+        values (List[float]): sorted values;
+        fraction (float): percentile as a fraction, e.g. 0.95.
+
+    Returns:
+        float: the percentile, 0 for no values.
+    """
+    if not values:
+        return 0.
+    return values[min(len(values) - 1, max(0, int(fraction * len(values) + 0.5) - 1))]
+
+
+def summarize(endpoint: str, size: Optional[int], concurrency: Optional[int],
+              latencies: List[float], errors: int, elapsed: float,
+              peak_rss: int) -> Dict[str, Any]:
+    """Returns statistics of requests to an endpoint.
+
+    Args:
+        endpoint (str): method and path of the endpoint;
+        size (int, optional): file size in bytes;
+        concurrency (int, optional): number of concurrent clients;
+        latencies (List[float]): seconds each request took;
+        errors (int): number of failed requests;
+        elapsed (float): seconds all the requests took;
+        peak_rss (int): peak resident memory in bytes while the requests were made.
+
+    Returns:
+        Dict[str, Any]: numbers of requests and errors, p50/p95/p99 latency in milliseconds,
+            requests per second and peak resident memory in MiB.
+    """
+    latencies = sorted(latencies)
+    return {'endpoint': endpoint, 'size': size, 'concurrency': concurrency,
+            'requests': len(latencies), 'errors': errors,
+            'p50_ms': percentile(latencies, 0.50) * 1000,
+            'p95_ms': percentile(latencies, 0.95) * 1000,
+            'p99_ms': percentile(latencies, 0.99) * 1000,
+            'rps': len(latencies) / elapsed if elapsed else 0.,
+            'peak_rss_mib': peak_rss / 2 ** 20}
+
+
+class LoadBenchmark:
+    """Sends requests to the application and collects their latencies.
+
+    Args:
+        app (FastAPI): the application;
+        client (AsyncClient): client of the application;
+        record (bool): keep sent requests for a trace.
+    """
+    def __init__(self, app: FastAPI, client: AsyncClient, record: bool = False) -> None:
+        self.app = app
+        self.client = client
+        self.record = record
+        self.trace: List[TraceRequest] = []
+        self.tokens: Dict[int, str] = {}
+        self.results: List[Dict[str, Any]] = []
+        self._run_id = uuid.uuid4().hex[:6]
+        self._started_at = time.perf_counter()
+
+    def username(self, user: int) -> str:
+        """Returns the name of a user unique for the run.
+
+        Args:
+            user (int): index of the user.
+
+        Returns:
+            str: username.
+        """
+        return f'b{self._run_id}{user}'
+
+    async def send(self, request: TraceRequest) -> Tuple[float, bool]:
+        """Sends a request, its body is generated before the time is measured.
+
+        Args:
+            request (TraceRequest): the request.
+
+        Returns:
+            Tuple[float, bool]: seconds the request took and whether it succeeded.
+        """
+        username = self.username(request.user)
+        params = {name: value.replace('{username}', username) if isinstance(value, str)
+                  else value for name, value in request.params.items()}
+        kwargs: Dict[str, Any] = {'params': params}
+        if request.path.endswith(('/register', '/auth')):
+            kwargs['json'] = {'username': username, 'password': PASSWORD}
+        else:
+            kwargs['params'] = params | {'token': self.tokens[request.user]}
+        if request.size:
+            kwargs['content'] = os.urandom(request.size)
+        if self.record:
+            request.request_id = f'{len(self.trace) + 1:06d}'
+            request.offset = time.perf_counter() - self._started_at
+            self.trace.append(request)
+        start_time = time.perf_counter()
+        response = await self.client.request(request.method, request.path, **kwargs)
+        latency = time.perf_counter() - start_time
+        if request.path.endswith('/auth') and response.is_success:
+            self.tokens[request.user] = response.json()['token']
+        return latency, response.is_success
+
+    async def run_phase(self, endpoint: str, requests: List[TraceRequest], concurrency: int,
+                        size: Optional[int] = None) -> Dict[str, Any]:
+        """Sends requests by concurrent clients, each sends its next request when
+            the previous one is finished.
+
+        Args:
+            endpoint (str): name of the measured endpoint;
+            requests (List[TraceRequest]): requests in the order they are sent;
+            concurrency (int): number of concurrent clients;
+            size (int, optional): file size in bytes. Defaults to None.
+
+        Returns:
+            Dict[str, Any]: statistics of the requests.
+        """
+        pending = iter(requests)
+        latencies: List[float] = []
+        errors = 0
+
+        async def worker() -> None:
+            nonlocal errors
+            for request in pending:
+                latency, success = await self.send(request)
+                latencies.append(latency)
+                errors += not success
+
+        async with RssSampler() as sampler:
+            start_time = time.perf_counter()
+            await asyncio.gather(*[worker() for _ in range(concurrency)])
+            elapsed = time.perf_counter() - start_time
+        result = summarize(endpoint, size, concurrency, latencies, errors, elapsed,
+                           sampler.peak)
+        self.results.append(result)
+        print_result(result)
+        return result
+
+    def new_request(self, method: str, path: str, user: int, size: int = 0,
+                    **params: Any) -> TraceRequest:
+        """Creates a request, it is numbered when it is sent"""
+        return TraceRequest(request_id='', method=method, path=path, params=params, user=user,
+                            size=size)
+
+    async def login(self, users: List[int], concurrency: int, measure: bool) -> None:
+        """Registers and authenticates users.
+
+        Args:
+            users (List[int]): indexes of the users;
+            concurrency (int): number of concurrent clients;
+            measure (bool): report the requests as benchmark phases.
+        """
+        record, self.record = self.record, False # the trace replay logs users in by itself
+        try:
+            for endpoint in ('register_user', 'authenticate_user'):
+                path = self.app.url_path_for(endpoint)
+                requests = [self.new_request('POST', path, user) for user in users]
+                if measure:
+                    await self.run_phase(f'POST {path}', requests, concurrency)
+                else:
+                    await asyncio.gather(*[self.send(request) for request in requests])
+        finally:
+            self.record = record
+
+    async def run_synthetic(self, sizes: List[int], levels: List[int],
+                            requests: int) -> None:
+        """Uploads, lists and downloads files of each size at each concurrency level.
+
+        Args:
+            sizes (List[int]): file sizes in bytes;
+            levels (List[int]): numbers of concurrent clients;
+            requests (int): number of requests to each endpoint per size and level.
+        """
+        upload = self.app.url_path_for('upload_file_stream')
+        listing = self.app.url_path_for('get_files')
+        download = self.app.url_path_for('download_file')
+        for concurrency in levels:
+            users = [user for user in range(concurrency) if user not in self.tokens]
+            await self.login(users, concurrency, measure=True)
+            for size in sizes:
+                uploads = [self.new_request('POST', upload, number % concurrency, size,
+                                            filepath=f'bench/{size}/{concurrency}/{number}')
+                           for number in range(requests)]
+                await self.run_phase(f'POST {upload}', uploads, concurrency, size)
+                await self.run_phase(f'GET {listing}', [
+                    self.new_request('GET', listing, number % concurrency,
+                                     prefix=f'bench/{size}/{concurrency}/')
+                    for number in range(requests)], concurrency, size)
+                await self.run_phase(f'GET {download}', [
+                    self.new_request('GET', download, request.user,
+                                     filepath=f'{{username}}/{request.params["filepath"]}')
+                    for request in uploads], concurrency, size)
+
+    async def replay(self, trace: List[TraceRequest], concurrency: int, speed: float) -> None:
+        """Replays a recorded trace, requests are grouped by endpoint in the report.
+
+        Args:
+            trace (List[TraceRequest]): requests in the order they were sent;
+            concurrency (int): max number of requests in flight;
+            speed (float): replay speed relative to the recording, 0 sends requests of each
+                user one by one as fast as possible.
+        """
+        await self.login(sorted({request.user for request in trace}), concurrency,
+                         measure=False)
+        semaphore = asyncio.Semaphore(concurrency)
+        latencies: Dict[str, List[float]] = {}
+        errors: Dict[str, int] = {}
+
+        async def send(request: TraceRequest) -> None:
+            async with semaphore:
+                latency, success = await self.send(request)
+            endpoint = f'{request.method} {request.path}'
+            latencies.setdefault(endpoint, []).append(latency)
+            errors[endpoint] = errors.get(endpoint, 0) + (not success)
+
+        async def send_at_offsets() -> None:
+            tasks = []
+            for request in trace:
+                delay = request.offset / speed - (time.perf_counter() - start_time)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                tasks.append(asyncio.create_task(send(request)))
+            await asyncio.gather(*tasks)
+
+        async def send_by_user(user: int) -> None:
+            # requests of a user are sent one by one, so e.g. a file is downloaded
+            # after its upload is finished
+            for request in trace:
+                if request.user == user:
+                    await send(request)
+
+        async with RssSampler() as sampler:
+            start_time = time.perf_counter()
+            if speed:
+                await send_at_offsets()
+            else:
+                await asyncio.gather(*[send_by_user(user) for user in self.tokens])
+            elapsed = time.perf_counter() - start_time
+        for endpoint, values in latencies.items():
+            result = summarize(endpoint, None, concurrency, values, errors[endpoint], elapsed,
+                               sampler.peak)
+            self.results.append(result)
+            print_result(result)
+
+
+def print_result(result: Dict[str, Any]) -> None:
+    """Prints a line of the report"""
+    size = '-' if result['size'] is None else result['size']
+    print(f"{result['endpoint']:<44} {size:>10} {result['concurrency'] or '-':>4} "
+          f"{result['requests']:>6} {result['errors']:>5} {result['p50_ms']:>9.2f} "
+          f"{result['p95_ms']:>9.2f} {result['p99_ms']:>9.2f} {result['rps']:>9.1f} "
+          f"{result['peak_rss_mib']:>8.1f}", flush=True)
+
+
+def compare(results: List[Dict[str, Any]], baseline: List[Dict[str, Any]],
+            tolerance: float) -> List[str]:
+    """Finds endpoints slower than in the baseline.
+
+    Args:
+        results (List[Dict[str, Any]]): statistics of the run;
+        baseline (List[Dict[str, Any]]): statistics of the baseline run;
+        tolerance (float): allowed relative increase of p95 latency.
+
+    Returns:
+        List[str]: descriptions of the regressions.
+    """
+    def key(result: Dict[str, Any]) -> Tuple[str, Optional[int], Optional[int]]:
+        return result['endpoint'], result['size'], result['concurrency']
+
+    previous = {key(result): result for result in baseline}
+    regressions = []
+    for result in results:
+        before = previous.get(key(result))
+        if before is not None and result['p95_ms'] > before['p95_ms'] * (1 + tolerance):
+            regressions.append(f"{result['endpoint']} size={result['size']} "
+                               f"concurrency={result['concurrency']}: p95 "
+                               f"{before['p95_ms']:.2f} -> {result['p95_ms']:.2f} ms")
+    return regressions
+
+
+async def create_database(engine: AsyncEngine, name: str) -> None:
+    """Creates an empty database.
+
+    Args:
+        engine (AsyncEngine): engine connected to another database in AUTOCOMMIT mode;
+        name (str): name of the database.
+    """
+    async with engine.connect() as conn:
+        await conn.execute(text(f'DROP DATABASE IF EXISTS "{name}" WITH (FORCE)'))
+        await conn.execute(text(f'CREATE DATABASE "{name}"'))
+
+
+async def main(args: argparse.Namespace) -> int:
+    """Prepares the database and the storage, runs the benchmark and reports the results.
+
+    Args:
+        args (argparse.Namespace): command line arguments.
+
+    Returns:
+        int: exit code, 1 if there are regressions against the baseline.
+    """
+    # the storage backend is selected by the settings read when the application is imported
+    from core.config import app_settings # pylint: disable=import-outside-toplevel
+    from db.db import get_session # pylint: disable=import-outside-toplevel
+    from main import app # pylint: disable=import-outside-toplevel
+    from models.base import Base # pylint: disable=import-outside-toplevel
+    from services.file_storage import blobs_crud # pylint: disable=import-outside-toplevel
+    from storage.storage import storage_client # pylint: disable=import-outside-toplevel
+
+    database_url = make_url(f'{app_settings.database_dsn}_bench')
+    admin_engine = create_async_engine(database_url.set(database='postgres'),
+                                       isolation_level='AUTOCOMMIT')
+    await create_database(admin_engine, database_url.database)
+    engine = create_async_engine(database_url, pool_size=max(args.concurrency),
+                                 max_overflow=0)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    bench_session = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+    async def override_get_session() -> AsyncSession:
+        async with bench_session() as session:
+            yield session
+
+    app.dependency_overrides[get_session] = override_get_session
+    print(f"{'endpoint':<44} {'size':>10} {'conc':>4} {'reqs':>6} {'errs':>5} "
+          f"{'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'rps':>9} {'rss MiB':>8}")
+    try:
+        async with AsyncClient(app=app, base_url='http://benchmark', timeout=None) as client:
+            benchmark = LoadBenchmark(app, client, record=args.record is not None)
+            if args.replay:
+                with open(args.replay, encoding='utf-8') as trace_file:
+                    trace = [TraceRequest(**json.loads(line)) for line in trace_file
+                             if line.strip()]
+                await benchmark.replay(trace, max(args.concurrency), args.speed)
+            else:
+                await benchmark.run_synthetic(args.sizes, args.concurrency, args.requests)
+        if args.record:
+            with open(args.record, 'w', encoding='utf-8') as trace_file:
+                for request in benchmark.trace:
+                    trace_file.write(json.dumps(asdict(request)) + '\n')
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as output:
+                json.dump(benchmark.results, output, indent=2)
+    finally:
+        if app_settings.storage_backend != 'local': # stored content is not in the test directory
+            async with bench_session() as database:
+                paths = await blobs_crud.read_stored_paths(database=database, after=None,
+                                                           limit=sys.maxsize)
+            await storage_client.remove_files(paths)
+        await storage_client.close()
+        await engine.dispose()
+        async with admin_engine.connect() as conn:
+            await conn.execute(text(f'DROP DATABASE "{database_url.database}" WITH (FORCE)'))
+        await admin_engine.dispose()
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as baseline:
+            regressions = compare(benchmark.results, json.load(baseline), args.tolerance)
+        for regression in regressions:
+            print(f'REGRESSION {regression}')
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--storage', choices=['local', 'minio'], default='local')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1024, 1024 ** 2])
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 16])
+    parser.add_argument('--requests', type=int, default=200,
+                        help='requests to each endpoint per size and concurrency level')
+    parser.add_argument('--replay', help='trace to replay instead of the synthetic scenario')
+    parser.add_argument('--speed', type=float, default=0.,
+                        help='replay speed relative to the recording, 0 for no delays')
+    parser.add_argument('--record', help='file the sent requests are written into')
+    parser.add_argument('--output', help='file the results are written into as JSON')
+    parser.add_argument('--baseline', help='results of a previous run to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='allowed relative increase of p95 latency')
+    arguments = parser.parse_args()
+    with tempfile.TemporaryDirectory(prefix='file_storage_bench_') as storage_path:
+        os.environ['STORAGE_BACKEND'] = arguments.storage
+        os.environ['STORAGE_LOCAL_PATH'] = storage_path
+        sys.exit(asyncio.run(main(arguments)))
@@ -0,0 +1,84 @@
+"""Compares query plans of the files repository queries before and after adding
+    the per-user indexes of the 'files' table.
+
+    A temporary copy of the table is filled with generated rows, so the benchmark does not
+    touch application data. Run from the src directory:
+        python -m benchmarks.query_plans --rows 1000000 --users 1000
+"""
+import argparse
+import asyncio
+from typing import Dict
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection, create_async_engine
+
+from core.config import app_settings
+
+
+SETUP = [
+    """CREATE TEMPORARY TABLE bench_files (
+           id SERIAL PRIMARY KEY,
+           username VARCHAR(16) NOT NULL,
+           filepath VARCHAR(256) NOT NULL UNIQUE)""",
+    """INSERT INTO bench_files (username, filepath)
+       SELECT 'user' || (n % :users), 'user' || (n % :users) || '/dir' || (n % 50) || '/file' || n
+       FROM generate_series(1, :rows) AS n""",
+]
+INDEXES = [
+    'CREATE INDEX ix_bench_files_username_id ON bench_files (username, id)',
+    """CREATE INDEX ix_bench_files_username_filepath
+       ON bench_files (username, filepath text_pattern_ops)""",
+]
+QUERIES: Dict[str, str] = {
+    'read_page_by_username': """SELECT * FROM bench_files WHERE username = 'user7' AND id > 1000
+                                ORDER BY id LIMIT 101""",
+    'read_page_by_username with prefix': """SELECT * FROM bench_files
+                                             WHERE username = 'user7'
+                                             AND filepath LIKE 'user7/dir7/%'
+                                             ORDER BY id LIMIT 101""",
+    'read_many_by_username': "SELECT * FROM bench_files WHERE username = 'user7'",
+    'read_one_by_id': "SELECT * FROM bench_files WHERE id = 4007 AND username = 'user7'",
+}
+
+
+async def explain(conn: AsyncConnection, title: str) -> None:
+    """Prints execution plans of the benchmarked queries.
+
+    Args:
+        conn (AsyncConnection): database connection;
+        title (str): name of the printed section.
+    """
+    await conn.execute(text('ANALYZE bench_files'))
+    print(f'===== {title} =====')
+    for name, query in QUERIES.items():
+        result = await conn.execute(text(f'EXPLAIN (ANALYZE, BUFFERS) {query}'))
+        print(f'--- {name}')
+        for row in result:
+            print(row[0])
+
+
+async def main(rows: int, users: int) -> None:
+    """Fills the temporary table and prints query plans without and with the indexes.
+
+    Args:
+        rows (int): number of generated files;
+        users (int): number of users the files are spread across.
+    """
+    engine = create_async_engine(app_settings.database_dsn.unicode_string())
+    async with engine.connect() as conn:
+        await conn.execute(text(SETUP[0]))
+        await conn.execute(text(SETUP[1]), {'rows': rows, 'users': users})
+        await explain(conn, 'before')
+        for statement in INDEXES:
+            await conn.execute(text(statement))
+        await explain(conn, 'after')
+        await conn.rollback()
+    await engine.dispose()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--users', type=int, default=1000)
+    args = parser.parse_args()
+    asyncio.run(main(rows=args.rows, users=args.users))
@@ -0,0 +1,87 @@
+"""In-process caches"""
+from collections import OrderedDict
+import time
+from typing import Any, Dict, Generic, Hashable, Optional, Tuple, TypeVar
+
+
+KeyT = TypeVar('KeyT', bound=Hashable)
+ValueT = TypeVar('ValueT')
+MISSING = object() # returned by TTLCache.get for absent keys by default
+
+
+class TTLCache(Generic[KeyT, ValueT]):
+    """Bounded cache evicting the least recently used entries, each entry expires after its TTL.
+
+    Args:
+        maxsize (int): max number of entries;
+        ttl (float): default entry lifetime in seconds.
+    """
+    def __init__(self, maxsize: int, ttl: float) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict[KeyT, Tuple[float, ValueT]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: KeyT, default: Any = MISSING) -> Any:
+        """Returns a cached value and marks it as recently used.
+
+        Args:
+            key (KeyT): entry key;
+            default (Any, optional): value returned if the key is absent or expired.
+                Defaults to MISSING.
+
+        Returns:
+            Any: cached value or default.
+        """
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: KeyT, value: ValueT, ttl: Optional[float] = None) -> None:
+        """Caches a value, evicting the least recently used entry if the cache is full.
+
+        Args:
+            key (KeyT): entry key;
+            value (ValueT): cached value;
+            ttl (float, optional): entry lifetime in seconds. Defaults to self.ttl.
+        """
+        if self.maxsize <= 0:
+            return
+        self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def invalidate(self, key: KeyT) -> None:
+        """Removes an entry from the cache.
+
+        Args:
+            key (KeyT): entry key.
+        """
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        """Removes all entries from the cache"""
+        self._data.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """Returns cache statistics.
+
+        Returns:
+            Dict[str, int]: number of entries, max number of entries, hits and misses.
+        """
+        return {'size': len(self._data), 'maxsize': self.maxsize,
+                'hits': self.hits, 'misses': self.misses}
@@ -1,5 +1,7 @@
 """App configuration"""
-from pydantic import PostgresDsn
+from typing import Dict, Literal, Optional
+
+from pydantic import model_validator, PostgresDsn
 from pydantic_settings import BaseSettings
 
 
@@ -7,11 +9,87 @@ class AppSettings(BaseSettings):
     """Contains application settings"""
     app_title: str = 'URL Shortener'
     database_dsn: PostgresDsn
-    database_echo: bool = True
+    database_echo: bool = False # logs every statement, use for debugging only
+    database_pool_size: int = 5 # connections kept open by each worker
+    database_max_overflow: int = 10 # connections opened over pool size under load
+    database_pool_timeout: float = 30. # seconds to wait for a free connection
+    database_pool_recycle: int = 1800 # seconds after which a connection is reopened
+    database_pool_pre_ping: bool = True # checks connections before handing them out
+    database_statement_timeout: int = 30000 # milliseconds, 0 disables the timeout
+    database_statement_cache_size: int = 100 # asyncpg prepared statements per connection
     max_username_length: int = 16
     max_filepath_length: int = 256
     max_token_length: int = 36 # token length of uuid4
     max_password_length: int = 72 # max bcrypt password hash length
+    upload_part_size: int = 5 * 1024 * 1024 # min S3 multipart part size is 5 MiB
+    upload_chunk_size: int = 64 * 1024 # size of chunks read from an uploaded file
+    download_chunk_size: int = 64 * 1024 # size of chunks relayed from the storage
+    storage_backend: Literal['minio', 'local'] = 'minio'
+    storage_local_path: str = '/var/lib/file_storage' # root directory of the local backend
+    storage_local_threads: int = 8 # threads doing file I/O of the local backend
+    storage_local_write_size: int = 1024 * 1024 # bytes buffered before being written to a file
+    minio_host: str = 'minio'
+    minio_port: int = 9000
+    minio_root_user: str = '' # required for the minio backend
+    minio_root_password: str = '' # required for the minio backend
+    minio_bucket_name: str = '' # required for the minio backend
+    storage_pool_size: int = 100 # max number of simultaneous connections to the storage
+    storage_pool_size_per_host: int = 0 # 0 means no limit per host
+    storage_keepalive_timeout: float = 30. # seconds an idle connection is kept open
+    storage_public_url: Optional[str] = None # storage URL for clients, e.g. http://localhost:9000
+    storage_region: str = 'us-east-1'
+    storage_copy_concurrency: int = 16 # max number of files copied inside the storage at once
+    presigned_url_expires: int = 300 # seconds a presigned URL is valid
+    upload_session_ttl: int = 24 * 3600 # seconds an idle resumable upload is kept
+    upload_compression: bool = False # stores compressible uploads compressed with zstd
+    compression_level: int = 3 # zstd level, higher levels are slower
+    compression_sample_size: int = 64 * 1024 # bytes checked for compressibility
+    compression_min_ratio: float = 0.9 # content is stored as is if the sample shrinks less
+    object_cache_max_object_size: int = 1024 * 1024 # larger objects are not cached, 0 disables
+    object_cache_memory_size: int = 64 * 1024 * 1024 # bytes, 0 disables the memory tier
+    object_cache_disk_size: int = 1024 * 1024 * 1024 # bytes, 0 disables the disk tier
+    object_cache_disk_path: Optional[str] = None # directory of the disk tier, None disables it
+    metrics_enabled: bool = True # collects request metrics exposed by /service/metrics
+    health_check_interval: float = 5. # seconds service probe results are cached for
+    health_check_timeout: float = 2. # seconds a service probe may take
+    token_cache_size: int = 10000 # 0 disables the token cache
+    token_cache_ttl: float = 60. # seconds a validated token is trusted without the database
+    token_cache_negative_ttl: float = 0. # seconds an unknown token is cached, 0 disables it
+    token_signing_keys: Dict[str, str] = {} # secrets by key id verifying signed tokens, as JSON
+    token_signing_key_id: str = '' # key signing new tokens, empty issues database tokens
+    signed_token_ttl: int = 24 * 3600 # seconds a signed token is valid
+    token_revocation_refresh: float = 10. # seconds between reloads of revoked signed tokens
+    file_cache_size: int = 10000 # file metadata entries, two per file, 0 disables the cache
+    file_cache_ttl: float = 30. # seconds file metadata is trusted without the database
+    file_cache_listen: bool = False # invalidates entries deleted by other workers via Postgres
+    user_quota: int = 0 # max total size of files of a user in bytes, 0 disables quotas
+    reconcile_interval: float = 0. # seconds between reconciliations with the storage, 0 disables
+    reconcile_batch_size: int = 1000 # paths compared per batch
+    reconcile_batch_delay: float = 1. # seconds between batches, limits the reconciliation load
+    reconcile_grace_period: float = 3600. # seconds an object may exist without a record
+    reconcile_repair: bool = False # removes orphans and records of missing objects, or reports
+    max_batch_files: int = 1000 # max number of files uploaded in one request
+    batch_upload_concurrency: int = 8 # max number of files uploaded to the storage at once
+    max_archive_files: int = 10000 # max number of files downloaded as one archive
+    archive_read_ahead: int = 4 # number of files downloaded ahead of the one being archived
+    archive_queue_size: int = 16 # max number of chunks buffered for each downloaded file
+    files_page_size: int = 100 # default number of files in a page of the listing
+    max_files_page_size: int = 1000
+    bcrypt_rounds: int = 12 # bcrypt cost factor, each increment doubles hashing time
+    password_hash_workers: int = 2 # threads hashing and verifying passwords
+    password_hash_queue_size: int = 16 # max number of operations waiting for a free thread
+
+    @model_validator(mode='after')
+    def check_storage_credentials(self) -> 'AppSettings':
+        """Requires MinIO credentials and bucket for the MinIO backend, so a misconfigured
+            deployment fails on startup and not on the first storage request"""
+        if self.storage_backend == 'minio':
+            missing = [name for name in ('minio_root_user', 'minio_root_password',
+                                         'minio_bucket_name') if not getattr(self, name)]
+            if missing:
+                raise ValueError(f"{', '.join(missing).upper()} must be set "
+                                 f"for the minio storage backend")
+        return self
 
     class Config:
         """Application environment variables"""
@@ -19,4 +97,3 @@ class AppSettings(BaseSettings):
 
 
 app_settings = AppSettings()
- 
\ No newline at end of file
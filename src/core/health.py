@@ -0,0 +1,101 @@
+"""Health monitoring of related services"""
+import asyncio
+from contextlib import suppress
+import logging
+import time
+from typing import Awaitable, Callable, Dict, Optional
+
+
+logger = logging.getLogger(__name__)
+
+
+class HealthMonitor:
+    """Probes related services concurrently and caches the results.
+
+    Results are refreshed by a background task every interval seconds and returned without
+    waiting while it is running. Without the background task they are refreshed on demand
+    when they are older than the interval.
+
+    Args:
+        probes (Dict[str, Callable[[], Awaitable[None]]]): coroutine functions raising
+            an exception if a service is unavailable, by service name;
+        interval (float): seconds the results are cached for;
+        timeout (float): seconds each probe may take before the service is considered unavailable.
+    """
+    def __init__(self, probes: Dict[str, Callable[[], Awaitable[None]]],
+                 interval: float, timeout: float) -> None:
+        self.probes = probes
+        self.interval = interval
+        self.timeout = timeout
+        self._results: Dict[str, Optional[float]] = {}
+        self._updated_at: Optional[float] = None
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    async def _probe(self, name: str, probe: Callable[[], Awaitable[None]]) -> Optional[float]:
+        """Runs a probe.
+
+        Args:
+            name (str): service name;
+            probe (Callable[[], Awaitable[None]]): probe coroutine function.
+
+        Returns:
+            Optional[float]: probe time in seconds, None if the service is unavailable.
+        """
+        start_time = time.perf_counter()
+        try:
+            await asyncio.wait_for(probe(), timeout=self.timeout)
+        except Exception: # pylint: disable=broad-except
+            logger.warning('Service %s is unavailable', name, exc_info=True)
+            return None
+        return round(time.perf_counter() - start_time, 4)
+
+    async def refresh(self) -> Dict[str, Optional[float]]:
+        """Runs all probes concurrently and caches the results.
+
+        Returns:
+            Dict[str, Optional[float]]: probe time in seconds by service name,
+                None for unavailable services.
+        """
+        results = await asyncio.gather(*[self._probe(name, probe)
+                                         for name, probe in self.probes.items()])
+        self._results = dict(zip(self.probes, results))
+        self._updated_at = time.monotonic()
+        return self._results
+
+    async def results(self) -> Dict[str, Optional[float]]:
+        """Returns cached probe results, refreshing them if they are outdated and
+            the background task is not running.
+
+        Returns:
+            Dict[str, Optional[float]]: probe time in seconds by service name,
+                None for unavailable services.
+        """
+        running = self._task is not None and not self._task.done()
+        if running and self._updated_at is not None:
+            return self._results # kept fresh by the background task
+        async with self._lock: # concurrent requests wait for a single refresh
+            if self._updated_at is None or (
+                    not running and time.monotonic() - self._updated_at > self.interval):
+                await self.refresh()
+            return self._results
+
+    async def _run(self) -> None:
+        """Refreshes the results periodically"""
+        while True:
+            async with self._lock:
+                await self.refresh()
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> None:
+        """Starts refreshing the results in background"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stops refreshing the results in background"""
+        if self._task is not None:
+            self._task.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
@@ -0,0 +1,282 @@
+"""Request metrics exposed in the Prometheus text format"""
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+import time
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+from starlette.routing import Match
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from core.config import app_settings
+
+
+PREFIX = 'file_storage'
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1., 2.5, 5., 10.)
+UNMATCHED_ROUTE = 'unmatched' # requests to unknown paths share a label
+
+# seconds spent in each stage by the current request, None outside requests
+_stages: ContextVar[Optional[Dict[str, float]]] = ContextVar('stages', default=None)
+
+
+def escape(value: str) -> str:
+    """Escapes a label value or help text for the text format"""
+    return value.replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    """Formats label pairs, e.g. {method="GET",route="/files"}"""
+    if not names:
+        return ''
+    pairs = ','.join(f'{name}="{escape(value)}"' for name, value in zip(names, values))
+    return f'{{{pairs}}}'
+
+
+class Metric:
+    """Base class of metrics with a value for each combination of label values.
+
+    Args:
+        name (str): metric name;
+        documentation (str): help text;
+        labelnames (Sequence[str], optional): label names. Defaults to ().
+    """
+    kind = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def header(self) -> List[str]:
+        """Returns HELP and TYPE lines"""
+        return [f'# HELP {self.name} {escape(self.documentation)}',
+                f'# TYPE {self.name} {self.kind}']
+
+    def render(self) -> List[str]:
+        """Returns lines of the metric in the text format"""
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    """Monotonically increasing value"""
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, labels: Tuple[str, ...] = (), amount: float = 1) -> None:
+        """Increases the value for label values"""
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        return self.header() + [f'{self.name}{format_labels(self.labelnames, labels)} {value}'
+                                for labels, value in self.values.items()]
+
+
+class Gauge(Counter):
+    """Value which goes up and down"""
+    kind = 'gauge'
+
+    def dec(self, labels: Tuple[str, ...] = (), amount: float = 1) -> None:
+        """Decreases the value for label values"""
+        self.values[labels] = self.values.get(labels, 0) - amount
+
+
+class Histogram(Metric):
+    """Distribution of observed values in cumulative buckets.
+
+    Args:
+        name (str): metric name;
+        documentation (str): help text;
+        labelnames (Sequence[str], optional): label names. Defaults to ();
+        buckets (Sequence[float], optional): upper bounds of the buckets.
+            Defaults to LATENCY_BUCKETS.
+    """
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+        # non-cumulative counts of each bucket and +Inf, sum of the values
+        self.values: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, labels: Tuple[str, ...] = ()) -> None:
+        """Adds a value for label values"""
+        counts = self.values.get(labels)
+        if counts is None:
+            counts = self.values[labels] = ([0] * (len(self.buckets) + 1), [0.])
+        counts[0][bisect_left(self.buckets, value)] += 1
+        counts[1][0] += value
+
+    def render(self) -> List[str]:
+        lines = self.header()
+        names = self.labelnames + ('le',)
+        for labels, (counts, total) in self.values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'{self.name}_bucket{format_labels(names, labels + (le,))} '
+                             f'{cumulative}')
+            lines.append(f'{self.name}_sum{format_labels(self.labelnames, labels)} {total[0]}')
+            lines.append(f'{self.name}_count{format_labels(self.labelnames, labels)} '
+                         f'{cumulative}')
+        return lines
+
+
+requests_total = Counter(f'{PREFIX}_http_requests_total', 'Finished HTTP requests',
+                         ('method', 'route', 'status'))
+request_duration = Histogram(f'{PREFIX}_http_request_duration_seconds',
+                             'Time from receiving a request to sending its last byte',
+                             ('method', 'route'))
+requests_in_flight = Gauge(f'{PREFIX}_http_requests_in_flight', 'Requests being processed',
+                           ('method', 'route'))
+stage_duration = Histogram(f'{PREFIX}_http_request_stage_seconds',
+                           'Time a request spent in a stage: auth (including its database '
+                           'query), db (queries and waiting for a connection) or storage '
+                           '(requests up to response headers or local file operations)',
+                           ('route', 'stage'))
+request_bytes = Counter(f'{PREFIX}_http_request_bytes_total', 'Bytes of request bodies',
+                        ('route',))
+response_bytes = Counter(f'{PREFIX}_http_response_bytes_total', 'Bytes of response bodies',
+                         ('route',))
+METRICS: List[Metric] = [requests_total, request_duration, requests_in_flight, stage_duration,
+                         request_bytes, response_bytes]
+
+
+def add_stage_time(stage: str, seconds: float) -> None:
+    """Adds time spent in a stage to the current request, does nothing outside requests.
+
+    Args:
+        stage (str): stage name, e.g. 'db';
+        seconds (float): time spent in the stage.
+    """
+    stages = _stages.get()
+    if stages is not None:
+        stages[stage] = stages.get(stage, 0.) + seconds
+
+
+@contextmanager
+def stage_timer(stage: str) -> Iterator[None]:
+    """Measures the time the block takes as time spent by the current request in a stage.
+
+    Args:
+        stage (str): stage name, e.g. 'storage'.
+    """
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_stage_time(stage, time.perf_counter() - start_time)
+
+
+def render_stats(name: str, documentation: str,
+                 stats: Dict[str, Union[int, float]]) -> List[str]:
+    """Formats statistics like pool stats as a gauge with a label per key.
+
+    Args:
+        name (str): metric name;
+        documentation (str): help text;
+        stats (Dict[str, Union[int, float]]): values by key.
+
+    Returns:
+        List[str]: lines of the metric in the text format.
+    """
+    gauge = Gauge(name, documentation, ('key',))
+    gauge.values = {(key,): value for key, value in stats.items()}
+    return gauge.render()
+
+
+def render_metrics(extra: Sequence[str] = ()) -> str:
+    """Returns the request metrics of the current worker in the Prometheus text format.
+
+    Args:
+        extra (Sequence[str], optional): lines of metrics collected on request.
+            Defaults to ().
+
+    Returns:
+        str: metrics exposition.
+    """
+    lines = [line for metric in METRICS for line in metric.render()]
+    return '\n'.join(lines + list(extra)) + '\n'
+
+
+class MetricsMiddleware:
+    """Measures latency, in-flight requests, status codes, body sizes and time spent in stages
+        of each request by the route it is handled by.
+
+    Routes are resolved before the request is handled, so in-flight requests can be labeled.
+    Routes without path parameters are looked up by path in a dictionary filled on their first
+    request. Collection costs a few dictionary updates per request.
+
+    Args:
+        app (ASGIApp): wrapped application.
+    """
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+        self._routes: Dict[str, str] = {} # route templates by path of routes without parameters
+
+    def route(self, scope: Scope) -> str:
+        """Returns the template of the route handling a request.
+
+        Args:
+            scope (Scope): request scope.
+
+        Returns:
+            str: route path template, UNMATCHED_ROUTE if no route matches the path.
+        """
+        path = scope['path']
+        template = self._routes.get(path)
+        if template is not None:
+            return template
+        for route in scope['app'].routes:
+            match, _ = route.matches(scope)
+            if match != Match.NONE:
+                template = getattr(route, 'path', UNMATCHED_ROUTE)
+                if '{' not in template:
+                    self._routes[path] = template
+                return template
+        return UNMATCHED_ROUTE
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] != 'http' or not app_settings.metrics_enabled:
+            await self.app(scope, receive, send)
+            return
+        method, route = scope['method'], self.route(scope)
+        status_code, received, sent = 500, 0, 0
+
+        async def receive_counted() -> Message:
+            nonlocal received
+            message = await receive()
+            received += len(message.get('body', b''))
+            return message
+
+        async def send_counted(message: Message) -> None:
+            nonlocal status_code, sent
+            if message['type'] == 'http.response.start':
+                status_code = message['status']
+            elif message['type'] == 'http.response.body':
+                sent += len(message.get('body', b''))
+            elif message['type'] == 'http.response.zerocopysend':
+                sent += message.get('count') or 0
+            await send(message)
+
+        requests_in_flight.inc((method, route))
+        stages: Dict[str, float] = {}
+        token = _stages.set(stages)
+        start_time = time.perf_counter()
+        try:
+            await self.app(scope, receive_counted, send_counted)
+        finally:
+            request_duration.observe(time.perf_counter() - start_time, (method, route))
+            _stages.reset(token)
+            requests_in_flight.dec((method, route))
+            requests_total.inc((method, route, str(status_code)))
+            if received:
+                request_bytes.inc((route,), received)
+            if sent:
+                response_bytes.inc((route,), sent)
+            for stage, seconds in stages.items():
+                stage_duration.observe(seconds, (route, stage))
@@ -0,0 +1,84 @@
+"""Password hashing off the event loop"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+import bcrypt
+
+from core.config import app_settings
+
+
+class HasherBusyError(Exception):
+    """Raised when all hashing threads are busy and the queue is full"""
+
+
+class PasswordHasher:
+    """Hashes and verifies passwords with bcrypt in a bounded thread pool, so the event loop
+        is not blocked for the hashing time. Operations over the queue limit are rejected
+        instead of waiting.
+
+    Args:
+        workers (int): number of hashing threads;
+        queue_size (int): max number of operations waiting for a free thread;
+        rounds (int): bcrypt cost factor.
+    """
+    def __init__(self, workers: int, queue_size: int, rounds: int) -> None:
+        self.workers = workers
+        self.queue_size = queue_size
+        self.rounds = rounds
+        self.pending = 0
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='bcrypt')
+
+    async def _run(self, func: Callable[..., Any], *args: Any) -> Any:
+        """Runs a function in the thread pool.
+
+        Args:
+            func (Callable[..., Any]): function to run;
+            args (Any): function arguments.
+
+        Raises:
+            HasherBusyError: if the queue is full.
+
+        Returns:
+            Any: function result.
+        """
+        if self.pending >= self.workers + self.queue_size:
+            raise HasherBusyError('Password hashing queue is full')
+        self.pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+        finally:
+            self.pending -= 1
+
+    async def hash(self, password: str) -> str:
+        """Hashes a password.
+
+        Args:
+            password (str): plain password.
+
+        Returns:
+            str: password hash.
+        """
+        hashed = await self._run(bcrypt.hashpw, password.encode(), bcrypt.gensalt(self.rounds))
+        return hashed.decode()
+
+    async def verify(self, password: str, hashed: str) -> bool:
+        """Checks a password against its hash.
+
+        Args:
+            password (str): plain password;
+            hashed (str): password hash.
+
+        Returns:
+            bool: True if the password matches the hash.
+        """
+        return await self._run(bcrypt.checkpw, password.encode(), hashed.encode())
+
+    def shutdown(self) -> None:
+        """Stops the hashing threads"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+password_hasher = PasswordHasher(workers=app_settings.password_hash_workers,
+                                 queue_size=app_settings.password_hash_queue_size,
+                                 rounds=app_settings.bcrypt_rounds)
@@ -0,0 +1,69 @@
+"""Contains responses sending local files"""
+import asyncio
+import os
+from typing import BinaryIO, Mapping, Optional
+
+from starlette.background import BackgroundTask
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+from core.config import app_settings
+
+
+ZEROCOPY_EXTENSION = 'http.response.zerocopysend'
+
+
+class SendfileResponse(Response):
+    """Sends an open local file or its byte range and closes it.
+
+    The file is sent with sendfile by the ASGI server if it supports the zero-copy send
+    extension (e.g. Hypercorn with uvloop), otherwise it is read by chunks of
+    app_settings.download_chunk_size bytes with os.pread in a thread, not moving the file
+    position and not blocking the event loop.
+
+    Args:
+        file (BinaryIO): file opened for reading;
+        offset (int, optional): start byte position. Defaults to 0;
+        count (int, optional): number of bytes to send, None for the rest of the file.
+            Defaults to None;
+        status_code (int, optional): response status. Defaults to 200;
+        headers (Mapping[str, str], optional): response headers. Defaults to None;
+        background (BackgroundTask, optional): task run after sending. Defaults to None.
+    """
+    def __init__(self, file: BinaryIO, offset: int = 0, count: Optional[int] = None,
+                 status_code: int = 200, headers: Optional[Mapping[str, str]] = None,
+                 background: Optional[BackgroundTask] = None) -> None:
+        self.file = file
+        self.offset = offset
+        self.count = count if count is not None else os.fstat(file.fileno()).st_size - offset
+        super().__init__(status_code=status_code, headers=headers, background=background)
+        self.headers['content-length'] = str(self.count) # the body is sent by __call__
+
+    async def _send_chunks(self, send: Send) -> None:
+        position, end = self.offset, self.offset + self.count
+        while position < end:
+            size = min(app_settings.download_chunk_size, end - position)
+            chunk = await asyncio.to_thread(os.pread, self.file.fileno(), size, position)
+            if not chunk: # the file was truncated
+                break
+            position += len(chunk)
+            await send({'type': 'http.response.body', 'body': chunk,
+                        'more_body': position < end})
+        if position < end:
+            await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        try:
+            await send({'type': 'http.response.start', 'status': self.status_code,
+                        'headers': self.raw_headers})
+            if scope['method'] == 'HEAD' or self.count == 0:
+                await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+            elif ZEROCOPY_EXTENSION in scope.get('extensions', {}):
+                await send({'type': ZEROCOPY_EXTENSION, 'file': self.file.fileno(),
+                            'offset': self.offset, 'count': self.count, 'more_body': False})
+            else:
+                await self._send_chunks(send)
+        finally:
+            self.file.close()
+        if self.background is not None:
+            await self.background()
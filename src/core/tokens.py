@@ -0,0 +1,124 @@
+"""Contains authentication tokens signed with HMAC, verifiable without the database"""
+import base64
+import binascii
+from dataclasses import dataclass
+import hashlib
+import hmac
+import json
+import time
+from typing import Dict, Optional, Tuple
+import uuid
+
+from core.config import app_settings
+
+
+def b64encode(data: bytes) -> str:
+    """Encodes bytes with URL-safe base64 without padding"""
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode()
+
+
+def b64decode(data: str) -> bytes:
+    """Decodes URL-safe base64 without padding"""
+    return base64.urlsafe_b64decode(data + '=' * (-len(data) % 4))
+
+
+@dataclass
+class TokenClaims:
+    """Claims of a signed token.
+
+    Args:
+        username (str): name of the user the token is issued to;
+        jti (str): unique identifier of the token, used to revoke it;
+        expires_at (int): Unix time the token expires at.
+    """
+    username: str
+    jti: str
+    expires_at: int
+
+
+class TokenSigner:
+    """Issues and verifies tokens like '<key id>.<claims>.<signature>', where claims are
+        base64-encoded JSON and the signature is HMAC-SHA256 of the key id and claims.
+
+    Keys are rotated by adding a new key, switching key_id to it and removing the old key after
+    the lifetime of tokens, so tokens signed with the old key stay valid until they expire.
+    Verification costs one HMAC and a JSON decoding, revocation is checked by the caller.
+
+    Args:
+        keys (Dict[str, str]): secrets by key identifier, all of them verify tokens;
+        key_id (str): identifier of the key signing new tokens, empty disables signing;
+        ttl (int): seconds a token is valid.
+
+    Raises:
+        ValueError: if key_id is not one of the keys or a key identifier contains a dot.
+    """
+    def __init__(self, keys: Dict[str, str], key_id: str, ttl: int) -> None:
+        if key_id and key_id not in keys:
+            raise ValueError(f"Token signing key '{key_id}' is not configured")
+        if any('.' in kid for kid in keys):
+            raise ValueError('Token signing key identifiers must not contain dots')
+        self._keys = {kid: secret.encode() for kid, secret in keys.items()}
+        self.key_id = key_id
+        self.ttl = ttl
+
+    @property
+    def enabled(self) -> bool:
+        """Whether new tokens are signed"""
+        return bool(self.key_id)
+
+    @staticmethod
+    def is_signed(token: str) -> bool:
+        """Tells signed tokens from tokens stored in the database, which contain no dots"""
+        return token.count('.') == 2
+
+    @staticmethod
+    def _signature(key: bytes, message: str) -> str:
+        return b64encode(hmac.new(key, message.encode(), hashlib.sha256).digest())
+
+    def sign(self, username: str) -> Tuple[str, TokenClaims]:
+        """Issues a token to a user.
+
+        Args:
+            username (str): name of the user.
+
+        Returns:
+            Tuple[str, TokenClaims]: the token and its claims.
+        """
+        claims = TokenClaims(username=username, jti=uuid.uuid4().hex,
+                             expires_at=int(time.time()) + self.ttl)
+        payload = b64encode(json.dumps({'sub': claims.username, 'jti': claims.jti,
+                                        'exp': claims.expires_at},
+                                       separators=(',', ':')).encode())
+        message = f'{self.key_id}.{payload}'
+        return f'{message}.{self._signature(self._keys[self.key_id], message)}', claims
+
+    def verify(self, token: str) -> Optional[TokenClaims]:
+        """Checks the signature and expiration of a token.
+
+        Args:
+            token (str): signed token.
+
+        Returns:
+            Optional[TokenClaims]: claims of the token, None if it is malformed, signed with
+                an unknown key, forged or expired.
+        """
+        message, _, signature = token.rpartition('.')
+        key_id, _, payload = message.partition('.')
+        key = self._keys.get(key_id)
+        if key is None or not hmac.compare_digest(self._signature(key, message).encode(),
+                                                  signature.encode()):
+            return None
+        try:
+            data = json.loads(b64decode(payload))
+            claims = TokenClaims(username=str(data['sub']), jti=str(data['jti']),
+                                 expires_at=int(data['exp']))
+        except (binascii.Error, ValueError, TypeError, KeyError):
+            return None
+        if claims.expires_at <= time.time():
+            return None
+        return claims
+
+
+token_signer = TokenSigner(keys=app_settings.token_signing_keys,
+                           key_id=app_settings.token_signing_key_id,
+                           ttl=app_settings.signed_token_ttl)
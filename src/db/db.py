@@ -1,14 +1,87 @@
 """Contains code responsible for connecting to the database"""
+import time
+from typing import Dict, Union
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 
 from core.config import app_settings
+from core.metrics import add_stage_time
+
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """Connection pool measuring how long requests wait for a connection"""
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.checkouts = 0
+        self.timeouts = 0
+        self.checkout_time_total = 0.
+        self.checkout_time_max = 0.
+
+    def _do_get(self):
+        start_time = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            self.timeouts += 1
+            raise
+        finally:
+            checkout_time = time.perf_counter() - start_time
+            add_stage_time('db', checkout_time)
+            self.checkouts += 1
+            self.checkout_time_total += checkout_time
+            self.checkout_time_max = max(self.checkout_time_max, checkout_time)
+
+    def stats(self) -> Dict[str, Union[int, float]]:
+        """Returns connection pool statistics.
+
+        Returns:
+            Dict[str, Union[int, float]]: pool limits, numbers of connections in use and idle,
+                number of checkouts and timeouts, average and max checkout time in seconds.
+        """
+        return {'size': self.size(),
+                'max_overflow': app_settings.database_max_overflow,
+                'in_use': self.checkedout(),
+                'idle': self.checkedin(),
+                'overflow': max(self.overflow(), 0),
+                'checkouts': self.checkouts,
+                'timeouts': self.timeouts,
+                'checkout_time_avg': self.checkout_time_total / self.checkouts
+                                     if self.checkouts else 0.,
+                'checkout_time_max': self.checkout_time_max}
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def start_query_timer(conn, cursor, statement, parameters, context, executemany) -> None:
+    """Remembers when a statement of any engine is sent to the database"""
+    context.query_start_time = time.perf_counter()
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def stop_query_timer(conn, cursor, statement, parameters, context, executemany) -> None:
+    """Adds execution time of a statement to the 'db' stage of the current request"""
+    add_stage_time('db', time.perf_counter() - context.query_start_time)
 
 
 # an Engine, which the Session will use for connection
-engine = create_async_engine(app_settings.database_dsn.unicode_string(),
-                             echo=app_settings.database_echo,
-                             future=True)
+engine = create_async_engine(
+    app_settings.database_dsn.unicode_string(),
+    echo=app_settings.database_echo,
+    future=True,
+    poolclass=InstrumentedPool,
+    pool_size=app_settings.database_pool_size,
+    max_overflow=app_settings.database_max_overflow,
+    pool_timeout=app_settings.database_pool_timeout,
+    pool_recycle=app_settings.database_pool_recycle,
+    pool_pre_ping=app_settings.database_pool_pre_ping,
+    connect_args={
+        'prepared_statement_cache_size': app_settings.database_statement_cache_size,
+        'server_settings': {'statement_timeout': str(app_settings.database_statement_timeout)},
+    })
 # generate Session object
 async_session = sessionmaker(
     engine, class_=AsyncSession, expire_on_commit=False
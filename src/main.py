@@ -1,8 +1,39 @@
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
 from fastapi import FastAPI
 from fastapi.responses import ORJSONResponse
 
 from api.v1.base import api_router
+from api.v1.service import health_monitor
 from core.config import app_settings
+from core.metrics import MetricsMiddleware
+from core.passwords import password_hasher
+from db.db import engine
+from services.file_cache import file_cache
+from services.reconciler import reconciler
+from services.revocations import revocation_list
+from storage.cache import object_cache
+from storage.storage import storage_client
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    """Opens shared connection pools on startup and closes them on shutdown"""
+    await storage_client.open()
+    health_monitor.start()
+    file_cache.start()
+    reconciler.start()
+    revocation_list.start()
+    yield
+    await revocation_list.stop()
+    await reconciler.stop()
+    await file_cache.stop()
+    await health_monitor.stop()
+    await storage_client.close()
+    object_cache.close()
+    password_hasher.shutdown()
+    await engine.dispose()
 
 
 app = FastAPI(
@@ -11,6 +42,8 @@ app = FastAPI(
     openapi_url='/api/openapi.json',
     # replace the standard JSON serializer with a faster version written in Rust for optimization
     default_response_class=ORJSONResponse,
+    lifespan=lifespan,
 )
 
 app.include_router(api_router, prefix='/api/v1')
+app.add_middleware(MetricsMiddleware)
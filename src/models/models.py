@@ -1,5 +1,8 @@
 """Database models"""
-from sqlalchemy import Column, ForeignKey, Integer, String
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from sqlalchemy import BigInteger, Column, DateTime, ForeignKey, Index, Integer, String
 from sqlalchemy.orm import relationship
 
 from core.config import app_settings
@@ -26,6 +29,13 @@ class Tokens(Base):
     token_relationship = relationship('Users', back_populates='tokens')
 
 
+class RevokedTokens(Base):
+    """Model of the 'revoked_tokens' table, kept until the signed tokens expire"""
+    __tablename__ = 'revoked_tokens'
+    jti = Column(String(32), primary_key=True)
+    expires_at = Column(DateTime(timezone=True), nullable=False, index=True)
+
+
 class Files(Base):
     """Model of the 'files' table"""
     __tablename__ = 'files'
@@ -33,4 +43,85 @@ class Files(Base):
     username = Column(String(app_settings.max_username_length),
                       ForeignKey('users.username', ondelete='CASCADE'), nullable=False)
     filepath = Column(String(app_settings.max_filepath_length), nullable=False, unique=True)
+    # content of the file, None for files stored in the storage under their filepath
+    # checked on commit, so a file may be inserted before its blob is referenced
+    digest = Column(String(64), ForeignKey('blobs.digest', deferrable=True, initially='DEFERRED'),
+                    nullable=True)
+    # size and modification time in UTC, None for files uploaded before they were recorded
+    size = Column(BigInteger, nullable=True)
+    modified_at = Column(DateTime(timezone=True), nullable=True,
+                         default=lambda: datetime.now(timezone.utc))
     files_relationship = relationship('Users', back_populates='files')
+    blob = relationship('Blobs', lazy='joined')
+    __table_args__ = (
+        # per-user listing ordered by id and per-user lookups by id
+        Index('ix_files_username_id', 'username', 'id'),
+        # per-user lookups by filepath and prefix (LIKE 'dir/%') listing
+        Index('ix_files_username_filepath', 'username', 'filepath',
+              postgresql_ops={'filepath': 'text_pattern_ops'}),
+    )
+
+    @property
+    def storage_path(self) -> str:
+        """Path to the file content in the storage"""
+        return self.blob.path if self.blob is not None else self.filepath
+
+    @property
+    def encoding(self) -> Optional[str]:
+        """Codec of the stored content, None if it is stored as is"""
+        return self.blob.encoding if self.blob is not None else None
+
+
+class Blobs(Base):
+    """Model of the 'blobs' table, file content shared by files with the same SHA-256 digest"""
+    __tablename__ = 'blobs'
+    digest = Column(String(64), primary_key=True)
+    path = Column(String(app_settings.max_filepath_length), nullable=False, unique=True)
+    size = Column(BigInteger, nullable=False) # of the original content
+    refcount = Column(Integer, nullable=False)
+    encoding = Column(String(16), nullable=True) # codec of the stored content
+
+
+class UserUsage(Base):
+    """Model of the 'user_usage' table, storage used by files of a user.
+        Updated in the transactions creating and deleting the files.
+    """
+    __tablename__ = 'user_usage'
+    username = Column(String(app_settings.max_username_length),
+                      ForeignKey('users.username', ondelete='CASCADE'), primary_key=True)
+    size = Column(BigInteger, nullable=False) # total size of the files in bytes
+    files = Column(Integer, nullable=False) # number of the files
+
+
+class UploadSessions(Base):
+    """Model of the 'upload_sessions' table, resumable uploads in progress. The content is
+        stored under the filepath with a multipart upload, a part per part_size bytes.
+    """
+    __tablename__ = 'upload_sessions'
+    id = Column(String(32), primary_key=True) # random, known to the uploading client only
+    username = Column(String(app_settings.max_username_length),
+                      ForeignKey('users.username', ondelete='CASCADE'), nullable=False)
+    filepath = Column(String(app_settings.max_filepath_length), nullable=False, unique=True)
+    multipart_id = Column(String, nullable=False) # identifier of the storage multipart upload
+    size = Column(BigInteger, nullable=False) # declared size of the file
+    part_size = Column(Integer, nullable=False)
+    received = Column(BigInteger, nullable=False, default=0) # bytes stored in uploaded parts
+    # postponed by every uploaded part
+    expires_at = Column(DateTime(timezone=True), nullable=False,
+                        default=lambda: datetime.now(timezone.utc) + timedelta(
+                            seconds=app_settings.upload_session_ttl),
+                        index=True)
+
+
+class UploadParts(Base):
+    """Model of the 'upload_parts' table, uploaded parts of resumable uploads"""
+    __tablename__ = 'upload_parts'
+    session_id = Column(String(32), ForeignKey('upload_sessions.id', ondelete='CASCADE'),
+                        primary_key=True)
+    number = Column(Integer, primary_key=True)
+    etag = Column(String, nullable=False)
+
+
+# byte-ordered paths of stored content, compared with ordered storage listings
+Index('ix_blobs_path_bytes', Blobs.path.collate('C'))
+Index('ix_files_filepath_bytes', Files.filepath.collate('C'), postgresql_where=Files.digest.is_(None))
@@ -1,4 +1,7 @@
 """Request and response validation schemes for the Files model"""
+from datetime import datetime
+from typing import List, Optional
+
 from pydantic import BaseModel, Field
 
 from core.config import app_settings
@@ -13,10 +16,32 @@ class FileCreate(FileBase):
 
     Args:
        username (str): name of a user;
-       filepath (str): path to a file in the storage.
+       filepath (str): path to a file in the storage;
+       digest (str, optional): SHA-256 digest of the file content, None if the content
+           is stored under the filepath;
+       size (int, optional): size of the file in bytes.
     """
     username: str = Field(..., max_length=app_settings.max_username_length)
     filepath: str = Field(..., max_length=app_settings.max_filepath_length)
+    digest: Optional[str] = Field(None, min_length=64, max_length=64)
+    size: Optional[int] = None
+
+
+class BlobCreate(BaseModel):
+    """Validation scheme for blob`s creation.
+
+    Args:
+       digest (str): SHA-256 digest of the content;
+       path (str): path to the content in the storage;
+       size (int): size of the content in bytes;
+       refcount (int, optional): number of files referencing the content. Defaults to 1;
+       encoding (str, optional): codec of the stored content, None if it is stored as is.
+    """
+    digest: str = Field(..., min_length=64, max_length=64)
+    path: str = Field(..., max_length=app_settings.max_filepath_length)
+    size: int
+    refcount: int = 1
+    encoding: Optional[str] = None
 
 
 class File(FileBase):
@@ -28,4 +53,120 @@ class File(FileBase):
     """
     id: int
     filepath: str = Field(..., max_length=app_settings.max_filepath_length)
-    
\ No newline at end of file
+
+
+class FileMetadata(File):
+    """Validation scheme for file metadata cached between requests.
+
+    Args:
+        username (str): name of the owner;
+        storage_path (str): path to the file content in the storage;
+        digest (str, optional): SHA-256 digest of the content;
+        size (int, optional): size of the file in bytes;
+        modified_at (datetime, optional): modification time of the file;
+        encoding (str, optional): codec of the stored content, None if it is stored as is.
+    """
+    username: str
+    storage_path: str
+    encoding: Optional[str] = None
+    digest: Optional[str] = None
+    size: Optional[int] = None
+    modified_at: Optional[datetime] = None
+
+
+class FilePage(BaseModel):
+    """Validation scheme for a page of the file listing.
+
+    Args:
+        files (List[File]): files of the page ordered by their identifiers;
+        next_cursor (int, optional): cursor of the next page, None for the last page.
+    """
+    files: List[File]
+    next_cursor: Optional[int] = None
+
+
+class FileUploadResult(FileBase):
+    """Validation scheme for a result of uploading one file of a batch.
+
+    Args:
+        filepath (str): path to a file in the storage;
+        id (int, optional): unique identifier of the file, None if the upload failed;
+        detail (str, optional): reason of the failure.
+    """
+    filepath: str
+    id: Optional[int] = None
+    detail: Optional[str] = None
+
+
+class FileCount(BaseModel):
+    """Validation scheme for a result of an operation on several files.
+
+    Args:
+        files (int): number of the affected files.
+    """
+    files: int
+
+
+class StorageUsage(BaseModel):
+    """Validation scheme for storage used by a user.
+
+    Args:
+        size (int): total size of the user`s files in bytes;
+        files (int): number of the user`s files;
+        quota (int, optional): max total size of the files in bytes, None if it is unlimited.
+    """
+    size: int = 0
+    files: int = 0
+    quota: Optional[int] = None
+
+
+class PresignedUrl(BaseModel):
+    """Validation scheme for a presigned URL returned to a client.
+
+    Args:
+        url (str): URL to upload or download the file directly with the storage;
+        filepath (str): path to a file in the storage;
+        expires_in (int): number of seconds the URL is valid for.
+    """
+    url: str
+    filepath: str
+    expires_in: int
+
+
+class UploadSessionCreate(BaseModel):
+    """Validation scheme for creation of a resumable upload.
+
+    Args:
+        id (str): unique identifier of the upload;
+        username (str): name of a user;
+        filepath (str): path to a file in the storage;
+        multipart_id (str): identifier of the storage multipart upload;
+        size (int): size of the file in bytes;
+        part_size (int): size of the uploaded parts in bytes.
+    """
+    id: str
+    username: str = Field(..., max_length=app_settings.max_username_length)
+    filepath: str = Field(..., max_length=app_settings.max_filepath_length)
+    multipart_id: str
+    size: int
+    part_size: int
+
+
+class UploadSession(BaseModel):
+    """Validation scheme for the state of a resumable upload returned to a client.
+
+    Args:
+        id (str): unique identifier of the upload;
+        filepath (str): path to a file in the storage;
+        size (int): size of the file in bytes;
+        offset (int): number of bytes stored, the next chunk is to be sent from it;
+        part_size (int): chunks are stored in parts of this size, bytes after the last whole
+            part of a chunk which does not end the file are discarded;
+        expires_at (datetime): time the upload is discarded at unless it receives more data.
+    """
+    id: str
+    filepath: str
+    size: int
+    offset: int
+    part_size: int
+    expires_at: datetime
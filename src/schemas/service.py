@@ -1,4 +1,7 @@
 """Schemas for service endpoints"""
+from datetime import datetime
+from typing import Literal, Optional
+
 from pydantic import BaseModel
 
 
@@ -6,8 +9,112 @@ class ServicePing(BaseModel):
     """Response model for ping endpoint.
 
     Args:
-        db (float): database ping time in seconds;
-        storage (float): storage ping time in seconds.
+        status (str): 'ok' if all services are available, 'degraded' if some of them are not,
+            'unavailable' if none of them is;
+        db (float, optional): database ping time in seconds, None if it is unavailable;
+        storage (float, optional): storage ping time in seconds, None if it is unavailable.
+    """
+    status: Literal['ok', 'degraded', 'unavailable']
+    db: Optional[float]
+    storage: Optional[float]
+
+
+class StoragePoolStats(BaseModel):
+    """Response model for storage pool statistics endpoint.
+
+    Args:
+        limit (int): max number of simultaneous connections;
+        limit_per_host (int): max number of simultaneous connections to one host, 0 if unlimited;
+        in_use (int): number of connections serving requests, -1 if unknown;
+        idle (int): number of open connections waiting to be reused, -1 if unknown.
+    """
+    limit: int
+    limit_per_host: int
+    in_use: int
+    idle: int
+
+
+class CacheStats(BaseModel):
+    """Response model for cache statistics.
+
+    Args:
+        size (int): number of cached entries;
+        maxsize (int): max number of cached entries;
+        hits (int): number of lookups answered from the cache;
+        misses (int): number of lookups not found in the cache.
+    """
+    size: int
+    maxsize: int
+    hits: int
+    misses: int
+
+
+class ObjectCacheStats(BaseModel):
+    """Response model for object cache tier statistics.
+
+    Args:
+        objects (int): number of cached objects;
+        size (int): total size of cached objects in bytes;
+        max_size (int): max total size of cached objects in bytes;
+        hits (int): number of reads answered from the tier;
+        misses (int): number of reads not found in the tier;
+        hit_ratio (float): share of reads answered from the tier.
+    """
+    objects: int
+    size: int
+    max_size: int
+    hits: int
+    misses: int
+    hit_ratio: float
+
+
+class DatabasePoolStats(BaseModel):
+    """Response model for database pool statistics endpoint.
+
+    Args:
+        size (int): number of connections kept open;
+        max_overflow (int): max number of connections opened over the pool size;
+        in_use (int): number of connections checked out by requests;
+        idle (int): number of open connections waiting to be checked out;
+        overflow (int): number of connections currently opened over the pool size;
+        checkouts (int): number of connection requests;
+        timeouts (int): number of connection requests failed to get a connection in time;
+        checkout_time_avg (float): average time of waiting for a connection in seconds;
+        checkout_time_max (float): max time of waiting for a connection in seconds.
+    """
+    size: int
+    max_overflow: int
+    in_use: int
+    idle: int
+    overflow: int
+    checkouts: int
+    timeouts: int
+    checkout_time_avg: float
+    checkout_time_max: float
+
+
+class ReconciliationStats(BaseModel):
+    """Response model for statistics of the last reconciliation with the storage.
+
+    Args:
+        started_at (datetime): start time of the reconciliation;
+        finished_at (datetime, optional): end time, None if it is running or has failed;
+        repair (bool): whether mismatches are repaired or only reported;
+        objects (int): number of listed storage objects;
+        records (int): number of paths expected in the storage by the database;
+        orphans (int): number of objects without records;
+        orphans_removed (int): number of removed orphans;
+        missing (int): number of expected paths without objects;
+        files_deleted (int): number of deleted records of files without objects;
+        uploads_expired (int): number of discarded expired resumable uploads.
     """
-    db: float
-    storage: float
+    started_at: datetime
+    finished_at: Optional[datetime]
+    repair: bool
+    objects: int
+    records: int
+    orphans: int
+    orphans_removed: int
+    missing: int
+    files_deleted: int
+    uploads_expired: int
@@ -1,4 +1,6 @@
 """Request and response validation schemes for the Users and Token models"""
+from datetime import datetime
+from typing import Optional
 import uuid
 
 from pydantic import BaseModel, Field
@@ -14,7 +16,8 @@ class TokenBase(BaseModel):
        token (str): user`s authentication token.
     """
     username: str = Field(..., max_length=app_settings.max_username_length)
-    token: str = Field(uuid.uuid4(), max_length=app_settings.max_token_length)
+    token: str = Field(default_factory=lambda: str(uuid.uuid4()),
+                       max_length=app_settings.max_token_length)
 
 
 class UserBase(BaseModel):
@@ -37,4 +40,24 @@ class UserCreate(UserBase):
 
 
 class Token(TokenBase):
-    """Validation scheme for token returned to a client"""
+    """Validation scheme for token returned to a client.
+
+    Args:
+       username (str): name of a user;
+       token (str): user`s authentication token, stored in the database or signed;
+       expires_at (datetime, optional): expiration time of a signed token, None for tokens
+           valid until they are revoked.
+    """
+    token: str
+    expires_at: Optional[datetime] = None
+
+
+class RevokedToken(BaseModel):
+    """Validation scheme for a revoked signed token.
+
+    Args:
+        jti (str): unique identifier of the token;
+        expires_at (datetime): expiration time of the token.
+    """
+    jti: str
+    expires_at: datetime
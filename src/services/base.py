@@ -15,7 +15,8 @@ CreateSchemaTypeT = TypeVar("CreateSchemaTypeT", bound=BaseModel)
 
 class Repository:
     """Agreement which methods will be created to implement CRUD"""
-    async def create(self, database: AsyncSession, obj_in: CreateSchemaTypeT):
+    async def create(self, database: AsyncSession, obj_in: CreateSchemaTypeT,
+                     commit: bool = True):
         """Create method"""
         raise NotImplementedError
 
@@ -29,10 +30,15 @@ class RepositoryDB(Repository, Generic[ModelTypeT, CreateSchemaTypeT]):
     def __init__(self, model: Type[ModelTypeT]):
         self._model = model
 
-    async def create(self, database: AsyncSession, obj_in: CreateSchemaTypeT) -> ModelTypeT:
+    async def create(self, database: AsyncSession, obj_in: CreateSchemaTypeT,
+                     commit: bool = True) -> ModelTypeT:
         obj_in_data = jsonable_encoder(obj_in)
         db_obj = self._model(**obj_in_data)
         database.add(db_obj)
+        if not commit:
+            # the caller commits the transaction later, flush to get generated values
+            await database.flush()
+            return db_obj
         await database.commit()
         await database.refresh(db_obj)
         return db_obj
@@ -0,0 +1,187 @@
+"""Contains a cache of file metadata shared by requests of an application worker"""
+import asyncio
+from contextlib import suppress
+import json
+import logging
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import asyncpg
+from sqlalchemy import text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.cache import MISSING, TTLCache
+from core.config import app_settings
+from schemas.file_storage import FileMetadata
+
+
+logger = logging.getLogger(__name__)
+NOTIFY_CHANNEL = 'file_changes'
+NOTIFY_MAX_PAYLOAD = 7999 # bytes of a notification payload, it must be shorter than 8000
+NOTIFY_RETRY_INTERVAL = 5. # seconds between reconnections of the listener
+
+# username, unique identifier and filepath of a created, moved or deleted file
+FileChange = Tuple[str, int, str]
+
+
+def notification_payloads(changes: List[FileChange],
+                          max_size: int = NOTIFY_MAX_PAYLOAD) -> List[str]:
+    """Splits changes into JSON payloads of notifications of at most max_size UTF-8 bytes.
+        The filepath of a change which does not fit into a payload alone is replaced by None.
+
+    Args:
+        changes (List[FileChange]): usernames, unique identifiers and filepaths of the files;
+        max_size (int, optional): max payload size in bytes. Defaults to NOTIFY_MAX_PAYLOAD.
+
+    Returns:
+        List[str]: JSON arrays of the changes.
+    """
+    payloads: List[str] = []
+    items: List[str] = []
+    size = 2 # brackets of the array
+    for username, file_id, filepath in changes:
+        item = json.dumps([username, file_id, filepath], ensure_ascii=False)
+        item_size = len(item.encode())
+        if item_size + 2 > max_size:
+            item = json.dumps([username, file_id, None], ensure_ascii=False)
+            item_size = len(item.encode())
+        if items and size + 1 + item_size > max_size:
+            payloads.append(f"[{','.join(items)}]")
+            items, size = [], 2
+        size += item_size + (1 if items else 0)
+        items.append(item)
+    if items:
+        payloads.append(f"[{','.join(items)}]")
+    return payloads
+
+
+class FileMetadataCache:
+    """Bounded cache of file metadata by (username, id) and (username, filepath).
+
+    Entries are invalidated by the worker creating, moving or deleting files. Other workers learn
+    about moves and deletions from Postgres notifications sent on commit if listening is enabled,
+    otherwise their entries are trusted until they expire.
+
+    Args:
+        maxsize (int): max number of entries, each file takes two of them;
+        ttl (float): entry lifetime in seconds;
+        listen (bool): listen to notifications of other workers.
+    """
+    def __init__(self, maxsize: int, ttl: float, listen: bool) -> None:
+        self._cache: TTLCache[Tuple[str, str, object], FileMetadata] = TTLCache(maxsize=maxsize,
+                                                                                ttl=ttl)
+        self.listen = listen
+        self.version = 0 # changed by invalidation
+        self._task: Optional[asyncio.Task] = None
+
+    def get(self, username: str, file_id: Optional[int] = None,
+            filepath: Optional[str] = None) -> Optional[FileMetadata]:
+        """Returns cached metadata of a file of a user by its unique identifier or filepath.
+
+        Args:
+            username (str): name of the user;
+            file_id (int, optional): unique identifier of the file. Defaults to None;
+            filepath (str, optional): path to the file in the storage. Defaults to None.
+
+        Returns:
+            Optional[FileMetadata]: metadata of the file, None if it is not cached.
+        """
+        key = ('path', username, filepath) if filepath else ('id', username, file_id)
+        metadata = self._cache.get(key)
+        return None if metadata is MISSING else metadata
+
+    def set(self, metadata: FileMetadata, version: int) -> None:
+        """Caches metadata of a file unless there have been invalidations since it was read,
+            so metadata of a file deleted meanwhile is not cached.
+
+        Args:
+            metadata (FileMetadata): metadata of the file;
+            version (int): self.version before the metadata was read from the database.
+        """
+        if version != self.version:
+            return
+        self._cache.set(('id', metadata.username, metadata.id), metadata)
+        self._cache.set(('path', metadata.username, metadata.filepath), metadata)
+
+    def invalidate(self, changes: Iterable[FileChange]) -> None:
+        """Removes entries of created, moved or deleted files.
+
+        Args:
+            changes (Iterable[FileChange]): usernames, unique identifiers and filepaths
+                of the files.
+        """
+        self.version += 1
+        for username, file_id, filepath in changes:
+            self._cache.invalidate(('id', username, file_id))
+            self._cache.invalidate(('path', username, filepath))
+
+    def stats(self) -> Dict[str, int]:
+        """Returns cache statistics.
+
+        Returns:
+            Dict[str, int]: number of entries, max number of entries, hits and misses.
+        """
+        return self._cache.stats()
+
+    async def notify(self, database: AsyncSession, changes: List[FileChange]) -> None:
+        """Notifies listening workers about moved or deleted files. Notifications are delivered
+            on commit of the transaction and discarded on rollback.
+
+        Args:
+            database (AsyncSession): database session;
+            changes (List[FileChange]): usernames, unique identifiers and filepaths of the files.
+        """
+        if not self.listen:
+            return
+        for payload in notification_payloads(changes):
+            await database.execute(text('SELECT pg_notify(:channel, :payload)'),
+                                   {'channel': NOTIFY_CHANNEL, 'payload': payload})
+
+    def _on_notification(self, connection: asyncpg.Connection, pid: int, channel: str,
+                         payload: str) -> None:
+        """Invalidates entries of files listed in a notification, a change without a filepath
+            clears the cache as entries by the filepath can not be found"""
+        changes = [tuple(change) for change in json.loads(payload)]
+        if any(filepath is None for _, _, filepath in changes):
+            self.version += 1
+            self._cache.clear()
+            return
+        self.invalidate(changes)
+
+    async def _listen(self) -> None:
+        """Listens to notifications, reconnecting if the connection is lost"""
+        url = make_url(str(app_settings.database_dsn)).set(drivername='postgresql')
+        while True:
+            connection = None
+            try:
+                connection = await asyncpg.connect(url.render_as_string(hide_password=False))
+                closed = asyncio.Event()
+                connection.add_termination_listener(lambda _: closed.set())
+                await connection.add_listener(NOTIFY_CHANNEL, self._on_notification)
+                # notifications sent while the listener was disconnected are lost
+                self._cache.clear()
+                await closed.wait()
+            except (OSError, asyncpg.PostgresError):
+                logger.warning('File changes listener is disconnected', exc_info=True)
+            finally:
+                if connection is not None and not connection.is_closed():
+                    await connection.close()
+            await asyncio.sleep(NOTIFY_RETRY_INTERVAL)
+
+    def start(self) -> None:
+        """Starts listening to notifications in background if it is enabled"""
+        if self.listen and self._task is None:
+            self._task = asyncio.create_task(self._listen())
+
+    async def stop(self) -> None:
+        """Stops listening to notifications"""
+        if self._task is not None:
+            self._task.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+
+
+file_cache = FileMetadataCache(maxsize=app_settings.file_cache_size,
+                               ttl=app_settings.file_cache_ttl,
+                               listen=app_settings.file_cache_listen)
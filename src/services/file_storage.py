@@ -1,16 +1,146 @@
 """Contains a class that implements validation and work with the database for the ShortURLs model"""
-from typing import List, Optional
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
 
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import (ColumnElement, column, delete, func, Integer, or_, Row, String, union_all,
+                        update, values)
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 
+from core.config import app_settings
 from services.base import RepositoryDB
-from models.models import Files as FilesModel
-from schemas.file_storage import FileCreate
+from models.models import (Blobs as BlobsModel, Files as FilesModel,
+                           UploadParts as UploadPartsModel, UploadSessions as UploadSessionsModel,
+                           UserUsage as UserUsageModel)
+from schemas.file_storage import BlobCreate, FileCreate, StorageUsage, UploadSessionCreate
 
 
 class RepositoryFiles(RepositoryDB[FilesModel, FileCreate]):
     """Validation and work with the database for the Files model"""
+    async def create_many(self, database: AsyncSession,
+                          objs_in: List[FileCreate]) -> List[Row]:
+        """Inserts files with a single statement without committing the transaction.
+            Files with already existing filepaths are skipped.
+
+        Args:
+            database (AsyncSession): database session;
+            objs_in (List[FileCreate]): files to be inserted.
+
+        Returns:
+            List[Row]: unique identifiers and filepaths of the inserted files.
+        """
+        statement = insert(self._model).values([jsonable_encoder(obj_in) for obj_in in objs_in])
+        statement = statement.on_conflict_do_nothing(index_elements=[self._model.filepath])
+        statement = statement.returning(self._model.id, self._model.filepath)
+        results = await database.execute(statement=statement)
+        return results.all()
+
+    async def delete_many_by_ids(self, database: AsyncSession,
+                                 entity_ids: List[int]) -> List[Optional[str]]:
+        """Deletes files by their unique identifiers without committing the transaction.
+            References to the content of the files are to be released by the caller.
+
+        Args:
+            database (AsyncSession): database session;
+            entity_ids (List[int]): unique identifiers of the files.
+
+        Returns:
+            List[Optional[str]]: content digests of the deleted files.
+        """
+        statement = delete(self._model).where(self._model.id.in_(entity_ids))
+        statement = statement.returning(self._model.digest)
+        results = await database.execute(statement=statement,
+                                         execution_options={'synchronize_session': False})
+        return results.scalars().all()
+
+    def _match_path(self, username: str, filepath: Optional[str],
+                    prefix: Optional[str]) -> List[ColumnElement[bool]]:
+        """Returns conditions selecting a file of a user by its filepath, or all files of the user
+            with a filepath prefix if it is passed.
+        """
+        if prefix is not None:
+            return [self._model.username == username,
+                    self._model.filepath.startswith(prefix, autoescape=True)]
+        return [self._model.username == username, self._model.filepath == filepath]
+
+    async def delete_by_path(self, database: AsyncSession, username: str,
+                             filepath: Optional[str] = None,
+                             prefix: Optional[str] = None) -> List[Row]:
+        """Deletes a file of a user, or all files of the user with a filepath prefix,
+            with a single statement without committing the transaction. References to
+            the content of the files are to be released by the caller.
+
+        Args:
+            database (AsyncSession): database session;
+            username (str): name of the user;
+            filepath (str, optional): path to the file in the storage. Defaults to None;
+            prefix (str, optional): beginning of filepaths of the files. Defaults to None.
+
+        Returns:
+            List[Row]: unique identifiers, filepaths, content digests and sizes
+                of the deleted files.
+        """
+        statement = delete(self._model).where(*self._match_path(username, filepath, prefix))
+        statement = statement.returning(self._model.id, self._model.filepath,
+                                        self._model.digest, self._model.size)
+        results = await database.execute(statement=statement,
+                                         execution_options={'synchronize_session': False})
+        return results.all()
+
+    async def move_by_path(self, database: AsyncSession, username: str, destination: str,
+                           filepath: Optional[str] = None,
+                           prefix: Optional[str] = None) -> List[Row]:
+        """Renames a file of a user, or replaces a filepath prefix of all files of the user
+            having it, with a single statement without committing the transaction.
+
+        Args:
+            database (AsyncSession): database session;
+            username (str): name of the user;
+            destination (str): new filepath of the file or new prefix of the files;
+            filepath (str, optional): path to the file in the storage. Defaults to None;
+            prefix (str, optional): beginning of filepaths of the files. Defaults to None.
+
+        Raises:
+            IntegrityError: if a file with a new filepath already exists;
+            DataError: if a new filepath is too long.
+
+        Returns:
+            List[Row]: unique identifiers, new filepaths and content digests of the moved files.
+        """
+        new_filepath = destination if prefix is None else func.concat(
+            destination, func.substr(self._model.filepath, len(prefix) + 1))
+        statement = update(self._model).where(*self._match_path(username, filepath, prefix))
+        statement = statement.values(filepath=new_filepath)
+        statement = statement.returning(self._model.id, self._model.filepath, self._model.digest)
+        results = await database.execute(statement=statement,
+                                         execution_options={'synchronize_session': False})
+        return results.all()
+
+    async def delete_by_storage_paths(self, database: AsyncSession,
+                                      paths: List[str]) -> List[Row]:
+        """Deletes files whose content is stored under specific paths, either their own
+            filepaths or paths of their blobs, without committing the transaction.
+
+        Args:
+            database (AsyncSession): database session;
+            paths (List[str]): paths to the content in the storage.
+
+        Returns:
+            List[Row]: usernames, unique identifiers, filepaths and sizes of the deleted files.
+        """
+        blob_digests = select(BlobsModel.digest).where(BlobsModel.path.in_(paths))
+        statement = delete(self._model).where(or_(
+            self._model.digest.is_(None) & self._model.filepath.in_(paths),
+            self._model.digest.in_(blob_digests)))
+        statement = statement.returning(self._model.username, self._model.id,
+                                        self._model.filepath, self._model.size)
+        results = await database.execute(statement=statement,
+                                         execution_options={'synchronize_session': False})
+        return results.all()
+
     async def read_many_by_username(self, database: AsyncSession,
                                     username: str) -> List[FilesModel]:
         """Returns list of files uploaded by a specific user.
@@ -27,6 +157,50 @@ class RepositoryFiles(RepositoryDB[FilesModel, FileCreate]):
         results = await database.execute(statement=statement)
         return results.scalars().all()
 
+    async def read_page_by_username(self, database: AsyncSession, username: str, limit: int,
+                                    cursor: Optional[int] = None,
+                                    prefix: Optional[str] = None) -> List[FilesModel]:
+        """Returns a page of files uploaded by a specific user. Files are ordered by their
+            identifiers, the page starts right after the cursor (keyset pagination).
+
+        Args:
+            database (AsyncSession): database session;
+            username (str): name of the user;
+            limit (int): max number of files in the page;
+            cursor (int, optional): identifier of the last file of the previous page.
+                Defaults to None;
+            prefix (str, optional): beginning of filepaths of the files. Defaults to None.
+
+        Returns:
+            List[FilesModel]: list of files containing information on their
+                unique identifiers and filepaths in the storage.
+        """
+        statement = select(self._model).where(self._model.username == username)
+        if cursor is not None:
+            statement = statement.where(self._model.id > cursor)
+        if prefix:
+            statement = statement.where(self._model.filepath.startswith(prefix, autoescape=True))
+        statement = statement.order_by(self._model.id).limit(limit)
+        results = await database.execute(statement=statement)
+        return results.scalars().all()
+
+    async def read_many_by_ids(self, database: AsyncSession, username: str,
+                               entity_ids: List[int]) -> List[FilesModel]:
+        """Returns files with specific unique identifiers uploaded by a specific user.
+
+        Args:
+            database (AsyncSession): database session;
+            username (str): name of the user;
+            entity_ids (List[int]): unique identifiers of the files.
+
+        Returns:
+            List[FilesModel]: list of found files ordered by their identifiers.
+        """
+        statement = select(self._model).where(self._model.username == username,
+                                              self._model.id.in_(entity_ids))
+        results = await database.execute(statement=statement.order_by(self._model.id))
+        return results.scalars().all()
+
     async def read_one_by_filepath(self, database: AsyncSession, username: str,
                                    filepath: str) -> Optional[FilesModel]:
         """Searches for a file with specific filepath and uploaded by a specific user.
@@ -62,4 +236,284 @@ class RepositoryFiles(RepositoryDB[FilesModel, FileCreate]):
         return results.scalar_one_or_none()
 
 
+class RepositoryBlobs(RepositoryDB[BlobsModel, BlobCreate]):
+    """Validation and work with the database for the Blobs model.
+
+    Reference changes lock blob rows until the end of the transaction, so an upload of
+    the same content waits for it and then either references the blob or, if the blob has been
+    released meanwhile, stores the content again under a new path. Rows are always locked
+    in the order of digests to avoid deadlocks.
+    """
+    async def acquire_many(self, database: AsyncSession, objs_in: List[BlobCreate]) -> List[Row]:
+        """Adds references to blobs without committing the transaction, unknown blobs are inserted.
+
+        Args:
+            database (AsyncSession): database session;
+            objs_in (List[BlobCreate]): blobs with distinct digests, their paths for the case
+                they are unknown and numbers of added references.
+
+        Returns:
+            List[Row]: digests and paths of the blobs, a path differs from the passed one
+                if the blob is already stored.
+        """
+        objs_in = sorted(objs_in, key=lambda obj_in: obj_in.digest)
+        statement = insert(self._model).values([jsonable_encoder(obj_in) for obj_in in objs_in])
+        statement = statement.on_conflict_do_update(
+            index_elements=[self._model.digest],
+            set_={'refcount': self._model.refcount + statement.excluded.refcount})
+        statement = statement.returning(self._model.digest, self._model.path)
+        results = await database.execute(statement=statement)
+        return results.all()
+
+    async def set_encodings(self, database: AsyncSession, encodings: Dict[str, str]) -> None:
+        """Records codecs of the stored content of blobs without committing the transaction.
+
+        Args:
+            database (AsyncSession): database session;
+            encodings (Dict[str, str]): codecs by digests of the blobs.
+        """
+        if not encodings:
+            return
+        rows = values(column('digest', String), column('encoding', String),
+                      name='encodings').data(sorted(encodings.items()))
+        statement = update(self._model).where(self._model.digest == rows.c.digest)
+        await database.execute(statement=statement.values(encoding=rows.c.encoding),
+                               execution_options={'synchronize_session': False})
+
+    async def delete_by_paths(self, database: AsyncSession, paths: List[str]) -> None:
+        """Deletes blobs stored under specific paths without committing the transaction.
+            Files referencing them are to be deleted by the caller.
+
+        Args:
+            database (AsyncSession): database session;
+            paths (List[str]): paths to the content in the storage.
+        """
+        statement = delete(self._model).where(self._model.path.in_(paths))
+        await database.execute(statement=statement,
+                               execution_options={'synchronize_session': False})
+
+    async def read_stored_paths(self, database: AsyncSession, after: Optional[str],
+                                limit: int, paths: Optional[List[str]] = None) -> List[str]:
+        """Returns a page of paths which content is expected in the storage under: paths
+            of blobs and filepaths of files stored as is. Paths are ordered in byte order
+            like storage listings, the page starts right after a path (keyset pagination).
+
+        Args:
+            database (AsyncSession): database session;
+            after (str, optional): last path of the previous page, None for the first page;
+            limit (int): max number of paths in the page;
+            paths (List[str], optional): paths to look for instead of all paths.
+                Defaults to None.
+
+        Returns:
+            List[str]: paths to the content in the storage.
+        """
+        selects = []
+        for path, conditions in ((self._model.path, []),
+                                 (FilesModel.filepath, [FilesModel.digest.is_(None)])):
+            path = path.collate('C')
+            statement = select(path.label('path')).where(*conditions)
+            if after is not None:
+                statement = statement.where(path > after)
+            if paths is not None:
+                statement = statement.where(path.in_(paths))
+            selects.append(statement.order_by(path).limit(limit).subquery().select())
+        statement = union_all(*selects).order_by('path').limit(limit)
+        results = await database.execute(statement=statement)
+        return results.scalars().all()
+
+    async def release_many(self, database: AsyncSession, digests: List[str]) -> List[str]:
+        """Removes references to blobs without committing the transaction, blobs left without
+            references are deleted. Their content is to be removed from the storage by
+            the caller after the commit.
+
+        Args:
+            database (AsyncSession): database session;
+            digests (List[str]): digests of the blobs, once per removed reference.
+
+        Returns:
+            List[str]: paths of the deleted blobs in the storage.
+        """
+        counts = Counter(digests)
+        if not counts:
+            return []
+        statement = select(self._model.digest).where(self._model.digest.in_(counts))
+        await database.execute(statement=statement.order_by(self._model.digest).with_for_update())
+        released = values(column('digest', String), column('count', Integer),
+                          name='released').data(sorted(counts.items()))
+        statement = update(self._model).where(self._model.digest == released.c.digest)
+        statement = statement.values(refcount=self._model.refcount - released.c.count)
+        await database.execute(statement=statement,
+                               execution_options={'synchronize_session': False})
+        statement = delete(self._model).where(self._model.digest.in_(counts),
+                                              self._model.refcount <= 0)
+        results = await database.execute(statement=statement.returning(self._model.path),
+                                         execution_options={'synchronize_session': False})
+        return results.scalars().all()
+
+
+class RepositoryUsage(RepositoryDB[UserUsageModel, StorageUsage]):
+    """Validation and work with the database for the UserUsage model.
+
+    Usage of a user is changed in the transaction creating or deleting their files, which locks
+    its row until the end of the transaction. It is changed before references to blobs,
+    so rows are always locked in the same order.
+    """
+    async def read_by_username(self, database: AsyncSession,
+                               username: str) -> Optional[UserUsageModel]:
+        """Returns storage usage of a user.
+
+        Args:
+            database (AsyncSession): database session;
+            username (str): name of the user.
+
+        Returns:
+            Optional[UserUsageModel]: database record of the usage, None if the user
+                has never stored files.
+        """
+        statement = select(self._model).where(self._model.username == username)
+        results = await database.execute(statement=statement)
+        return results.scalar_one_or_none()
+
+    async def add(self, database: AsyncSession, username: str, size: int, files: int) -> int:
+        """Changes storage usage of a user without committing the transaction.
+
+        Args:
+            database (AsyncSession): database session;
+            username (str): name of the user;
+            size (int): change of the total size of the user`s files in bytes,
+                negative for deleted files;
+            files (int): change of the number of the user`s files.
+
+        Returns:
+            int: new total size of the user`s files in bytes.
+        """
+        statement = insert(self._model).values(username=username, size=size, files=files)
+        statement = statement.on_conflict_do_update(
+            index_elements=[self._model.username],
+            set_={'size': self._model.size + statement.excluded.size,
+                  'files': self._model.files + statement.excluded.files})
+        results = await database.execute(statement=statement.returning(self._model.size))
+        return results.scalar_one()
+
+
+class RepositoryUploads(RepositoryDB[UploadSessionsModel, UploadSessionCreate]):
+    """Validation and work with the database for the UploadSessions model.
+
+    A part is recorded together with an update of the number of received bytes conditional
+    on its previous value, so of two requests sending the same chunk at once only one
+    advances the upload.
+    """
+    async def read_active(self, database: AsyncSession, username: str,
+                          upload_id: str) -> Optional[UploadSessionsModel]:
+        """Returns an upload of a user which has not expired.
+
+        Args:
+            database (AsyncSession): database session;
+            username (str): name of the user;
+            upload_id (str): unique identifier of the upload.
+
+        Returns:
+            Optional[UploadSessionsModel]: database record of the upload, None if it does not
+                exist or has expired.
+        """
+        statement = select(self._model).where(self._model.id == upload_id,
+                                              self._model.username == username,
+                                              self._model.expires_at > func.now())
+        results = await database.execute(statement=statement)
+        return results.scalar_one_or_none()
+
+    async def add_part(self, database: AsyncSession, upload_id: str, number: int, etag: str,
+                       size: int, received: int) -> Optional[Row]:
+        """Records an uploaded part and postpones expiration of the upload without
+            committing the transaction.
+
+        Args:
+            database (AsyncSession): database session;
+            upload_id (str): unique identifier of the upload;
+            number (int): part number;
+            etag (str): ETag of the part returned by the storage;
+            size (int): size of the part in bytes;
+            received (int): number of bytes received before the part.
+
+        Returns:
+            Optional[Row]: new number of received bytes and expiration time, None if
+                the upload has been advanced by another request or deleted.
+        """
+        expires_at = datetime.now(timezone.utc) + timedelta(
+            seconds=app_settings.upload_session_ttl)
+        statement = update(self._model).where(self._model.id == upload_id,
+                                              self._model.received == received)
+        statement = statement.values(received=self._model.received + size,
+                                     expires_at=expires_at)
+        results = await database.execute(
+            statement=statement.returning(self._model.received, self._model.expires_at))
+        session = results.one_or_none()
+        if session is None:
+            return None
+        statement = insert(UploadPartsModel).values(session_id=upload_id, number=number,
+                                                    etag=etag)
+        statement = statement.on_conflict_do_update(
+            index_elements=[UploadPartsModel.session_id, UploadPartsModel.number],
+            set_={'etag': statement.excluded.etag})
+        await database.execute(statement=statement)
+        return session
+
+    async def read_parts(self, database: AsyncSession, upload_id: str) -> List[Tuple[int, str]]:
+        """Returns uploaded parts of an upload.
+
+        Args:
+            database (AsyncSession): database session;
+            upload_id (str): unique identifier of the upload.
+
+        Returns:
+            List[Tuple[int, str]]: numbers and ETags of the parts ordered by number.
+        """
+        statement = select(UploadPartsModel.number, UploadPartsModel.etag).where(
+            UploadPartsModel.session_id == upload_id).order_by(UploadPartsModel.number)
+        results = await database.execute(statement=statement)
+        return [tuple(row) for row in results.all()]
+
+    async def delete_by_id(self, database: AsyncSession, upload_id: str) -> Optional[Row]:
+        """Deletes an upload with its parts without committing the transaction.
+
+        Args:
+            database (AsyncSession): database session;
+            upload_id (str): unique identifier of the upload.
+
+        Returns:
+            Optional[Row]: filepath and storage multipart upload identifier of the deleted
+                upload, None if it did not exist.
+        """
+        statement = delete(self._model).where(self._model.id == upload_id)
+        results = await database.execute(
+            statement=statement.returning(self._model.filepath, self._model.multipart_id))
+        return results.one_or_none()
+
+    async def delete_expired(self, database: AsyncSession, limit: int,
+                             username: Optional[str] = None) -> List[Row]:
+        """Deletes expired uploads with their parts without committing the transaction.
+            Uploads locked by other transactions are skipped.
+
+        Args:
+            database (AsyncSession): database session;
+            limit (int): max number of deleted uploads;
+            username (str, optional): delete uploads of this user only. Defaults to None.
+
+        Returns:
+            List[Row]: filepaths and storage multipart upload identifiers of the deleted uploads.
+        """
+        expired = select(self._model.id).where(self._model.expires_at <= func.now())
+        if username is not None:
+            expired = expired.where(self._model.username == username)
+        expired = expired.limit(limit).with_for_update(skip_locked=True)
+        statement = delete(self._model).where(self._model.id.in_(expired.scalar_subquery()))
+        results = await database.execute(
+            statement=statement.returning(self._model.filepath, self._model.multipart_id))
+        return results.all()
+
+
 files_crud = RepositoryFiles(FilesModel)
+blobs_crud = RepositoryBlobs(BlobsModel)
+usage_crud = RepositoryUsage(UserUsageModel)
+uploads_crud = RepositoryUploads(UploadSessionsModel)
@@ -0,0 +1,266 @@
+"""Contains background reconciliation of file records with the storage"""
+import asyncio
+from collections import defaultdict
+from contextlib import suppress
+from datetime import datetime, timedelta, timezone
+import logging
+from typing import AsyncIterator, Callable, Dict, List, Optional, Union
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.config import app_settings
+from db.db import async_session
+from services.file_cache import file_cache
+from services.file_storage import blobs_crud, files_crud, uploads_crud, usage_crud
+from storage.storage import storage_client
+
+
+logger = logging.getLogger(__name__)
+RECONCILE_LOCK_KEY = 5_318_008 # Postgres advisory lock held by the running reconciliation
+
+
+class Reconciler:
+    """Finds mismatches between file records and the storage by merging the ordered storage
+        listing with ordered stored paths of the records, page by page in constant memory.
+
+    Orphans are objects without records, e.g. left by failed commits or removals. Objects
+    younger than grace_period are skipped as they may belong to uploads being committed.
+    Missing objects are paths of records without objects, e.g. removed bypassing the API,
+    they are confirmed by a separate request before being reported. Mismatches are logged,
+    orphans are removed and records of missing objects are deleted if repair is enabled.
+    Expired resumable uploads are discarded on each run.
+
+    Paths are compared in batches of batch_size with batch_delay seconds between them,
+    and only one application worker reconciles at a time.
+
+    Args:
+        session_factory (Callable[[], AsyncSession]): creates database sessions;
+        interval (float): seconds between reconciliations, 0 disables background runs;
+        batch_size (int): number of paths compared per batch;
+        batch_delay (float): seconds between batches;
+        grace_period (float): seconds an object may exist without a record;
+        repair (bool): remove orphans and delete records of missing objects.
+    """
+    def __init__(self, session_factory: Callable[[], AsyncSession], interval: float,
+                 batch_size: int, batch_delay: float, grace_period: float,
+                 repair: bool) -> None:
+        self.session_factory = session_factory
+        self.interval = interval
+        self.batch_size = batch_size
+        self.batch_delay = batch_delay
+        self.grace_period = grace_period
+        self.repair = repair
+        self.last_run: Dict[str, Union[int, bool, datetime, None]] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    async def _stored_paths(self) -> AsyncIterator[str]:
+        """Yields stored paths of the records in byte order, reading them page by page"""
+        after = None
+        while True:
+            async with self.session_factory() as database:
+                page = await blobs_crud.read_stored_paths(database=database, after=after,
+                                                          limit=self.batch_size)
+            for path in page:
+                yield path
+            if len(page) < self.batch_size:
+                return
+            after = page[-1]
+
+    async def _remove_orphans(self, paths: List[str]) -> int:
+        """Removes orphans from the storage, skipping paths recorded since they were listed.
+
+        Args:
+            paths (List[str]): paths to the orphans in the storage.
+
+        Returns:
+            int: number of the removed orphans.
+        """
+        async with self.session_factory() as database:
+            recorded = set(await blobs_crud.read_stored_paths(
+                database=database, after=None, limit=len(paths), paths=paths))
+        paths = [path for path in paths if path not in recorded]
+        await storage_client.remove_files(paths)
+        return len(paths)
+
+    @staticmethod
+    async def _confirm_missing(paths: List[str]) -> List[str]:
+        """Checks paths not found in the storage listing with separate requests, objects may
+            have been uploaded after the listing was requested.
+
+        Args:
+            paths (List[str]): paths to the objects in the storage.
+
+        Returns:
+            List[str]: paths of the objects which do not exist.
+        """
+        async def exists(path: str) -> bool:
+            try:
+                await storage_client.stat_file(filepath=path)
+            except FileNotFoundError:
+                return False
+            return True
+
+        results = await asyncio.gather(*[exists(path) for path in paths])
+        return [path for path, found in zip(paths, results) if not found]
+
+    async def _delete_missing(self, paths: List[str]) -> int:
+        """Deletes records of files and blobs whose content is missing in the storage,
+            together with the usage of their owners.
+
+        Args:
+            paths (List[str]): paths to the missing content in the storage.
+
+        Returns:
+            int: number of the deleted files.
+        """
+        async with self.session_factory() as database:
+            file_db = await files_crud.delete_by_storage_paths(database=database, paths=paths)
+            usage = defaultdict(lambda: [0, 0])
+            for record in file_db:
+                usage[record.username][0] -= record.size or 0
+                usage[record.username][1] -= 1
+            for username in sorted(usage): # usage rows are locked in a stable order
+                await usage_crud.add(database=database, username=username,
+                                     size=usage[username][0], files=usage[username][1])
+            await blobs_crud.delete_by_paths(database=database, paths=paths)
+            changes = [(record.username, record.id, record.filepath) for record in file_db]
+            await file_cache.notify(database=database, changes=changes)
+            await database.commit()
+        file_cache.invalidate(changes)
+        return len(file_db)
+
+    async def _purge_uploads(self) -> int:
+        """Deletes expired resumable uploads and discards their uploaded parts.
+
+        Returns:
+            int: number of the purged uploads.
+        """
+        purged = 0
+        while True:
+            async with self.session_factory() as database:
+                expired = await uploads_crud.delete_expired(database=database,
+                                                            limit=self.batch_size)
+                await database.commit()
+            for filepath, multipart_id in expired:
+                with suppress(FileNotFoundError):
+                    await storage_client.abort_multipart(filepath, multipart_id)
+            purged += len(expired)
+            if len(expired) < self.batch_size:
+                return purged
+            await asyncio.sleep(self.batch_delay)
+
+    async def _flush(self, orphans: List[str], missing: List[str],
+                     stats: Dict[str, Union[int, bool, datetime, None]]) -> None:
+        """Reports and repairs mismatches found in a batch, the lists are emptied"""
+        if orphans:
+            logger.warning('Found %d orphan objects, e.g. %s', len(orphans), orphans[0])
+            stats['orphans'] += len(orphans)
+            if self.repair:
+                stats['orphans_removed'] += await self._remove_orphans(orphans)
+        if missing:
+            missing[:] = await self._confirm_missing(missing)
+        if missing:
+            logger.warning('Found %d records of missing objects, e.g. %s', len(missing),
+                           missing[0])
+            stats['missing'] += len(missing)
+            if self.repair:
+                stats['files_deleted'] += await self._delete_missing(missing)
+        orphans.clear()
+        missing.clear()
+
+    async def run(self) -> Optional[Dict[str, Union[int, bool, datetime, None]]]:
+        """Reconciles the records with the storage once.
+
+        Returns:
+            Optional[Dict[str, Union[int, bool, datetime, None]]]: statistics of the run,
+                None if another worker is reconciling.
+        """
+        async with self.session_factory() as lock_session:
+            # the lock is held by the connection without a transaction left open during
+            # the run, it is released explicitly or when the connection is closed
+            connection = await lock_session.connection(
+                execution_options={'isolation_level': 'AUTOCOMMIT'})
+            locked = await connection.execute(text('SELECT pg_try_advisory_lock(:key)'),
+                                              {'key': RECONCILE_LOCK_KEY})
+            if not locked.scalar():
+                return None
+            try:
+                return await self._reconcile()
+            finally:
+                await connection.execute(text('SELECT pg_advisory_unlock(:key)'),
+                                         {'key': RECONCILE_LOCK_KEY})
+
+    async def _reconcile(self) -> Dict[str, Union[int, bool, datetime, None]]:
+        """Compares the records with the storage while the lock is held.
+
+        Returns:
+            Dict[str, Union[int, bool, datetime, None]]: statistics of the run.
+        """
+        stats = {'started_at': datetime.now(timezone.utc), 'finished_at': None,
+                 'repair': self.repair, 'objects': 0, 'records': 0, 'orphans': 0,
+                 'orphans_removed': 0, 'missing': 0, 'files_deleted': 0,
+                 'uploads_expired': 0}
+        self.last_run = stats
+        stats['uploads_expired'] = await self._purge_uploads()
+        orphans: List[str] = []
+        missing: List[str] = []
+        recent = datetime.now(timezone.utc) - timedelta(seconds=self.grace_period)
+        objects = storage_client.list_files()
+        paths = self._stored_paths()
+        obj = await anext(objects, None)
+        path = await anext(paths, None)
+        compared = 0
+        while obj is not None or path is not None:
+            if path is None or (obj is not None and obj.filepath < path):
+                if obj.last_modified is None or obj.last_modified < recent:
+                    orphans.append(obj.filepath)
+                stats['objects'] += 1
+                obj = await anext(objects, None)
+            elif obj is None or path < obj.filepath:
+                missing.append(path)
+                stats['records'] += 1
+                path = await anext(paths, None)
+            else:
+                stats['objects'] += 1
+                stats['records'] += 1
+                obj = await anext(objects, None)
+                path = await anext(paths, None)
+            compared += 1
+            if compared % self.batch_size == 0:
+                await self._flush(orphans, missing, stats)
+                await asyncio.sleep(self.batch_delay)
+        await self._flush(orphans, missing, stats)
+        stats['finished_at'] = datetime.now(timezone.utc)
+        logger.info('Reconciliation finished: %s', stats)
+        return stats
+
+    async def _run_periodically(self) -> None:
+        """Reconciles every self.interval seconds"""
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.run()
+            except Exception: # pylint: disable=broad-except
+                logger.exception('Reconciliation failed')
+
+    def start(self) -> None:
+        """Starts reconciling in background if it is enabled"""
+        if self.interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self._run_periodically())
+
+    async def stop(self) -> None:
+        """Stops reconciling"""
+        if self._task is not None:
+            self._task.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+
+
+reconciler = Reconciler(session_factory=async_session,
+                        interval=app_settings.reconcile_interval,
+                        batch_size=app_settings.reconcile_batch_size,
+                        batch_delay=app_settings.reconcile_batch_delay,
+                        grace_period=app_settings.reconcile_grace_period,
+                        repair=app_settings.reconcile_repair)
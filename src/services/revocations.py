@@ -0,0 +1,108 @@
+"""Contains the list of revoked signed tokens shared by requests of an application worker"""
+import asyncio
+from contextlib import suppress
+import logging
+import time
+from typing import Callable, Dict, Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.config import app_settings
+from db.db import async_session
+from services.user import revoked_crud
+
+
+logger = logging.getLogger(__name__)
+
+
+class RevocationList:
+    """Unique identifiers of revoked signed tokens which have not expired yet, reloaded from
+        the database every interval seconds, so tokens are checked without querying it.
+
+    A token revoked by the worker is rejected at once, other workers reject it after their
+    next reload. Expired tokens are rejected by their claims and dropped from the list, so it
+    holds at most the tokens revoked during the token lifetime. The list is loaded on start,
+    or by the first check if it has not been loaded yet, and checks fail until it is.
+    If a reload fails the loaded list is kept.
+
+    Args:
+        session_factory (Callable[[], AsyncSession]): creates database sessions;
+        interval (float): seconds between reloads, 0 disables background reloads.
+    """
+    def __init__(self, session_factory: Callable[[], AsyncSession], interval: float) -> None:
+        self.session_factory = session_factory
+        self.interval = interval
+        self._revoked: Dict[str, float] = {} # Unix expiration times by unique identifier
+        self._loaded = False
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    def is_revoked(self, jti: str) -> bool:
+        """Checks if a token has been revoked.
+
+        Args:
+            jti (str): unique identifier of the token.
+
+        Returns:
+            bool: True if the token is in the list.
+        """
+        return jti in self._revoked
+
+    def add(self, jti: str, expires_at: float) -> None:
+        """Adds a token revoked by this worker to the list.
+
+        Args:
+            jti (str): unique identifier of the token;
+            expires_at (float): Unix time the token expires at.
+        """
+        self._revoked[jti] = expires_at
+
+    async def refresh(self) -> None:
+        """Reloads the list from the database and deletes records of expired tokens"""
+        async with self.session_factory() as database:
+            rows = await revoked_crud.read_active(database=database)
+            await revoked_crud.delete_expired(database=database)
+        now = time.time()
+        revoked = {jti: expires_at.timestamp() for jti, expires_at in rows}
+        # tokens revoked by this worker after the query started are kept
+        revoked.update((jti, expires_at) for jti, expires_at in self._revoked.items()
+                       if expires_at > now)
+        self._revoked = revoked
+        self._loaded = True
+
+    async def load(self) -> None:
+        """Loads the list unless it has been loaded, requests wait for a single query"""
+        if self._loaded:
+            return
+        async with self._lock:
+            if not self._loaded:
+                await self.refresh()
+
+    async def _refresh_periodically(self) -> None:
+        """Loads the list and reloads it every self.interval seconds"""
+        while True:
+            try:
+                await self.refresh()
+            except Exception: # pylint: disable=broad-except
+                logger.exception('Reloading revoked tokens failed')
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> None:
+        """Starts loading the list and reloading it in background, so it is usually loaded
+            before the first check"""
+        if self.interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self._refresh_periodically())
+
+    async def stop(self) -> None:
+        """Stops reloading the list"""
+        if self._task is not None:
+            self._task.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+
+
+# the list is not reloaded in background if signed tokens are not accepted
+revocation_list = RevocationList(session_factory=async_session,
+                                 interval=app_settings.token_revocation_refresh
+                                 if app_settings.token_signing_keys else 0.)
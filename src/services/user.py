@@ -1,12 +1,16 @@
 """Contains a class that implements validation and work with the database for the ShortURLs model"""
-from typing import Optional
+from datetime import datetime
+from typing import List, Optional
 
+from sqlalchemy import delete, func, Row
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 
 from services.base import RepositoryDB
-from models.models import Users as UsersModel, Tokens as TokensModel
-from schemas.user import TokenCreate, UserCreate
+from models.models import (RevokedTokens as RevokedTokensModel, Tokens as TokensModel,
+                           Users as UsersModel)
+from schemas.user import RevokedToken, TokenCreate, UserCreate
 
 
 class RepositoryUsers(RepositoryDB[UsersModel, UserCreate]):
@@ -57,6 +61,57 @@ class RepositoryTokens(RepositoryDB[TokensModel, TokenCreate]):
         results = await database.execute(statement=statement)
         return results.scalar_one_or_none()
 
+    async def delete_by_token(self, database: AsyncSession, token: str) -> None:
+        """Deletes an authentication token.
+
+        Args:
+            database (AsyncSession): database session;
+            token (str): authentication token.
+        """
+        statement = delete(self._model).where(self._model.token == token)
+        await database.execute(statement=statement)
+        await database.commit()
+
+
+class RepositoryRevokedTokens(RepositoryDB[RevokedTokensModel, RevokedToken]):
+    """Validation and work with the database for the RevokedTokens model"""
+    async def revoke(self, database: AsyncSession, jti: str, expires_at: datetime) -> None:
+        """Records a revoked signed token, revoking a token twice is not an error.
+
+        Args:
+            database (AsyncSession): database session;
+            jti (str): unique identifier of the token;
+            expires_at (datetime): expiration time of the token.
+        """
+        statement = insert(self._model).values(jti=jti, expires_at=expires_at)
+        await database.execute(statement=statement.on_conflict_do_nothing())
+        await database.commit()
+
+    async def read_active(self, database: AsyncSession) -> List[Row]:
+        """Returns revoked tokens which have not expired yet.
+
+        Args:
+            database (AsyncSession): database session.
+
+        Returns:
+            List[Row]: unique identifiers and expiration times of the tokens.
+        """
+        statement = select(self._model.jti, self._model.expires_at).where(
+            self._model.expires_at > func.now())
+        results = await database.execute(statement=statement)
+        return results.all()
+
+    async def delete_expired(self, database: AsyncSession) -> None:
+        """Deletes records of expired tokens, they are rejected without being listed.
+
+        Args:
+            database (AsyncSession): database session.
+        """
+        statement = delete(self._model).where(self._model.expires_at <= func.now())
+        await database.execute(statement=statement)
+        await database.commit()
+
 
 users_crud = RepositoryUsers(UsersModel)
 token_crud = RepositoryTokens(TokensModel)
+revoked_crud = RepositoryRevokedTokens(RevokedTokensModel)
@@ -0,0 +1,129 @@
+"""Contains streaming of zip archives built from storage files"""
+import asyncio
+from collections import deque
+from datetime import datetime, timezone
+from itertools import islice
+from typing import AsyncIterator, Deque, List, Optional, Tuple
+import zipfile
+
+from core.config import app_settings
+from storage.compression import decompress_stream
+from storage.storage import storage_client
+
+
+ZIP_EPOCH = datetime(1980, 1, 1, tzinfo=timezone.utc) # earliest time zip entries can hold
+
+
+class ArchiveBuffer:
+    """Write-only file object collecting zip output between yields"""
+    def __init__(self) -> None:
+        self._chunks: List[bytes] = []
+
+    def write(self, data: bytes) -> int:
+        """Collects written data.
+
+        Args:
+            data (bytes): data written by the zip writer.
+
+        Returns:
+            int: number of written bytes.
+        """
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        """Does nothing, data is kept until drained"""
+
+    def drain(self) -> bytes:
+        """Returns and forgets the collected data.
+
+        Returns:
+            bytes: data written since the previous call.
+        """
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+async def prefetch(filepath: str, encoding: Optional[str], queue: asyncio.Queue) -> None:
+    """Downloads a file from the storage into a bounded queue. None marks the end of the file,
+        a download error is passed through the queue as well.
+
+    Args:
+        filepath (str): path to the file in the storage;
+        encoding (str, optional): codec of the stored content, None if it is stored as is;
+        queue (asyncio.Queue): queue receiving chunks of the original file.
+    """
+    try:
+        chunks = await storage_client.download_stream(filepath=filepath)
+        if encoding is not None:
+            chunks = decompress_stream(chunks, encoding)
+        async for chunk in chunks:
+            await queue.put(chunk)
+    except Exception as exc: # pylint: disable=broad-except
+        await queue.put(exc)
+    else:
+        await queue.put(None)
+
+
+def zip_date_time(modified_at: Optional[datetime]) -> Tuple[int, int, int, int, int, int]:
+    """Converts a modification time into the date and time of a zip entry.
+
+    Args:
+        modified_at (datetime, optional): modification time of a file, None if it is unknown.
+
+    Returns:
+        Tuple[int, int, int, int, int, int]: year, month, day, hour, minute and second in UTC,
+            the zip epoch for unknown or earlier times.
+    """
+    if modified_at is None or modified_at < ZIP_EPOCH:
+        modified_at = ZIP_EPOCH
+    return modified_at.astimezone(timezone.utc).timetuple()[:6]
+
+
+async def stream_zip(members: List[Tuple[str, str, Optional[str], Optional[datetime]]]
+                     ) -> AsyncIterator[bytes]:
+    """Builds a zip archive of storage files on the fly. Files are stored without compression.
+
+    The next app_settings.archive_read_ahead files are downloaded concurrently while
+    the current one is written, each download buffers at most
+    app_settings.archive_queue_size chunks, so memory usage does not depend on file sizes.
+
+    Args:
+        members (List[Tuple[str, str, Optional[str], Optional[datetime]]]): names of files
+            in the archive, their paths in the storage, codecs of their stored content and
+            modification times, so the same files always make the same archive.
+
+    Yields:
+        bytes: next chunk of the archive.
+    """
+    buffer = ArchiveBuffer()
+    pending: Deque[Tuple[str, Optional[datetime], asyncio.Queue, asyncio.Task]] = deque()
+    remaining = iter(members)
+
+    def schedule() -> None:
+        # the file being written and the next files to read ahead
+        for arcname, filepath, encoding, modified_at in islice(
+                remaining, app_settings.archive_read_ahead + 1 - len(pending)):
+            queue = asyncio.Queue(maxsize=app_settings.archive_queue_size)
+            pending.append((arcname, modified_at, queue,
+                            asyncio.create_task(prefetch(filepath, encoding, queue))))
+
+    try:
+        with zipfile.ZipFile(buffer, mode='w', compression=zipfile.ZIP_STORED) as archive:
+            schedule()
+            while pending:
+                arcname, modified_at, queue, _ = pending[0]
+                schedule()
+                info = zipfile.ZipInfo(arcname, date_time=zip_date_time(modified_at))
+                with archive.open(info, mode='w', force_zip64=True) as member:
+                    while (chunk := await queue.get()) is not None:
+                        if isinstance(chunk, Exception):
+                            raise chunk
+                        member.write(chunk)
+                        yield buffer.drain()
+                pending.popleft()
+        yield buffer.drain()
+    finally:
+        for _, _, _, task in pending:
+            task.cancel()
@@ -0,0 +1,370 @@
+"""Contains the interface of storage backends"""
+from dataclasses import dataclass
+from datetime import datetime
+import hashlib
+from io import BytesIO
+from types import TracebackType
+from typing import AsyncIterator, BinaryIO, Dict, List, Optional, Tuple, Type
+import uuid
+
+from storage.cache import object_cache
+from storage.compression import Compressor
+
+
+BLOBS_DIRECTORY = 'blobs' # reserved, can not be used as a username
+
+
+class StorageError(OSError):
+    """Failure of a storage request. Missing files are reported with FileNotFoundError"""
+
+
+@dataclass
+class FileStat:
+    """Information about a file in the storage.
+
+    Args:
+        filepath (str): path to the file in the storage;
+        size (int): size of the stored content in bytes;
+        etag (str): identifier of the stored version of the file;
+        last_modified (datetime, optional): modification time of the file.
+    """
+    filepath: str
+    size: int
+    etag: str
+    last_modified: Optional[datetime]
+
+
+class Upload:
+    """Base class of streaming uploads of a file into the storage.
+
+    The upload is completed on a successful exit from the context manager and aborted on any
+    exception, including client disconnection. SHA-256 digest and size of the original content
+    are computed while it is written, before optional compression. Subclasses implement storing
+    of the (compressed) content.
+
+    Args:
+        filepath (str): path to the file in the storage;
+        compress (bool, optional): store compressible content compressed. Defaults to False.
+    """
+    def __init__(self, filepath: str, compress: bool = False) -> None:
+        self.filepath = filepath
+        self.size = 0
+        self._compressor = Compressor() if compress else None
+        self._hash = hashlib.sha256()
+        self._closed = False
+
+    @property
+    def digest(self) -> str:
+        """SHA-256 digest of the content written so far.
+
+        Returns:
+            str: hex digest.
+        """
+        return self._hash.hexdigest()
+
+    @property
+    def encoding(self) -> Optional[str]:
+        """Codec of the stored content, known after the first
+            app_settings.compression_sample_size bytes or the end of the content.
+
+        Returns:
+            Optional[str]: codec name, None if the content is stored as is.
+        """
+        return self._compressor.encoding if self._compressor is not None else None
+
+    async def __aenter__(self) -> 'Upload':
+        return self
+
+    async def __aexit__(self, exc_type: Optional[Type[BaseException]],
+                        exc: Optional[BaseException], traceback: Optional[TracebackType]) -> None:
+        if self._closed:
+            return
+        if exc_type is None:
+            await self.complete()
+        else:
+            await self.abort()
+
+    async def _write(self, data: bytes) -> None:
+        raise NotImplementedError
+
+    async def _complete(self) -> None:
+        raise NotImplementedError
+
+    async def _abort(self) -> None:
+        raise NotImplementedError
+
+    async def write(self, chunk: bytes) -> None:
+        """Appends a chunk of content.
+
+        Args:
+            chunk (bytes): next chunk of the uploaded file.
+        """
+        self._hash.update(chunk)
+        self.size += len(chunk)
+        await self._write(chunk if self._compressor is None else self._compressor.compress(chunk))
+
+    async def complete(self) -> None:
+        """Stores the rest of the content and makes the file visible in the storage"""
+        if self._compressor is not None:
+            await self._write(self._compressor.flush())
+        await self._complete()
+        object_cache.invalidate(self.filepath)
+        self._closed = True
+
+    async def abort(self) -> None:
+        """Discards the stored content"""
+        self._closed = True
+        await self._abort()
+
+
+class StorageBackend:
+    """Agreement which methods are implemented by storage backends.
+
+    Files are addressed by paths like 'dir/file'. Missing files are reported with
+    FileNotFoundError, other failures with StorageError or another OSError.
+    """
+    async def open(self) -> None:
+        """Opens connections or resources shared by requests"""
+        raise NotImplementedError
+
+    async def close(self) -> None:
+        """Releases connections or resources shared by requests"""
+        raise NotImplementedError
+
+    async def check(self) -> None:
+        """Checks if the storage is available.
+
+        Raises:
+            StorageError: if the storage is not available.
+        """
+        raise NotImplementedError
+
+    def pool_stats(self) -> Dict[str, int]:
+        """Returns statistics of connections or threads used for storage requests.
+
+        Returns:
+            Dict[str, int]: limits and numbers of connections in use and idle.
+        """
+        raise NotImplementedError
+
+    def upload_stream(self, filepath: str, compress: bool = False) -> Upload:
+        """Starts a streaming upload of a file into the storage.
+
+        Args:
+            filepath (str): path to the file in the storage;
+            compress (bool, optional): store compressible content compressed.
+                Defaults to False.
+
+        Returns:
+            Upload: async context manager accepting file content chunk by chunk.
+        """
+        raise NotImplementedError
+
+    async def upload_file(self, filepath: str, content: bytes) -> None:
+        """Uploads a file into the storage.
+
+        Args:
+            filepath (str): path to the file in the storage;
+            content (bytes): bytes content of the uploaded file.
+        """
+        raise NotImplementedError
+
+    async def create_multipart(self, filepath: str) -> str:
+        """Starts a multipart upload of a file, its parts can be uploaded by separate requests.
+
+        Args:
+            filepath (str): path to the file in the storage.
+
+        Returns:
+            str: identifier of the multipart upload.
+        """
+        raise NotImplementedError
+
+    async def upload_part(self, filepath: str, upload_id: str, number: int,
+                          content: bytes) -> str:
+        """Uploads a part of a multipart upload, replacing a part with the same number.
+
+        Args:
+            filepath (str): path to the file in the storage;
+            upload_id (str): identifier of the multipart upload;
+            number (int): part number starting with 1;
+            content (bytes): part content, all parts except the last one must be
+                at least 5 MiB for S3 storages.
+
+        Raises:
+            FileNotFoundError: if the multipart upload does not exist.
+
+        Returns:
+            str: ETag of the part.
+        """
+        raise NotImplementedError
+
+    async def complete_multipart(self, filepath: str, upload_id: str,
+                                 parts: List[Tuple[int, str]]) -> None:
+        """Joins uploaded parts into the file.
+
+        Args:
+            filepath (str): path to the file in the storage;
+            upload_id (str): identifier of the multipart upload;
+            parts (List[Tuple[int, str]]): numbers and ETags of the parts in order.
+
+        Raises:
+            FileNotFoundError: if the multipart upload does not exist.
+        """
+        raise NotImplementedError
+
+    async def abort_multipart(self, filepath: str, upload_id: str) -> None:
+        """Discards uploaded parts of a multipart upload.
+
+        Args:
+            filepath (str): path to the file in the storage;
+            upload_id (str): identifier of the multipart upload.
+        """
+        raise NotImplementedError
+
+    async def remove_files(self, filepaths: List[str]) -> None:
+        """Removes files from the storage. Failures are logged, files left in the storage
+            are not referenced any more and only take space.
+
+        Args:
+            filepaths (List[str]): paths to the files in the storage.
+        """
+        raise NotImplementedError
+
+    async def copy_files(self, copies: List[Tuple[str, str]]) -> None:
+        """Copies files inside the storage.
+
+        Args:
+            copies (List[Tuple[str, str]]): paths to the source and destination files.
+
+        Raises:
+            OSError: if a file failed to be copied, after the other copies are finished.
+        """
+        raise NotImplementedError
+
+    def list_files(self) -> AsyncIterator[FileStat]:
+        """Lists all files in the storage ordered by their paths (in UTF-8 byte order).
+            Files are read while they are consumed.
+
+        Returns:
+            AsyncIterator[FileStat]: information about each file.
+        """
+        raise NotImplementedError
+
+    async def stat_file(self, filepath: str) -> FileStat:
+        """Returns information about a file in the storage.
+
+        Args:
+            filepath (str): path to the file in the storage.
+
+        Returns:
+            FileStat: file information including its size, ETag and last modification time.
+        """
+        raise NotImplementedError
+
+    async def download_stream(self, filepath: str, offset: int = 0,
+                              length: int = 0) -> AsyncIterator[bytes]:
+        """Starts downloading a file or its byte range from the storage. The file is opened
+            before returning, so errors are raised here and not after the response headers
+            have been sent to a client.
+
+        Args:
+            filepath (str): path to the file in the storage;
+            offset (int, optional): start byte position. Defaults to 0;
+            length (int, optional): number of bytes from offset, 0 for the rest of the file.
+                Defaults to 0.
+
+        Returns:
+            AsyncIterator[bytes]: file content chunk by chunk.
+        """
+        raise NotImplementedError
+
+    async def read_file(self, filepath: str) -> bytes:
+        """Reads a whole file from the storage.
+
+        Args:
+            filepath (str): path to the file in the storage.
+
+        Returns:
+            bytes: content of the file.
+        """
+        raise NotImplementedError
+
+    async def open_local(self, filepath: str) -> Optional[BinaryIO]:
+        """Opens a file stored on the local disk, so it can be sent with sendfile.
+
+        Args:
+            filepath (str): path to the file in the storage.
+
+        Returns:
+            Optional[BinaryIO]: file opened for reading, None if the storage is not local.
+        """
+        return None
+
+    async def presigned_upload_url(self, filepath: str) -> str:
+        """Returns a short-lived URL a client can upload a file with directly into the storage.
+
+        Args:
+            filepath (str): path to the file in the storage.
+
+        Raises:
+            NotImplementedError: if the storage does not support presigned URLs.
+
+        Returns:
+            str: presigned PUT URL.
+        """
+        raise NotImplementedError('Presigned URLs are not supported by the storage')
+
+    async def presigned_download_url(self, filepath: str, filename: str,
+                                     encoding: Optional[str] = None) -> str:
+        """Returns a short-lived URL a client can download a file with directly from the storage.
+
+        Args:
+            filepath (str): path to the file in the storage;
+            filename (str): name of the downloaded file;
+            encoding (str, optional): codec of the stored content, sent as Content-Encoding.
+                Defaults to None.
+
+        Raises:
+            NotImplementedError: if the storage does not support presigned URLs.
+
+        Returns:
+            str: presigned GET URL.
+        """
+        raise NotImplementedError('Presigned URLs are not supported by the storage')
+
+    @staticmethod
+    def new_blob_path() -> str:
+        """Returns a unique path for content shared by files.
+
+        The path does not depend on the content, so an upload can be started before
+        the content digest is known, and content stored again after its blob has been released
+        never shares a path with the removed one.
+
+        Returns:
+            str: path to the content in the storage.
+        """
+        return f'{BLOBS_DIRECTORY}/{uuid.uuid4().hex}'
+
+    async def read_file_cached(self, filepath: str) -> bytes:
+        """Reads a whole file through the object cache, the file is read from the storage
+            only if it is not cached.
+
+        Args:
+            filepath (str): path to the file in the storage.
+
+        Returns:
+            bytes: content of the file.
+        """
+        return await object_cache.read(filepath, lambda: self.read_file(filepath))
+
+    async def download_file(self, filepath: str) -> BytesIO:
+        """Downloads a file from the storage.
+
+        Args:
+            filepath (str): path to the file in the storage.
+
+        Returns:
+            BytesIO: binary stream.
+        """
+        return BytesIO(await self.read_file(filepath))
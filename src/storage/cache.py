@@ -0,0 +1,300 @@
+"""Contains read-through cache of small storage objects"""
+import asyncio
+from collections import OrderedDict
+from contextlib import suppress
+import hashlib
+import os
+import shutil
+import tempfile
+from typing import Awaitable, Callable, Dict, List, Optional, Union
+
+from core.config import app_settings
+
+
+class CacheTier:
+    """Base class of object cache tiers evicting the least recently used objects when their
+        total size exceeds max_bytes. Subclasses implement reading, writing and removing content.
+
+    Args:
+        name (str): name of the tier in statistics;
+        max_bytes (int): max total size of cached objects in bytes.
+    """
+    def __init__(self, name: str, max_bytes: int) -> None:
+        self.name = name
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._sizes: OrderedDict[str, int] = OrderedDict()
+        self._writing: Dict[str, object] = {} # keys being written, by their write tokens
+
+    async def _read(self, key: str) -> bytes:
+        raise NotImplementedError
+
+    async def _write(self, key: str, content: bytes) -> None:
+        raise NotImplementedError
+
+    def _remove(self, key: str) -> None:
+        raise NotImplementedError
+
+    async def get(self, key: str) -> Optional[bytes]:
+        """Returns cached content and marks it as recently used.
+
+        Args:
+            key (str): path to the object in the storage.
+
+        Returns:
+            Optional[bytes]: cached content, None if the object is not cached.
+        """
+        if key not in self._sizes:
+            self.misses += 1
+            return None
+        self._sizes.move_to_end(key)
+        try:
+            content = await self._read(key)
+        except (KeyError, OSError): # removed while being read
+            self.invalidate(key)
+            self.misses += 1
+            return None
+        self.hits += 1
+        return content
+
+    async def set(self, key: str, content: bytes) -> None:
+        """Caches content, evicting the least recently used objects if the tier is full.
+
+        Args:
+            key (str): path to the object in the storage;
+            content (bytes): content of the object.
+        """
+        if len(content) > self.max_bytes:
+            return
+        self.invalidate(key)
+        token = self._writing[key] = object()
+        await self._write(key, content)
+        if self._writing.get(key) is not token:
+            if key not in self._writing: # invalidated while being written
+                self._remove(key)
+            return # or superseded by a later write
+        del self._writing[key]
+        self._sizes[key] = len(content)
+        self.size += len(content)
+        while self.size > self.max_bytes:
+            self.invalidate(next(iter(self._sizes)))
+
+    def invalidate(self, key: str) -> None:
+        """Removes an object from the tier.
+
+        Args:
+            key (str): path to the object in the storage.
+        """
+        self._writing.pop(key, None)
+        size = self._sizes.pop(key, None)
+        if size is not None:
+            self.size -= size
+            self._remove(key)
+
+    def clear(self) -> None:
+        """Removes all objects from the tier"""
+        for key in list(self._sizes):
+            self.invalidate(key)
+
+    def stats(self) -> Dict[str, Union[int, float]]:
+        """Returns tier statistics.
+
+        Returns:
+            Dict[str, Union[int, float]]: number of cached objects, their size and max size
+                in bytes, numbers of hits and misses and hit ratio.
+        """
+        lookups = self.hits + self.misses
+        return {'objects': len(self._sizes), 'size': self.size, 'max_size': self.max_bytes,
+                'hits': self.hits, 'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.}
+
+
+class MemoryTier(CacheTier):
+    """Object cache tier keeping content in the process memory"""
+    def __init__(self, max_bytes: int) -> None:
+        super().__init__('memory', max_bytes)
+        self._data: Dict[str, bytes] = {}
+
+    async def _read(self, key: str) -> bytes:
+        return self._data[key]
+
+    async def _write(self, key: str, content: bytes) -> None:
+        self._data[key] = content
+
+    def _remove(self, key: str) -> None:
+        self._data.pop(key, None)
+
+
+class DiskTier(CacheTier):
+    """Object cache tier keeping content in local files, repeated reads of hot objects are
+        served from the page cache.
+
+    Files are kept in a directory of the current process, created inside path on the first
+    write and removed by close().
+
+    Args:
+        path (str): directory for the cache files;
+        max_bytes (int): max total size of cached objects in bytes.
+    """
+    def __init__(self, path: str, max_bytes: int) -> None:
+        super().__init__('disk', max_bytes)
+        self.path = path
+        self.directory: Optional[str] = None
+
+    def _filename(self, key: str) -> str:
+        if self.directory is None:
+            os.makedirs(self.path, exist_ok=True)
+            self.directory = tempfile.mkdtemp(prefix='objects-', dir=self.path)
+        return os.path.join(self.directory, hashlib.sha256(key.encode()).hexdigest())
+
+    @staticmethod
+    def _read_file(filename: str) -> bytes:
+        with open(filename, 'rb') as file:
+            return file.read()
+
+    @staticmethod
+    def _write_file(filename: str, content: bytes) -> None:
+        with tempfile.NamedTemporaryFile(dir=os.path.dirname(filename), delete=False) as file:
+            file.write(content)
+        os.replace(file.name, filename) # readers never see partially written content
+
+    async def _read(self, key: str) -> bytes:
+        return await asyncio.to_thread(self._read_file, self._filename(key))
+
+    async def _write(self, key: str, content: bytes) -> None:
+        await asyncio.to_thread(self._write_file, self._filename(key), content)
+
+    def _remove(self, key: str) -> None:
+        if self.directory is None:
+            return
+        with suppress(FileNotFoundError):
+            os.remove(self._filename(key))
+
+    def close(self) -> None:
+        """Removes the cache directory"""
+        self._sizes.clear()
+        self.size = 0
+        if self.directory is not None:
+            shutil.rmtree(self.directory, ignore_errors=True)
+            self.directory = None
+
+
+class ObjectCache:
+    """Read-through cache of storage objects not larger than max_object_size bytes.
+
+    Tiers are looked up in order, content found in a lower tier is copied to the upper ones.
+    Concurrent misses of the same object share a single storage request.
+
+    Args:
+        tiers (List[CacheTier]): cache tiers, fastest first, no tiers disable the cache;
+        max_object_size (int): max size of cached objects in bytes.
+    """
+    def __init__(self, tiers: List[CacheTier], max_object_size: int) -> None:
+        self.tiers = tiers
+        self.max_object_size = max_object_size
+        self._loading: Dict[str, asyncio.Future] = {}
+
+    def fits(self, size: int) -> bool:
+        """Checks if an object of a specific size can be cached.
+
+        Args:
+            size (int): size of the object in bytes.
+
+        Returns:
+            bool: True if the object can be cached.
+        """
+        return bool(self.tiers) and size <= self.max_object_size
+
+    async def read(self, key: str, loader: Callable[[], Awaitable[bytes]]) -> bytes:
+        """Returns cached content of an object, loading it on a miss.
+
+        Args:
+            key (str): path to the object in the storage;
+            loader (Callable[[], Awaitable[bytes]]): coroutine function reading the object
+                from the storage.
+
+        Returns:
+            bytes: content of the object.
+        """
+        for index, tier in enumerate(self.tiers):
+            content = await tier.get(key)
+            if content is not None:
+                for upper_tier in self.tiers[:index]:
+                    await upper_tier.set(key, content)
+                return content
+        loading = self._loading.get(key)
+        if loading is not None:
+            try:
+                return await asyncio.shield(loading)
+            except asyncio.CancelledError:
+                if not loading.cancelled(): # this request is cancelled
+                    raise
+                return await loader()
+        future = asyncio.get_running_loop().create_future()
+        self._loading[key] = future
+        try:
+            content = await loader()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as exc:
+            future.set_exception(exc)
+            future.exception() # not reported as never retrieved if there are no waiters
+            raise
+        finally:
+            # content loaded before an invalidation of the object is not cached
+            valid = self._loading.get(key) is future
+            if valid:
+                del self._loading[key]
+        future.set_result(content)
+        if valid and len(content) <= self.max_object_size:
+            for tier in self.tiers:
+                await tier.set(key, content)
+        return content
+
+    def invalidate(self, key: str) -> None:
+        """Removes an object from all tiers, e.g. after it has been overwritten or removed.
+
+        Args:
+            key (str): path to the object in the storage.
+        """
+        self._loading.pop(key, None)
+        for tier in self.tiers:
+            tier.invalidate(key)
+
+    def stats(self) -> Dict[str, Dict[str, Union[int, float]]]:
+        """Returns statistics of the tiers.
+
+        Returns:
+            Dict[str, Dict[str, Union[int, float]]]: statistics of each tier by its name.
+        """
+        return {tier.name: tier.stats() for tier in self.tiers}
+
+    def close(self) -> None:
+        """Removes cached content"""
+        for tier in self.tiers:
+            if isinstance(tier, DiskTier):
+                tier.close()
+            else:
+                tier.clear()
+
+
+def create_object_cache() -> ObjectCache:
+    """Creates an object cache configured by application settings.
+
+    Returns:
+        ObjectCache: object cache, without tiers if caching is disabled.
+    """
+    tiers: List[CacheTier] = []
+    if app_settings.object_cache_max_object_size > 0:
+        if app_settings.object_cache_memory_size > 0:
+            tiers.append(MemoryTier(app_settings.object_cache_memory_size))
+        if app_settings.object_cache_disk_path and app_settings.object_cache_disk_size > 0:
+            tiers.append(DiskTier(app_settings.object_cache_disk_path,
+                                  app_settings.object_cache_disk_size))
+    return ObjectCache(tiers, app_settings.object_cache_max_object_size)
+
+
+object_cache = create_object_cache()
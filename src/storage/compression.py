@@ -0,0 +1,118 @@
+"""Contains compression of stored file content"""
+from typing import AsyncIterator, Optional
+
+import zstandard
+
+from core.config import app_settings
+
+
+ZSTD = 'zstd' # name of the codec, also used as the HTTP content coding
+
+
+class Compressor:
+    """Streaming zstd compressor skipping content which does not compress well,
+        e.g. media or archives.
+
+    The first app_settings.compression_sample_size bytes are buffered and compressed on their
+    own with the fastest level. If they do not shrink to app_settings.compression_min_ratio
+    of their size, the content is passed as is.
+    """
+    def __init__(self) -> None:
+        self.encoding: Optional[str] = None
+        self._sample: Optional[bytearray] = bytearray() # None after the decision
+        self._compressor: Optional[zstandard.ZstdCompressionObj] = None
+
+    def _decide(self) -> bytes:
+        """Decides whether the content is compressed.
+
+        Returns:
+            bytes: output for the buffered sample.
+        """
+        sample = bytes(self._sample)
+        self._sample = None
+        compressed_size = len(zstandard.ZstdCompressor(level=1).compress(sample))
+        if not sample or compressed_size > len(sample) * app_settings.compression_min_ratio:
+            return sample
+        self.encoding = ZSTD
+        self._compressor = zstandard.ZstdCompressor(
+            level=app_settings.compression_level).compressobj()
+        return self._compressor.compress(sample)
+
+    def compress(self, chunk: bytes) -> bytes:
+        """Compresses the next chunk of the content.
+
+        Args:
+            chunk (bytes): next chunk of the content.
+
+        Returns:
+            bytes: output to be stored, may be empty while data is buffered.
+        """
+        if self._sample is not None:
+            self._sample.extend(chunk)
+            if len(self._sample) < app_settings.compression_sample_size:
+                return b''
+            return self._decide()
+        return self._compressor.compress(chunk) if self._compressor is not None else chunk
+
+    def flush(self) -> bytes:
+        """Ends the content.
+
+        Returns:
+            bytes: rest of the output to be stored.
+        """
+        output = self._decide() if self._sample is not None else b''
+        if self._compressor is not None:
+            output += self._compressor.flush()
+        return output
+
+
+def decompress(content: bytes, encoding: str) -> bytes:
+    """Decompresses stored content.
+
+    Args:
+        content (bytes): stored content;
+        encoding (str): codec of the content.
+
+    Returns:
+        bytes: original content.
+    """
+    if encoding != ZSTD:
+        raise ValueError(f'Unknown encoding {encoding}')
+    # frames written by streaming compression do not contain the content size
+    return zstandard.ZstdDecompressor().decompressobj().decompress(content)
+
+
+async def decompress_stream(chunks: AsyncIterator[bytes], encoding: str, offset: int = 0,
+                            length: int = 0) -> AsyncIterator[bytes]:
+    """Decompresses stored content chunk by chunk. Compressed content can not be read from
+        an arbitrary position, so it is decompressed from the beginning and data before
+        offset is dropped.
+
+    Args:
+        chunks (AsyncIterator[bytes]): stored content;
+        encoding (str): codec of the content;
+        offset (int, optional): start byte position in the original content. Defaults to 0;
+        length (int, optional): number of bytes from offset, 0 for the rest of the content.
+            Defaults to 0.
+
+    Yields:
+        bytes: next chunk of the original content.
+    """
+    if encoding != ZSTD:
+        raise ValueError(f'Unknown encoding {encoding}')
+    decompressor = zstandard.ZstdDecompressor().decompressobj()
+    position = 0
+    end = offset + length if length else None
+    try:
+        async for chunk in chunks:
+            data = decompressor.decompress(chunk)
+            start, position = position, position + len(data)
+            if position <= offset:
+                continue
+            data = data[max(offset - start, 0):None if end is None else end - start]
+            if data:
+                yield data
+            if end is not None and position >= end:
+                break
+    finally:
+        await chunks.aclose() # returns the storage connection if the rest is not read
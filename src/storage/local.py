@@ -0,0 +1,522 @@
+"""Contains storage of files on the local disk"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+import logging
+import os
+import re
+import shutil
+import tempfile
+from typing import Any, AsyncIterator, BinaryIO, Callable, Dict, List, Optional, Tuple
+import uuid
+
+from core.config import app_settings
+from core.metrics import stage_timer
+from storage.base import FileStat, StorageBackend, StorageError, Upload
+from storage.cache import object_cache
+
+
+TEMP_DIRECTORY = '.tmp' # unfinished uploads and copies, not listed
+
+logger = logging.getLogger(__name__)
+
+
+class LocalUpload(Upload):
+    """Streams a file into a temporary file moved to its path on completion, so readers never
+        see partially written files. Content is buffered up to app_settings.storage_local_write_size
+        bytes and written with os.write on the storage thread pool.
+    """
+    def __init__(self, storage: 'LocalStorage', filepath: str, compress: bool = False) -> None:
+        super().__init__(filepath, compress=compress)
+        self.storage = storage
+        self._buffer = bytearray()
+        self._file: Optional[Tuple[int, str]] = None # descriptor and path of the temporary file
+
+    async def _flush(self) -> None:
+        """Writes the buffered content into the temporary file, creating it if needed"""
+        if self._file is None:
+            self._file = await self.storage.run(self.storage.create_temp_file)
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        await self.storage.run(write_all, self._file[0], data)
+
+    async def _write(self, data: bytes) -> None:
+        self._buffer.extend(data)
+        if len(self._buffer) >= app_settings.storage_local_write_size:
+            await self._flush()
+
+    async def _complete(self) -> None:
+        await self._flush()
+        descriptor, temp_path = self._file
+        self._file = None
+        await self.storage.run(self.storage.commit_temp_file, descriptor, temp_path,
+                               self.filepath)
+
+    async def _abort(self) -> None:
+        self._buffer.clear()
+        if self._file is not None:
+            descriptor, temp_path = self._file
+            self._file = None
+            await self.storage.run(discard_temp_file, descriptor, temp_path)
+
+
+def write_all(descriptor: int, data: bytes) -> None:
+    """Writes data into a file, os.write may write only a part of it at once.
+
+    Args:
+        descriptor (int): descriptor of the file;
+        data (bytes): data to be written.
+    """
+    view = memoryview(data)
+    while view:
+        view = view[os.write(descriptor, view):]
+
+
+def discard_temp_file(descriptor: int, temp_path: str) -> None:
+    """Closes and removes a temporary file.
+
+    Args:
+        descriptor (int): descriptor of the file;
+        temp_path (str): path to the file.
+    """
+    os.close(descriptor)
+    os.remove(temp_path)
+
+
+class LocalStorage(StorageBackend):
+    """Storage keeping files in a local directory, for single-node deployments and tests.
+
+    Blocking file operations run on a dedicated thread pool. Downloads of whole files
+    and byte ranges can be sent with sendfile by the web server, see open_local().
+    Presigned URLs are not supported. A path can not be both a file and a directory
+    as it can in S3, which does not happen to content stored by its digest.
+
+    Args:
+        root (str): directory of the files;
+        threads (int): number of threads doing file operations.
+    """
+    def __init__(self, root: str, threads: int) -> None:
+        self.root = os.path.abspath(root)
+        self.threads = threads
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._in_use = 0
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        """Thread pool, created on first use if the application lifespan was not run
+            (e.g. in tests).
+
+        Returns:
+            ThreadPoolExecutor: thread pool doing file operations.
+        """
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.threads,
+                                                thread_name_prefix='local-storage')
+        return self._executor
+
+    async def run(self, function: Callable[..., Any], *args: Any) -> Any:
+        """Runs a blocking file operation on the thread pool.
+
+        Args:
+            function (Callable[..., Any]): file operation;
+            *args (Any): its arguments.
+
+        Returns:
+            Any: result of the operation.
+        """
+        self._in_use += 1
+        try:
+            with stage_timer('storage'):
+                return await asyncio.get_running_loop().run_in_executor(self.executor,
+                                                                        function, *args)
+        finally:
+            self._in_use -= 1
+
+    def path(self, filepath: str) -> str:
+        """Returns the local path of a file in the storage.
+
+        Args:
+            filepath (str): path to the file in the storage.
+
+        Raises:
+            StorageError: if the path is not a plain relative path.
+
+        Returns:
+            str: path to the file on the disk.
+        """
+        parts = filepath.split('/')
+        if parts[0] == TEMP_DIRECTORY or any(part in ('', '.', '..') for part in parts):
+            raise StorageError(f'Invalid path {filepath}')
+        return os.path.join(self.root, filepath)
+
+    def create_temp_file(self) -> Tuple[int, str]:
+        """Creates a temporary file for content being written.
+
+        Returns:
+            Tuple[int, str]: descriptor of the file opened for writing and its path.
+        """
+        directory = os.path.join(self.root, TEMP_DIRECTORY)
+        os.makedirs(directory, exist_ok=True)
+        return tempfile.mkstemp(dir=directory)
+
+    def commit_temp_file(self, descriptor: int, temp_path: str, filepath: str) -> None:
+        """Flushes a written temporary file to the disk and moves it to its path.
+
+        Args:
+            descriptor (int): descriptor of the file;
+            temp_path (str): path to the temporary file;
+            filepath (str): path to the file in the storage.
+        """
+        try:
+            os.fsync(descriptor)
+        finally:
+            os.close(descriptor)
+        path = self.path(filepath)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(temp_path, path)
+
+    async def open(self) -> None:
+        """Creates the root directory"""
+        await self.run(os.makedirs, self.root, 0o777, True)
+
+    async def close(self) -> None:
+        """Waits for running file operations and shuts the thread pool down"""
+        if self._executor is not None:
+            executor, self._executor = self._executor, None
+            await asyncio.to_thread(executor.shutdown)
+
+    async def check(self) -> None:
+        """Checks if the root directory is writable.
+
+        Raises:
+            StorageError: if the directory does not exist or is not writable.
+        """
+        if not await self.run(os.access, self.root, os.W_OK):
+            raise StorageError(f'Directory {self.root} is not writable')
+
+    def pool_stats(self) -> Dict[str, int]:
+        """Returns thread pool statistics.
+
+        Returns:
+            Dict[str, int]: number of threads and numbers of threads busy and idle.
+        """
+        in_use = min(self._in_use, self.threads)
+        return {'limit': self.threads, 'limit_per_host': 0, 'in_use': in_use,
+                'idle': self.threads - in_use}
+
+    def upload_stream(self, filepath: str, compress: bool = False) -> LocalUpload:
+        """Starts a streaming upload of a file into the storage.
+
+        Args:
+            filepath (str): path to the file in the storage;
+            compress (bool, optional): store compressible content compressed.
+                Defaults to False.
+
+        Returns:
+            LocalUpload: async context manager accepting file content chunk by chunk.
+        """
+        return LocalUpload(self, filepath, compress=compress)
+
+    async def upload_file(self, filepath: str, content: bytes) -> None:
+        """Uploads a file into the storage.
+
+        Args:
+            filepath (str): path to the file in the storage;
+            content (bytes): bytes content of the uploaded file.
+        """
+        async with self.upload_stream(filepath) as upload:
+            await upload.write(content)
+
+    def _parts_directory(self, upload_id: str) -> str:
+        """Returns the directory keeping parts of a multipart upload.
+
+        Args:
+            upload_id (str): identifier of the multipart upload.
+
+        Raises:
+            FileNotFoundError: if the identifier is not one generated by the storage.
+
+        Returns:
+            str: path to the directory on the disk.
+        """
+        if not re.fullmatch('[0-9a-f]{32}', upload_id):
+            raise FileNotFoundError(upload_id)
+        return os.path.join(self.root, TEMP_DIRECTORY, 'uploads', upload_id)
+
+    async def create_multipart(self, filepath: str) -> str:
+        """Starts a multipart upload of a file, its parts are kept in a temporary directory.
+
+        Args:
+            filepath (str): path to the file in the storage.
+
+        Returns:
+            str: identifier of the multipart upload.
+        """
+        self.path(filepath)
+        upload_id = uuid.uuid4().hex
+        await self.run(os.makedirs, self._parts_directory(upload_id))
+        return upload_id
+
+    def _write_part(self, directory: str, number: int, content: bytes) -> str:
+        if not os.path.isdir(directory):
+            raise FileNotFoundError(directory)
+        descriptor, temp_path = self.create_temp_file()
+        try:
+            try:
+                write_all(descriptor, content)
+                stat_result = os.fstat(descriptor)
+            finally:
+                os.close(descriptor)
+            os.replace(temp_path, os.path.join(directory, str(number)))
+        except OSError: # e.g. the upload was aborted meanwhile
+            os.remove(temp_path)
+            raise
+        return self._etag(stat_result)
+
+    async def upload_part(self, filepath: str, upload_id: str, number: int,
+                          content: bytes) -> str:
+        """Uploads a part of a multipart upload, replacing a part with the same number.
+
+        Args:
+            filepath (str): path to the file in the storage;
+            upload_id (str): identifier of the multipart upload;
+            number (int): part number starting with 1;
+            content (bytes): part content.
+
+        Raises:
+            FileNotFoundError: if the multipart upload does not exist.
+
+        Returns:
+            str: ETag of the part.
+        """
+        return await self.run(self._write_part, self._parts_directory(upload_id), number,
+                              content)
+
+    def _join_parts(self, directory: str, filepath: str, parts: List[Tuple[int, str]]) -> None:
+        descriptor, temp_path = self.create_temp_file()
+        try:
+            with open(descriptor, 'wb') as file:
+                for number, etag in parts:
+                    with open(os.path.join(directory, str(number)), 'rb') as part:
+                        if self._etag(os.fstat(part.fileno())) != etag:
+                            raise StorageError(f'Part {number} of {filepath} has changed')
+                        shutil.copyfileobj(part, file)
+                file.flush()
+                os.fsync(file.fileno())
+            path = self.path(filepath)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(temp_path, path)
+        except OSError:
+            os.remove(temp_path)
+            raise
+        shutil.rmtree(directory, ignore_errors=True)
+
+    async def complete_multipart(self, filepath: str, upload_id: str,
+                                 parts: List[Tuple[int, str]]) -> None:
+        """Joins uploaded parts into the file.
+
+        Args:
+            filepath (str): path to the file in the storage;
+            upload_id (str): identifier of the multipart upload;
+            parts (List[Tuple[int, str]]): numbers and ETags of the parts in order.
+
+        Raises:
+            FileNotFoundError: if the multipart upload or one of the parts does not exist;
+            StorageError: if a part has been replaced since its ETag was returned.
+        """
+        await self.run(self._join_parts, self._parts_directory(upload_id), filepath, parts)
+        object_cache.invalidate(filepath)
+
+    async def abort_multipart(self, filepath: str, upload_id: str) -> None:
+        """Discards uploaded parts of a multipart upload.
+
+        Args:
+            filepath (str): path to the file in the storage;
+            upload_id (str): identifier of the multipart upload.
+        """
+        await self.run(shutil.rmtree, self._parts_directory(upload_id), True)
+
+    def _remove_all(self, filepaths: List[str]) -> None:
+        for filepath in filepaths:
+            try:
+                os.remove(self.path(filepath))
+            except FileNotFoundError:
+                pass
+            except OSError:
+                logger.warning('Failed to remove %s', filepath, exc_info=True)
+
+    async def remove_files(self, filepaths: List[str]) -> None:
+        """Removes files from the storage. Failures are logged, files left in the storage
+            are not referenced any more and only take space.
+
+        Args:
+            filepaths (List[str]): paths to the files in the storage.
+        """
+        for filepath in filepaths:
+            object_cache.invalidate(filepath)
+        await self.run(self._remove_all, filepaths)
+
+    def _copy(self, source: str, destination: str) -> None:
+        descriptor, temp_path = self.create_temp_file()
+        os.close(descriptor)
+        try:
+            shutil.copyfile(self.path(source), temp_path) # with sendfile on Linux
+            path = self.path(destination)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(temp_path, path)
+        except OSError:
+            os.remove(temp_path)
+            raise
+
+    async def copy_files(self, copies: List[Tuple[str, str]]) -> None:
+        """Copies files inside the storage on the thread pool.
+
+        Args:
+            copies (List[Tuple[str, str]]): paths to the source and destination files.
+
+        Raises:
+            OSError: if a file failed to be copied, after the other copies are finished.
+        """
+        async def copy(source: str, destination: str) -> None:
+            await self.run(self._copy, source, destination)
+            object_cache.invalidate(destination)
+
+        results = await asyncio.gather(*[copy(source, destination)
+                                         for source, destination in copies],
+                                       return_exceptions=True)
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+
+    def _scan(self, directory: str) -> List[Tuple[str, bool, Optional[os.stat_result]]]:
+        """Returns entries of a directory ordered like the paths of the files in them.
+
+        Args:
+            directory (str): path to the directory in the storage, '' for the root.
+
+        Returns:
+            List[Tuple[str, bool, Optional[os.stat_result]]]: paths of the entries in
+                the storage, whether they are directories and stat results of files.
+        """
+        entries = []
+        with os.scandir(os.path.join(self.root, directory)) as scanner:
+            for entry in scanner:
+                if not directory and entry.name == TEMP_DIRECTORY:
+                    continue
+                path = f'{directory}/{entry.name}' if directory else entry.name
+                if entry.is_dir(follow_symlinks=False):
+                    # files of a directory 'a' are listed as 'a/...', after a file 'a-b'
+                    entries.append((f'{entry.name}/', path, True, None))
+                elif entry.is_file(follow_symlinks=False):
+                    entries.append((entry.name, path, False, entry.stat(follow_symlinks=False)))
+        entries.sort()
+        return [entry[1:] for entry in entries]
+
+    @staticmethod
+    def _etag(stat_result: os.stat_result) -> str:
+        return f'{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}'
+
+    def _file_stat(self, filepath: str, stat_result: os.stat_result) -> FileStat:
+        return FileStat(filepath=filepath, size=stat_result.st_size,
+                        etag=self._etag(stat_result),
+                        last_modified=datetime.fromtimestamp(stat_result.st_mtime, timezone.utc))
+
+    async def list_files(self) -> AsyncIterator[FileStat]:
+        """Lists all files in the storage ordered by their paths (in UTF-8 byte order).
+            Directories are read while the files are consumed.
+
+        Yields:
+            FileStat: information about the next file including its path, size and
+                last modification time.
+        """
+        if not await self.run(os.path.isdir, self.root):
+            return
+        stack = [iter(await self.run(self._scan, ''))]
+        while stack:
+            entry = next(stack[-1], None)
+            if entry is None:
+                stack.pop()
+                continue
+            path, is_directory, stat_result = entry
+            if is_directory:
+                stack.append(iter(await self.run(self._scan, path)))
+            else:
+                yield self._file_stat(path, stat_result)
+
+    async def stat_file(self, filepath: str) -> FileStat:
+        """Returns information about a file in the storage.
+
+        Args:
+            filepath (str): path to the file in the storage.
+
+        Returns:
+            FileStat: file information including its size, ETag and last modification time.
+        """
+        return self._file_stat(filepath, await self.run(os.stat, self.path(filepath)))
+
+    async def download_stream(self, filepath: str, offset: int = 0,
+                              length: int = 0) -> AsyncIterator[bytes]:
+        """Opens a file or its byte range for reading chunk by chunk on the thread pool.
+
+        Args:
+            filepath (str): path to the file in the storage;
+            offset (int, optional): start byte position. Defaults to 0;
+            length (int, optional): number of bytes from offset, 0 for the rest of the file.
+                Defaults to 0.
+
+        Returns:
+            AsyncIterator[bytes]: file content chunk by chunk.
+        """
+        file = await self.run(open, self.path(filepath), 'rb')
+        return self._relay(file, offset, length)
+
+    async def _relay(self, file: BinaryIO, offset: int, length: int) -> AsyncIterator[bytes]:
+        """Yields chunks of an open file and closes it afterwards.
+
+        Args:
+            file (BinaryIO): file opened for reading;
+            offset (int): start byte position;
+            length (int): number of bytes from offset, 0 for the rest of the file.
+
+        Yields:
+            bytes: next chunk of the file.
+        """
+        try:
+            position, end = offset, offset + length if length else None
+            while end is None or position < end:
+                size = app_settings.download_chunk_size
+                if end is not None:
+                    size = min(size, end - position)
+                chunk = await self.run(os.pread, file.fileno(), size, position)
+                if not chunk:
+                    return
+                position += len(chunk)
+                yield chunk
+        finally:
+            file.close()
+
+    async def read_file(self, filepath: str) -> bytes:
+        """Reads a whole file from the storage.
+
+        Args:
+            filepath (str): path to the file in the storage.
+
+        Returns:
+            bytes: content of the file.
+        """
+        def read(path: str) -> bytes:
+            with open(path, 'rb') as file:
+                return file.read()
+
+        return await self.run(read, self.path(filepath))
+
+    async def open_local(self, filepath: str) -> Optional[BinaryIO]:
+        """Opens a file for sending it with sendfile.
+
+        Args:
+            filepath (str): path to the file in the storage.
+
+        Returns:
+            Optional[BinaryIO]: file opened for reading.
+        """
+        return await self.run(open, self.path(filepath), 'rb')
@@ -1,34 +1,209 @@
-"""Contains storage client"""
+"""Contains storage clients"""
+import asyncio
+from contextlib import contextmanager
+from datetime import timedelta
 from io import BytesIO
-import os
+import logging
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Tuple
 
 import aiohttp
 from miniopy_async import Minio
-from miniopy_async.error import MinioException
+from miniopy_async.commonconfig import CopySource
+from miniopy_async.datatypes import Part
+from miniopy_async.deleteobjects import DeleteObject
+from miniopy_async.error import MinioException, S3Error
 
+from core.config import app_settings
+from core.metrics import stage_timer
+from storage.base import FileStat, StorageBackend, StorageError, Upload
+from storage.cache import object_cache
+from storage.local import LocalStorage
 
-MINIO_BUCKET = os.environ['MINIO_BUCKET_NAME']
-MINIO_PORT = os.environ['MINIO_PORT']
-MINIO_ROOT_USER = os.environ['MINIO_ROOT_USER']
-MINIO_ROOT_PASSWORD = os.environ['MINIO_ROOT_PASSWORD']
 
+REMOVE_BATCH_SIZE = 1000 # max number of objects in a single delete request
+NOT_FOUND_CODES = ('NoSuchKey', 'NoSuchUpload', 'ResourceNotFound')
 
-class MinioClient:
-    """MinIO storage client"""
+logger = logging.getLogger(__name__)
+
+
+@contextmanager
+def translate_errors(filepath: Optional[str] = None) -> Iterator[None]:
+    """Raises storage errors of MinIO requests as exceptions of the storage interface.
+
+    Args:
+        filepath (str, optional): path to the requested file. Defaults to None.
+
+    Raises:
+        FileNotFoundError: if the requested file does not exist;
+        StorageError: if the request failed.
+    """
+    try:
+        yield
+    except S3Error as exc:
+        if exc.code in NOT_FOUND_CODES:
+            raise FileNotFoundError(filepath) from exc
+        raise StorageError(str(exc)) from exc
+    except (MinioException, aiohttp.ClientError) as exc:
+        raise StorageError(str(exc)) from exc
+
+
+class MultipartUpload(Upload):
+    """Streams a file into the storage as S3 multipart parts.
+
+    At most one part is kept in memory. Content smaller than one part is uploaded with
+    a single PUT request.
+    """
+    def __init__(self, client: 'MinioClient', filepath: str, part_size: int,
+                 compress: bool = False) -> None:
+        super().__init__(filepath, compress=compress)
+        self.client = client
+        self.part_size = part_size
+        self._buffer = bytearray()
+        self._upload_id: Optional[str] = None
+        self._parts: List[Tuple[int, str]] = []
+
+    async def _write(self, data: bytes) -> None:
+        """Buffers content, sending full parts to the storage"""
+        self._buffer.extend(data)
+        while len(self._buffer) >= self.part_size:
+            part = bytes(self._buffer[:self.part_size])
+            del self._buffer[:self.part_size]
+            await self._upload_part(part)
+
+    async def _upload_part(self, part: bytes) -> None:
+        """Uploads the next part, starting a multipart upload if needed.
+
+        Args:
+            part (bytes): part content.
+        """
+        if self._upload_id is None:
+            self._upload_id = await self.client.create_multipart(self.filepath)
+        part_number = len(self._parts) + 1
+        etag = await self.client.upload_part(self.filepath, self._upload_id, part_number, part)
+        self._parts.append((part_number, etag))
+
+    async def _complete(self) -> None:
+        """Sends the rest of the content and completes the multipart upload"""
+        if self._upload_id is None:
+            content = BytesIO(bytes(self._buffer))
+            with translate_errors(self.filepath):
+                await self.client.minio.put_object(bucket_name=self.client.bucket,
+                                                   object_name=self.filepath, data=content,
+                                                   length=len(self._buffer))
+        else:
+            if self._buffer:
+                await self._upload_part(bytes(self._buffer))
+            await self.client.complete_multipart(self.filepath, self._upload_id, self._parts)
+        self._buffer.clear()
+
+    async def _abort(self) -> None:
+        """Discards the uploaded parts. Content smaller than one part is never sent"""
+        self._buffer.clear()
+        if self._upload_id is not None:
+            await self.client.abort_multipart(self.filepath, self._upload_id)
+            self._upload_id = None
+
+
+class PooledMinio(Minio):
+    """MinIO API client sending all requests through a shared connection pool.
+
+    miniopy_async opens a new aiohttp session for most of the requests, so the underlying
+    HTTP call is redirected to the session provided by the storage client instead.
+    """
+    def __init__(self, *args, storage: 'MinioClient', **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self._storage = storage
+
+    async def _url_open(self, method, region, bucket_name=None, object_name=None, body=None,
+                        headers=None, query_params=None, session=None):
+        with stage_timer('storage'):
+            return await super()._url_open(method, region, bucket_name=bucket_name,
+                                           object_name=object_name, body=body, headers=headers,
+                                           query_params=query_params,
+                                           session=self._storage.session)
+
+
+class MinioClient(StorageBackend):
+    """MinIO storage client. Connections to the storage are kept in a pool shared by all
+        requests, the pool is opened on application startup and closed on shutdown.
+    """
     def __init__(self) -> None:
-        self.minio = Minio(f'minio:{MINIO_PORT}', access_key=MINIO_ROOT_USER,
-                           secret_key=MINIO_ROOT_PASSWORD, secure=False)
-        self.bucket = MINIO_BUCKET
+        self.minio = PooledMinio(f'{app_settings.minio_host}:{app_settings.minio_port}',
+                                 access_key=app_settings.minio_root_user,
+                                 secret_key=app_settings.minio_root_password, secure=False,
+                                 region=app_settings.storage_region, storage=self)
+        self.bucket = app_settings.minio_bucket_name
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    async def open(self) -> None:
+        """Opens the connection pool"""
+        if self._session is None or self._session.closed:
+            self._session = self._create_session()
+
+    async def close(self) -> None:
+        """Closes the connection pool"""
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        """Shared session, opened on first use if the application lifespan was not run
+            (e.g. in tests).
+
+        Returns:
+            aiohttp.ClientSession: session holding the connection pool.
+        """
+        if self._session is None or self._session.closed:
+            self._session = self._create_session()
+        return self._session
+
+    @staticmethod
+    def _create_session() -> aiohttp.ClientSession:
+        """Creates a session with a connection pool configured by application settings.
+
+        Returns:
+            aiohttp.ClientSession: new session.
+        """
+        connector = aiohttp.TCPConnector(limit=app_settings.storage_pool_size,
+                                         limit_per_host=app_settings.storage_pool_size_per_host,
+                                         keepalive_timeout=app_settings.storage_keepalive_timeout)
+        return aiohttp.ClientSession(connector=connector)
+
+    def pool_stats(self) -> Dict[str, int]:
+        """Returns connection pool statistics.
+
+        Connection counts are read from private attributes of the aiohttp connector, which
+        are not a stable API, a count is -1 if the installed aiohttp does not have them.
 
-    async def check_bucket(self) -> None:
+        Returns:
+            Dict[str, int]: pool limits and numbers of connections in use and idle.
+        """
+        stats = {'limit': app_settings.storage_pool_size,
+                 'limit_per_host': app_settings.storage_pool_size_per_host,
+                 'in_use': 0, 'idle': 0}
+        if self._session is not None and not self._session.closed:
+            connector = self._session.connector
+            acquired = getattr(connector, '_acquired', None)
+            conns = getattr(connector, '_conns', None)
+            try:
+                stats['in_use'] = len(acquired) if acquired is not None else -1
+                stats['idle'] = sum(len(idle) for idle in conns.values()) \
+                    if conns is not None else -1
+            except (AttributeError, TypeError): # the attributes have changed their types
+                stats['in_use'] = stats['idle'] = -1
+        return stats
+
+    async def check(self) -> None:
         """Checks if self.bucket exists.
 
         Raises:
-            MinioException: if self.bucket does not exist.
+            StorageError: if self.bucket does not exist.
         """
-        result = await self.minio.bucket_exists(self.bucket)
+        with translate_errors():
+            result = await self.minio.bucket_exists(self.bucket)
         if not result:
-            raise MinioException(f'Bucket {self.bucket} does not exist')
+            raise StorageError(f'Bucket {self.bucket} does not exist')
 
     async def upload_file(self, filepath: str, content: bytes) -> None:
         """Uploads a file into the storage.
@@ -38,20 +213,273 @@ class MinioClient:
             content (bytes): bytes content of the uploaded file.
         """
         content = BytesIO(content)
-        await self.minio.put_object(bucket_name=self.bucket, object_name=filepath,
-                                    data=content, length=content.getbuffer().nbytes)
+        with translate_errors(filepath):
+            await self.minio.put_object(bucket_name=self.bucket, object_name=filepath,
+                                        data=content, length=content.getbuffer().nbytes)
+        object_cache.invalidate(filepath)
+
+    def upload_stream(self, filepath: str, compress: bool = False,
+                      part_size: Optional[int] = None) -> MultipartUpload:
+        """Starts a streaming upload of a file into the storage.
+
+        Args:
+            filepath (str): path to the file in the storage;
+            compress (bool, optional): store compressible content compressed.
+                Defaults to False;
+            part_size (int, optional): size of multipart parts in bytes.
+                Defaults to app_settings.upload_part_size.
+
+        Returns:
+            MultipartUpload: async context manager accepting file content chunk by chunk.
+        """
+        return MultipartUpload(self, filepath, part_size or app_settings.upload_part_size,
+                               compress=compress)
 
-    async def download_file(self, filepath: str) -> BytesIO:
-        """Downloads a file from the storage.
+    async def create_multipart(self, filepath: str) -> str:
+        """Starts a multipart upload of a file, its parts can be uploaded by separate requests.
 
         Args:
             filepath (str): path to the file in the storage.
 
         Returns:
-            BytesIO: binary stream.
+            str: identifier of the multipart upload.
+        """
+        with translate_errors(filepath):
+            return await self.minio._create_multipart_upload(self.bucket, filepath, {})
+
+    async def upload_part(self, filepath: str, upload_id: str, number: int,
+                          content: bytes) -> str:
+        """Uploads a part of a multipart upload, replacing a part with the same number.
+
+        Args:
+            filepath (str): path to the file in the storage;
+            upload_id (str): identifier of the multipart upload;
+            number (int): part number starting with 1;
+            content (bytes): part content, all parts except the last one must be
+                at least 5 MiB.
+
+        Raises:
+            FileNotFoundError: if the multipart upload does not exist.
+
+        Returns:
+            str: ETag of the part.
+        """
+        with translate_errors(filepath):
+            return await self.minio._upload_part(self.bucket, filepath, content, None,
+                                                 upload_id, number)
+
+    async def complete_multipart(self, filepath: str, upload_id: str,
+                                 parts: List[Tuple[int, str]]) -> None:
+        """Joins uploaded parts into the file.
+
+        Args:
+            filepath (str): path to the file in the storage;
+            upload_id (str): identifier of the multipart upload;
+            parts (List[Tuple[int, str]]): numbers and ETags of the parts in order.
+
+        Raises:
+            FileNotFoundError: if the multipart upload does not exist.
+        """
+        with translate_errors(filepath):
+            await self.minio._complete_multipart_upload(
+                self.bucket, filepath, upload_id, [Part(number, etag) for number, etag in parts])
+        object_cache.invalidate(filepath)
+
+    async def abort_multipart(self, filepath: str, upload_id: str) -> None:
+        """Discards uploaded parts of a multipart upload.
+
+        Args:
+            filepath (str): path to the file in the storage;
+            upload_id (str): identifier of the multipart upload.
         """
-        async with aiohttp.ClientSession() as session:
+        with translate_errors(filepath):
+            await self.minio._abort_multipart_upload(self.bucket, filepath, upload_id)
+
+    async def remove_files(self, filepaths: List[str]) -> None:
+        """Removes files from the storage. Failures are logged, files left in the storage
+            are not referenced any more and only take space.
+
+        Args:
+            filepaths (List[str]): paths to the files in the storage.
+        """
+        for filepath in filepaths:
+            object_cache.invalidate(filepath)
+        for start in range(0, len(filepaths), REMOVE_BATCH_SIZE):
+            batch = [DeleteObject(filepath)
+                     for filepath in filepaths[start:start + REMOVE_BATCH_SIZE]]
+            try:
+                errors = await self.minio.remove_objects(self.bucket, batch)
+            except (MinioException, OSError):
+                logger.warning('Failed to remove %d files', len(batch), exc_info=True)
+                continue
+            for error in errors:
+                logger.warning('Failed to remove %s: %s', error.name, error.message)
+
+    async def copy_files(self, copies: List[Tuple[str, str]]) -> None:
+        """Copies files inside the storage without transferring their content through
+            the application, at most app_settings.storage_copy_concurrency at once.
+
+        Args:
+            copies (List[Tuple[str, str]]): paths to the source and destination files.
+
+        Raises:
+            StorageError: if a file failed to be copied, after the other copies are finished.
+        """
+        semaphore = asyncio.Semaphore(app_settings.storage_copy_concurrency)
+
+        async def copy(source: str, destination: str) -> None:
+            async with semaphore:
+                with translate_errors(source):
+                    await self.minio.copy_object(bucket_name=self.bucket,
+                                                 object_name=destination,
+                                                 source=CopySource(self.bucket, source))
+            object_cache.invalidate(destination)
+
+        results = await asyncio.gather(*[copy(source, destination)
+                                         for source, destination in copies],
+                                       return_exceptions=True)
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+
+    async def list_files(self) -> AsyncIterator[FileStat]:
+        """Lists all files in the storage ordered by their paths (in UTF-8 byte order).
+            Files are requested page by page while they are consumed.
+
+        Yields:
+            FileStat: information about the next file including its path, size and
+                last modification time.
+        """
+        start_after = None
+        while True:
+            # a call returns a single page of at most 1000 files
+            with translate_errors():
+                page = await self.minio.list_objects(bucket_name=self.bucket, recursive=True,
+                                                     start_after=start_after)
+            for obj in page:
+                yield FileStat(filepath=obj.object_name, size=obj.size, etag=obj.etag,
+                               last_modified=obj.last_modified)
+            if not page:
+                return
+            start_after = page[-1].object_name
+
+    async def stat_file(self, filepath: str) -> FileStat:
+        """Returns information about a file in the storage.
+
+        Args:
+            filepath (str): path to the file in the storage.
+
+        Returns:
+            FileStat: file information including its size, ETag and last modification time.
+        """
+        with translate_errors(filepath):
+            obj = await self.minio.stat_object(bucket_name=self.bucket, object_name=filepath)
+        return FileStat(filepath=filepath, size=obj.size, etag=obj.etag,
+                        last_modified=obj.last_modified)
+
+    async def download_stream(self, filepath: str, offset: int = 0,
+                              length: int = 0) -> AsyncIterator[bytes]:
+        """Starts downloading a file from the storage.
+
+        The object is requested before returning, so storage errors are raised here and not
+        after the response headers have been sent to a client.
+
+        Args:
+            filepath (str): path to the file in the storage;
+            offset (int, optional): start byte position. Defaults to 0;
+            length (int, optional): number of bytes from offset, 0 for the rest of the file.
+                Defaults to 0.
+
+        Returns:
+            AsyncIterator[bytes]: file content relayed chunk by chunk as it arrives.
+        """
+        with translate_errors(filepath):
+            response = await self.minio.get_object(bucket_name=self.bucket, object_name=filepath,
+                                                   session=self.session, offset=offset,
+                                                   length=length)
+        return self._relay(response)
+
+    @staticmethod
+    async def _relay(response: aiohttp.ClientResponse) -> AsyncIterator[bytes]:
+        """Yields chunks of a storage response and returns its connection to the pool afterwards.
+
+        Args:
+            response (aiohttp.ClientResponse): storage response.
+
+        Yields:
+            bytes: next chunk of the response body.
+        """
+        try:
+            async for chunk in response.content.iter_chunked(app_settings.download_chunk_size):
+                yield chunk
+        finally:
+            response.release()
+
+    async def presigned_upload_url(self, filepath: str) -> str:
+        """Returns a short-lived URL a client can upload a file with directly into the storage.
+
+        Args:
+            filepath (str): path to the file in the storage.
+
+        Returns:
+            str: presigned PUT URL.
+        """
+        with translate_errors(filepath): # signing may look up the bucket region
+            return await self.minio.presigned_put_object(
+                bucket_name=self.bucket, object_name=filepath,
+                expires=timedelta(seconds=app_settings.presigned_url_expires),
+                change_host=app_settings.storage_public_url)
+
+    async def presigned_download_url(self, filepath: str, filename: str,
+                                     encoding: Optional[str] = None) -> str:
+        """Returns a short-lived URL a client can download a file with directly from the storage.
+
+        Args:
+            filepath (str): path to the file in the storage;
+            filename (str): name of the downloaded file;
+            encoding (str, optional): codec of the stored content, sent as Content-Encoding.
+                Defaults to None.
+
+        Returns:
+            str: presigned GET URL.
+        """
+        response_headers = {'response-content-disposition': f'attachment; filename={filename}'}
+        if encoding is not None:
+            response_headers['response-content-encoding'] = encoding
+        with translate_errors(filepath):
+            return await self.minio.presigned_get_object(
+                bucket_name=self.bucket, object_name=filepath,
+                expires=timedelta(seconds=app_settings.presigned_url_expires),
+                response_headers=response_headers, change_host=app_settings.storage_public_url)
+
+    async def read_file(self, filepath: str) -> bytes:
+        """Reads a whole file from the storage.
+
+        Args:
+            filepath (str): path to the file in the storage.
+
+        Returns:
+            bytes: content of the file.
+        """
+        with translate_errors(filepath):
             response = await self.minio.get_object(bucket_name=self.bucket, object_name=filepath,
-                                                   session=session)
-            file = await response.read()
-        return BytesIO(file)
+                                                   session=self.session)
+        try:
+            return await response.read()
+        finally:
+            response.release()
+
+
+def create_storage_client() -> StorageBackend:
+    """Creates a client of the storage backend configured by application settings.
+
+    Returns:
+        StorageBackend: MinIO client or local disk storage.
+    """
+    if app_settings.storage_backend == 'local':
+        return LocalStorage(root=app_settings.storage_local_path,
+                            threads=app_settings.storage_local_threads)
+    return MinioClient()
+
+
+storage_client = create_storage_client()
@@ -1,9 +1,32 @@
 """Application tests"""
+from contextlib import asynccontextmanager
+from datetime import timezone
+import hashlib
+from io import BytesIO
+import json
+import os
+from types import SimpleNamespace
+import zipfile
+
 from httpx import AsyncClient
+import httpx
 from fastapi import status
+from pydantic import ValidationError
 import pytest
+from sqlalchemy import select, text
 
+from core.config import app_settings, AppSettings
+from core.health import HealthMonitor
+from core.tokens import TokenSigner
+from db.db import get_session
 from main import app
+from models.models import Blobs, Files
+from services.file_cache import FileMetadataCache, notification_payloads, NOTIFY_MAX_PAYLOAD
+from services.reconciler import Reconciler, RECONCILE_LOCK_KEY
+from services.revocations import RevocationList
+from storage.cache import DiskTier, object_cache
+from storage.local import LocalStorage
+from storage.storage import storage_client
 
 
 TEST_USERNAME = 'test_username'
@@ -14,6 +37,12 @@ TEST_INCORRECT_TOKEN = 'test_token'
 TEST_FILE = 'tests/test_file.txt'
 TEST_DOWNLOADED_FILEPATH = 'tests/test_file_output.txt'
 TEST_INCORRECT_FILEPATH = 'test_incorrect_filepath'
+TEST_STREAM_FILEPATH = 'stream/test_file'
+TEST_PRESIGNED_FILEPATH = 'presigned/test_file'
+TEST_DEDUP_FILEPATHS = ['dedup/first', 'dedup/second']
+TEST_COMPRESSED_FILEPATH = 'compressed/text'
+TEST_INCOMPRESSIBLE_FILEPATH = 'compressed/random'
+TEST_QUOTA_FILEPATH = 'quota/test_file'
 
 pytestmark = pytest.mark.asyncio
 
@@ -26,8 +55,57 @@ class TestService:
         response = await client.get(app.url_path_for('ping'))
         assert response.status_code == status.HTTP_200_OK
         response = response.json()
+        assert response['status'] == 'ok'
         assert response['db'] >= 0. and response['storage'] >= 0.
 
+    async def test_storage_settings(self) -> None:
+        """Tests that MinIO settings are required by the minio backend only"""
+        with pytest.raises(ValidationError):
+            AppSettings(storage_backend='minio', minio_bucket_name='')
+        assert AppSettings(storage_backend='local', minio_bucket_name='').minio_bucket_name == ''
+
+    async def test_ping_degraded(self, client: AsyncClient,
+                                 monkeypatch: pytest.MonkeyPatch) -> None:
+        """Tests GET /ping endpoint with unavailable services"""
+        async def available() -> None:
+            pass
+
+        async def unavailable() -> None:
+            raise OSError('Service is not available')
+
+        monkeypatch.setattr('api.v1.service.health_monitor',
+                            HealthMonitor(probes={'db': available, 'storage': unavailable},
+                                          interval=0, timeout=1))
+        response = await client.get(app.url_path_for('ping'))
+        assert response.status_code == status.HTTP_200_OK
+        response = response.json()
+        assert response['status'] == 'degraded'
+        assert response['db'] >= 0. and response['storage'] is None
+        monkeypatch.setattr('api.v1.service.health_monitor',
+                            HealthMonitor(probes={'db': unavailable, 'storage': unavailable},
+                                          interval=0, timeout=1))
+        response = await client.get(app.url_path_for('ping'))
+        assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+        assert response.json() == {'status': 'unavailable', 'db': None, 'storage': None}
+
+    async def test_health_monitor_background(self) -> None:
+        """Tests that results refreshed in background are returned without probing"""
+        probes = 0
+
+        async def probe() -> None:
+            nonlocal probes
+            probes += 1
+
+        monitor = HealthMonitor(probes={'db': probe}, interval=60, timeout=1)
+        monitor.start()
+        try:
+            results = await monitor.results() # probed on demand until results are cached
+            monitor._updated_at -= 120 # pylint: disable=protected-access
+            assert await monitor.results() == results and probes == 1
+        finally:
+            await monitor.stop()
+        assert (await monitor.results()).keys() == {'db'} and probes == 2
+
 
 class TestUser:
     """Tests for checking endpoints in 'user' tag"""
@@ -70,6 +148,74 @@ class TestUser:
                                            'password': TEST_INCORRECT_PASSWORD})
         assert response.status_code == status.HTTP_401_UNAUTHORIZED
 
+    @pytest.mark.dependency(depends=["TestUser::test_user_authentication"])
+    async def test_token_revocation(self, client: AsyncClient) -> None:
+        """Tests DELETE /token endpoint"""
+        response = await client.post(app.url_path_for('authenticate_user'),
+                                     json={'username': TEST_USERNAME, 'password': TEST_PASSWORD})
+        token = response.json()['token']
+        response = await client.delete(app.url_path_for('revoke_token'), params={'token': token})
+        assert response.status_code == status.HTTP_204_NO_CONTENT
+        response = await client.get(app.url_path_for('get_files'), params={'token': token})
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+        response = await client.post(app.url_path_for('authenticate_user'),
+                                     json={'username': TEST_USERNAME, 'password': TEST_PASSWORD})
+        assert response.json()['token'] != token
+
+
+    @pytest.mark.dependency(depends=["TestUser::test_user_authentication"])
+    async def test_signed_tokens(self, client: AsyncClient,
+                                 monkeypatch: pytest.MonkeyPatch) -> None:
+        """Tests authentication with signed tokens and their revocation"""
+        session_factory = asynccontextmanager(app.dependency_overrides[get_session])
+        keys = {'old': 'old secret', 'new': 'new secret'}
+        monkeypatch.setattr('api.v1.user.token_signer',
+                            TokenSigner(keys=keys, key_id='new', ttl=60))
+        monkeypatch.setattr('api.v1.user.revocation_list',
+                            RevocationList(session_factory=session_factory, interval=0))
+        response = await client.post(app.url_path_for('authenticate_user'),
+                                     json={'username': TEST_USERNAME, 'password': TEST_PASSWORD})
+        token = response.json()['token']
+        assert token.startswith('new.') and response.json()['expires_at'] is not None
+        old_token, _ = TokenSigner(keys=keys, key_id='old', ttl=60).sign(TEST_USERNAME)
+        expired_token, _ = TokenSigner(keys=keys, key_id='new', ttl=-1).sign(TEST_USERNAME)
+        forged_token, _ = TokenSigner(keys={'new': 'guess'}, key_id='new',
+                                      ttl=60).sign(TEST_USERNAME)
+        for checked, expected in ((token, status.HTTP_200_OK), (old_token, status.HTTP_200_OK),
+                                  (expired_token, status.HTTP_401_UNAUTHORIZED),
+                                  (forged_token, status.HTTP_401_UNAUTHORIZED),
+                                  (token[:-1], status.HTTP_401_UNAUTHORIZED)):
+            response = await client.get(app.url_path_for('get_files'), params={'token': checked})
+            assert response.status_code == expected
+        response = await client.delete(app.url_path_for('revoke_token'), params={'token': token})
+        assert response.status_code == status.HTTP_204_NO_CONTENT
+        response = await client.get(app.url_path_for('get_files'), params={'token': token})
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+        other_worker = RevocationList(session_factory=session_factory, interval=0)
+        await other_worker.refresh()
+        jti = TokenSigner(keys=keys, key_id='new', ttl=60).verify(token).jti
+        assert other_worker.is_revoked(jti) and not other_worker.is_revoked(
+            TokenSigner(keys=keys, key_id='old', ttl=60).verify(old_token).jti)
+        # the old key is removed after rotation
+        monkeypatch.setattr('api.v1.user.token_signer',
+                            TokenSigner(keys={'new': keys['new']}, key_id='new', ttl=60))
+        response = await client.get(app.url_path_for('get_files'), params={'token': old_token})
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+        @asynccontextmanager
+        async def unavailable_database():
+            raise OSError('Database is not available')
+            yield # pylint: disable=unreachable
+
+        monkeypatch.setattr('api.v1.user.revocation_list',
+                            RevocationList(session_factory=unavailable_database, interval=0))
+        response = await client.post(app.url_path_for('authenticate_user'),
+                                     json={'username': TEST_USERNAME, 'password': TEST_PASSWORD})
+        response = await client.get(app.url_path_for('get_files'),
+                                    params={'token': response.json()['token']})
+        assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+        assert response.headers['retry-after'] == '1'
+
 
 class TestFiles:
     """Tests for checking endpoints in 'file_storage' tag"""
@@ -89,7 +235,7 @@ class TestFiles:
         token = response.json()['token']
         response = await client.get(app.url_path_for('get_files'), params={'token': token})
         assert response.status_code == status.HTTP_200_OK
-        assert response.json() == []
+        assert response.json() == {'files': [], 'next_cursor': None}
 
     @pytest.mark.dependency()
     @pytest.mark.dependency(depends=["TestService::test_ping"])
@@ -118,6 +264,47 @@ class TestFiles:
                                          files={'file': ('test_file', test_file, 'plain/text')})
         assert response.status_code == status.HTTP_406_NOT_ACCEPTABLE
 
+    @pytest.mark.dependency(depends=["TestFiles::test_upload"])
+    async def test_upload_stream(self, client: AsyncClient) -> None:
+        """Tests POST /files/upload/stream"""
+        response = await client.post(app.url_path_for('authenticate_user'),
+                                     json={'username': TEST_USERNAME, 'password': TEST_PASSWORD})
+        token = response.json()['token']
+        with open(TEST_FILE, 'rb') as test_file:
+            content = test_file.read()
+        response = await client.post(app.url_path_for('upload_file_stream'),
+                                     params={'token': token, 'filepath': TEST_STREAM_FILEPATH},
+                                     content=content)
+        assert response.status_code == status.HTTP_201_CREATED
+        response = await client.post(app.url_path_for('upload_file_stream'),
+                                     params={'token': token, 'filepath': TEST_STREAM_FILEPATH},
+                                     content=content)
+        assert response.status_code == status.HTTP_406_NOT_ACCEPTABLE
+
+    @pytest.mark.dependency(depends=["TestFiles::test_upload"])
+    async def test_upload_deduplication(self, client: AsyncClient) -> None:
+        """Tests that files with the same content share it in the storage"""
+        response = await client.post(app.url_path_for('authenticate_user'),
+                                     json={'username': TEST_USERNAME, 'password': TEST_PASSWORD})
+        token = response.json()['token']
+        content = b'deduplicated content'
+        for filepath in TEST_DEDUP_FILEPATHS:
+            response = await client.post(app.url_path_for('upload_file_stream'),
+                                         params={'token': token, 'filepath': filepath},
+                                         content=content)
+            assert response.status_code == status.HTTP_201_CREATED
+            response = await client.get(app.url_path_for('download_file'),
+                                        params={'token': token, 'file_id': response.json()['id']})
+            assert response.content == content
+        async for database in app.dependency_overrides[get_session]():
+            files = (await database.execute(
+                select(Files).where(Files.filepath.in_(
+                    [f'{TEST_USERNAME}/{filepath}' for filepath in TEST_DEDUP_FILEPATHS])))
+                ).scalars().all()
+            assert len({file.storage_path for file in files}) == 1
+            blob = await database.get(Blobs, files[0].digest)
+            assert blob.refcount == 2 and blob.size == len(content)
+
     async def test_files(self, client: AsyncClient) -> None:
         """Tests GET /files with previously uploaded files"""
         response = await client.post(app.url_path_for('authenticate_user'),
@@ -125,7 +312,26 @@ class TestFiles:
         token = response.json()['token']
         response = await client.get(app.url_path_for('get_files'), params={'token': token})
         assert response.status_code == status.HTTP_200_OK
-        assert len(response.json()) > 0
+        assert len(response.json()['files']) > 0
+
+    @pytest.mark.dependency(depends=["TestFiles::test_upload_stream"])
+    async def test_files_pagination(self, client: AsyncClient) -> None:
+        """Tests GET /files with limit, cursor and prefix"""
+        response = await client.post(app.url_path_for('authenticate_user'),
+                                     json={'username': TEST_USERNAME, 'password': TEST_PASSWORD})
+        token = response.json()['token']
+        response = await client.get(app.url_path_for('get_files'),
+                                    params={'token': token, 'limit': 1})
+        first_page = response.json()
+        assert len(first_page['files']) == 1 and first_page['next_cursor'] is not None
+        response = await client.get(app.url_path_for('get_files'),
+                                    params={'token': token, 'limit': 1,
+                                            'cursor': first_page['next_cursor']})
+        assert response.json()['files'][0]['id'] > first_page['files'][0]['id']
+        response = await client.get(app.url_path_for('get_files'),
+                                    params={'token': token, 'prefix': 'stream/'})
+        assert [file['filepath'] for file in response.json()['files']] == \
+            [f'{TEST_USERNAME}/{TEST_STREAM_FILEPATH}']
 
     async def test_download_without_parameters(self, client: AsyncClient) -> None:
         """Tests GET /files/download without passing any parameters"""
@@ -151,8 +357,522 @@ class TestFiles:
                                      json={'username': TEST_USERNAME, 'password': TEST_PASSWORD})
         token = response.json()['token']
         response = await client.get(app.url_path_for('get_files'), params={'token': token})
-        filepath = response.json()[0]['filepath']
+        filepath = response.json()['files'][0]['filepath']
         response = await client.get(app.url_path_for('download_file'),
                                     params={'token': token, 'filepath': filepath})
         with open(TEST_DOWNLOADED_FILEPATH, 'wb') as test_file:
             test_file.write(response.content)
+
+    async def test_file_change_notifications(self) -> None:
+        """Tests that notifications of changed files with long non-ASCII paths fit into
+            Postgres payloads"""
+        filepath = 'каталог/' * (app_settings.max_filepath_length // 8)
+        changes = [(TEST_USERNAME, file_id, filepath) for file_id in range(50)]
+        changes.append((TEST_USERNAME, 50, 'я' * 5000))
+        payloads = notification_payloads(changes)
+        assert len(payloads) > 1
+        assert all(len(payload.encode()) <= NOTIFY_MAX_PAYLOAD for payload in payloads)
+        decoded = [tuple(change) for payload in payloads for change in json.loads(payload)]
+        assert decoded == changes[:-1] + [(TEST_USERNAME, 50, None)]
+        cache = FileMetadataCache(maxsize=10, ttl=1, listen=True)
+        async for database in app.dependency_overrides[get_session]():
+            await cache.notify(database=database, changes=changes)
+            await database.commit()
+
+    async def test_metrics(self, client: AsyncClient) -> None:
+        """Tests GET /service/metrics"""
+        response = await client.get(app.url_path_for('metrics'))
+        assert response.status_code == status.HTTP_200_OK
+        assert response.headers['Content-Type'].startswith('text/plain; version=0.0.4')
+        route = app.url_path_for('download_file')
+        lines = response.text.splitlines()
+        assert any(line.startswith('file_storage_http_requests_total{'
+                                   f'method="GET",route="{route}",status="200"}}')
+                   for line in lines)
+        for stage in ('auth', 'db', 'storage'):
+            assert any(line.startswith('file_storage_http_request_stage_seconds_count{'
+                                       f'route="{route}",stage="{stage}"}}') for line in lines)
+        assert any(line.startswith(f'file_storage_http_response_bytes_total{{route="{route}"}}')
+                   for line in lines)
+        assert any(line.startswith('file_storage_database_pool{key="in_use"}') for line in lines)
+
+    async def test_download_range(self, client: AsyncClient) -> None:
+        """Tests GET /files/download with Range header"""
+        response = await client.post(app.url_path_for('authenticate_user'),
+                                     json={'username': TEST_USERNAME, 'password': TEST_PASSWORD})
+        token = response.json()['token']
+        response = await client.get(app.url_path_for('get_files'), params={'token': token})
+        filepath = response.json()['files'][0]['filepath']
+        with open(TEST_FILE, 'rb') as test_file:
+            content = test_file.read()
+        response = await client.get(app.url_path_for('download_file'),
+                                    params={'token': token, 'filepath': filepath},
+                                    headers={'Range': 'bytes=1-3'})
+        assert response.status_code == status.HTTP_206_PARTIAL_CONTENT
+        assert response.content == content[1:4]
+        assert response.headers['Content-Range'] == f'bytes 1-3/{len(content)}'
+        response = await client.get(app.url_path_for('download_file'),
+                                    params={'token': token, 'filepath': filepath},
+                                    headers={'Range': f'bytes={len(content)}-'})
+        assert response.status_code == status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE
+
+    @pytest.mark.dependency(depends=["TestFiles::test_upload_deduplication"])
+    async def test_download_conditional(self, client: AsyncClient) -> None:
+        """Tests GET /files/download with If-None-Match and If-Modified-Since headers"""
+        response = await client.post(app.url_path_for('authenticate_user'),
+                                     json={'username': TEST_USERNAME, 'password': TEST_PASSWORD})
+        token = response.json()['token']
+        params = {'token': token, 'filepath': f'{TEST_USERNAME}/{TEST_DEDUP_FILEPATHS[0]}'}
+        response = await client.get(app.url_path_for('download_file'), params=params)
+        etag, last_modified = response.headers['ETag'], response.headers['Last-Modified']
+        response = await client.get(app.url_path_for('download_file'), params=params,
+                                    headers={'If-None-Match': f'"other", {etag}'})
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+        assert response.headers['ETag'] == etag and not response.content
+        response = await client.get(app.url_path_for('download_file'), params=params,
+                                    headers={'If-Modified-Since': last_modified})
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+        response = await client.get(app.url_path_for('download_file'), params=params,
+                                    headers={'If-None-Match': '"other"',
+                                             'If-Modified-Since': last_modified})
+        assert response.status_code == status.HTTP_200_OK
+        response = await client.get(app.url_path_for('download_file'), params=params,
+                                    headers={'If-Modified-Since':
+                                             'Mon, 01 Jan 2001 00:00:00 GMT'})
+        assert response.status_code == status.HTTP_200_OK
+
+    @pytest.mark.dependency(depends=["TestFiles::test_upload_deduplication"])
+    @pytest.mark.skipif(app_settings.storage_backend != 'minio',
+                        reason='local files are sent from the disk bypassing the object cache')
+    async def test_download_cached(self, client: AsyncClient) -> None:
+        """Tests GET /files/download of small files served from the object cache"""
+        response = await client.post(app.url_path_for('authenticate_user'),
+                                     json={'username': TEST_USERNAME, 'password': TEST_PASSWORD})
+        token = response.json()['token']
+        params = {'token': token, 'filepath': f'{TEST_USERNAME}/{TEST_DEDUP_FILEPATHS[1]}'}
+        response = await client.get(app.url_path_for('download_file'), params=params)
+        content = response.content
+        hits = (await client.get(app.url_path_for('object_cache_stats'))).json()['memory']['hits']
+        response = await client.get(app.url_path_for('download_file'), params=params)
+        assert response.content == content
+        response = await client.get(app.url_path_for('download_file'), params=params,
+                                    headers={'Range': 'bytes=2-4'})
+        assert response.status_code == status.HTTP_206_PARTIAL_CONTENT
+        assert response.content == content[2:5]
+        stats = (await client.get(app.url_path_for('object_cache_stats'))).json()['memory']
+        assert stats['hits'] == hits + 2 and stats['hit_ratio'] > 0.
+
+    async def test_disk_cache_tier(self, tmp_path: str) -> None:
+        """Tests the disk tier of the object cache"""
+        path = os.path.join(tmp_path, 'cache')
+        tier = DiskTier(path, max_bytes=10)
+        assert not os.path.exists(path) # the directory is created by the first write
+        await tier.set('a', b'01234')
+        await tier.set('b', b'')
+        assert await tier.get('a') == b'01234' and await tier.get('b') == b''
+        await tier.set('c', b'567890')
+        assert await tier.get('a') is None and await tier.get('c') == b'567890'
+        tier.close()
+        assert os.listdir(path) == []
+
+    @pytest.mark.skipif(app_settings.storage_backend != 'minio',
+                        reason='the connection pool is used by the S3 storage only')
+    async def test_storage_pool_stats_fallback(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        """Tests storage pool statistics with a connector lacking the attributes they are
+            read from"""
+        monkeypatch.setattr(storage_client, '_session',
+                            SimpleNamespace(closed=False, connector=SimpleNamespace()))
+        stats = storage_client.pool_stats()
+        assert stats['in_use'] == -1 and stats['idle'] == -1
+        assert stats['limit'] == app_settings.storage_pool_size
+
+    @pytest.mark.dependency(depends=["TestFiles::test_upload_deduplication"])
+    async def test_download_metadata_cached(self, client: AsyncClient) -> None:
+        """Tests that repeated downloads take file metadata from the cache"""
+        response = await client.post(app.url_path_for('authenticate_user'),
+                                     json={'username': TEST_USERNAME, 'password': TEST_PASSWORD})
+        token = response.json()['token']
+        params = {'token': token, 'filepath': f'{TEST_USERNAME}/{TEST_DEDUP_FILEPATHS[0]}'}
+        response = await client.get(app.url_path_for('download_file'), params=params)
+        assert response.status_code == status.HTTP_200_OK
+        hits = (await client.get(app.url_path_for('cache'))).json()['files']['hits']
+        response = await client.get(app.url_path_for('download_file'), params=params)
+        assert response.status_code == status.HTTP_200_OK
+        assert (await client.get(app.url_path_for('cache'))).json()['files']['hits'] == hits + 1
+
+    @pytest.mark.dependency(depends=["TestFiles::test_upload"])
+    async def test_upload_compression(self, client: AsyncClient,
+                                      monkeypatch: pytest.MonkeyPatch) -> None:
+        """Tests compression of uploaded content and its download"""
+        monkeypatch.setattr(app_settings, 'upload_compression', True)
+        response = await client.post(app.url_path_for('authenticate_user'),
+                                     json={'username': TEST_USERNAME, 'password': TEST_PASSWORD})
+        token = response.json()['token']
+        content = b'compressible text content\n' * 10000
+        for filepath, data in ((TEST_COMPRESSED_FILEPATH, content),
+                               (TEST_INCOMPRESSIBLE_FILEPATH, os.urandom(100000))):
+            response = await client.post(app.url_path_for('upload_file_stream'),
+                                         params={'token': token, 'filepath': filepath},
+                                         content=data)
+            assert response.status_code == status.HTTP_201_CREATED
+        async for database in app.dependency_overrides[get_session]():
+            files = (await database.execute(select(Files).where(Files.filepath.in_(
+                [f'{TEST_USERNAME}/{TEST_COMPRESSED_FILEPATH}',
+                 f'{TEST_USERNAME}/{TEST_INCOMPRESSIBLE_FILEPATH}'])
+                ).order_by(Files.filepath))).scalars().all()
+            assert [file.encoding for file in files] == [None, 'zstd']
+        params = {'token': token, 'filepath': f'{TEST_USERNAME}/{TEST_COMPRESSED_FILEPATH}'}
+        for max_object_size in (object_cache.max_object_size, 0): # cached and streamed
+            monkeypatch.setattr(object_cache, 'max_object_size', max_object_size)
+            response = await client.get(app.url_path_for('download_file'), params=params,
+                                        headers={'Accept-Encoding': 'identity'})
+            assert response.content == content and 'Content-Encoding' not in response.headers
+            response = await client.get(app.url_path_for('download_file'), params=params,
+                                        headers={'Accept-Encoding': 'gzip, zstd'})
+            assert response.headers['Content-Encoding'] == 'zstd'
+            assert len(response.content) < len(content)
+            response = await client.get(app.url_path_for('download_file'), params=params,
+                                        headers={'Accept-Encoding': 'zstd',
+                                                 'Range': 'bytes=100000-100009'})
+            assert response.status_code == status.HTTP_206_PARTIAL_CONTENT
+            assert response.content == content[100000:100010]
+
+    @pytest.mark.dependency(depends=["TestFiles::test_upload"])
+    async def test_local_storage(self, client: AsyncClient, monkeypatch: pytest.MonkeyPatch,
+                                 tmp_path: str) -> None:
+        """Tests uploading and downloading files kept on the local disk"""
+        local_storage = LocalStorage(root=str(tmp_path), threads=2)
+        monkeypatch.setattr('api.v1.file_storage.storage_client', local_storage)
+        monkeypatch.setattr(object_cache, 'max_object_size', 0)
+        response = await client.post(app.url_path_for('authenticate_user'),
+                                     json={'username': TEST_USERNAME, 'password': TEST_PASSWORD})
+        token = response.json()['token']
+        content = os.urandom(300000)
+        response = await client.post(app.url_path_for('upload_file_stream'),
+                                     params={'token': token, 'filepath': 'local/file'},
+                                     content=content)
+        assert response.status_code == status.HTTP_201_CREATED
+        params = {'token': token, 'file_id': response.json()['id']}
+        response = await client.get(app.url_path_for('download_file'), params=params)
+        assert response.content == content
+        response = await client.get(app.url_path_for('download_file'), params=params,
+                                    headers={'Range': 'bytes=100000-100009'})
+        assert response.status_code == status.HTTP_206_PARTIAL_CONTENT
+        assert response.content == content[100000:100010]
+        response = await client.get(app.url_path_for('presign_download'), params=params)
+        assert response.status_code == status.HTTP_501_NOT_IMPLEMENTED
+        response = await client.delete(app.url_path_for('delete_files'), params=params)
+        assert response.status_code == status.HTTP_200_OK
+        await local_storage.upload_file('a/b', b'b')
+        await local_storage.upload_file('a-b', b'a-b')
+        await local_storage.copy_files([('a/b', 'a/c')])
+        paths = [stat.filepath async for stat in local_storage.list_files()]
+        assert paths == sorted(paths) and paths[:3] == ['a-b', 'a/b', 'a/c']
+        assert await local_storage.read_file('a/c') == b'b'
+        await local_storage.remove_files(['a/b', 'a/missing'])
+        with pytest.raises(FileNotFoundError):
+            await local_storage.stat_file('a/b')
+        with pytest.raises(OSError):
+            await local_storage.read_file('../outside')
+        await local_storage.close()
+
+    @pytest.mark.dependency(depends=["TestFiles::test_upload"])
+    async def test_resumable_upload(self, client: AsyncClient) -> None:
+        """Tests uploading a file in chunks with /files/uploads"""
+        response = await client.post(app.url_path_for('authenticate_user'),
+                                     json={'username': TEST_USERNAME, 'password': TEST_PASSWORD})
+        token = response.json()['token']
+        part_size = app_settings.upload_part_size
+        content = os.urandom(part_size + 100)
+        response = await client.post(app.url_path_for('create_upload'),
+                                     params={'token': token, 'filepath': 'resumable/file',
+                                             'size': len(content)})
+        assert response.status_code == status.HTTP_201_CREATED
+        upload = response.json()
+        assert upload['offset'] == 0 and upload['part_size'] == part_size
+        params = {'token': token, 'upload_id': upload['id']}
+        response = await client.put(app.url_path_for('upload_chunk'),
+                                    params={**params, 'offset': 0},
+                                    content=content[:part_size + 50])
+        assert response.json()['offset'] == part_size # the incomplete part is discarded
+        response = await client.post(app.url_path_for('complete_resumable_upload'),
+                                     params=params)
+        assert response.status_code == status.HTTP_409_CONFLICT
+        response = await client.put(app.url_path_for('upload_chunk'),
+                                    params={**params, 'offset': 0}, content=content)
+        assert response.status_code == status.HTTP_409_CONFLICT
+        response = await client.get(app.url_path_for('get_upload'), params=params)
+        offset = response.json()['offset']
+        response = await client.put(app.url_path_for('upload_chunk'),
+                                    params={**params, 'offset': offset},
+                                    content=content[offset:])
+        assert response.json()['offset'] == len(content)
+        response = await client.post(app.url_path_for('complete_resumable_upload'),
+                                     params=params)
+        assert response.status_code == status.HTTP_201_CREATED
+        file_params = {'token': token, 'file_id': response.json()['id']}
+        response = await client.get(app.url_path_for('download_file'), params=file_params)
+        assert response.content == content
+        response = await client.get(app.url_path_for('get_upload'), params=params)
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+        response = await client.delete(app.url_path_for('delete_files'), params=file_params)
+        assert response.status_code == status.HTTP_200_OK
+        response = await client.post(app.url_path_for('create_upload'),
+                                     params={'token': token, 'size': 10, 'filepath':
+                                             'resumable/' + 'a' * app_settings.max_filepath_length})
+        assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+        response = await client.post(app.url_path_for('create_upload'),
+                                     params={'token': token, 'filepath': 'resumable/canceled',
+                                             'size': 10})
+        params['upload_id'] = response.json()['id']
+        response = await client.put(app.url_path_for('upload_chunk'),
+                                    params={**params, 'offset': 0}, content=b'0' * 11)
+        assert response.status_code == status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+        response = await client.delete(app.url_path_for('cancel_upload'), params=params)
+        assert response.status_code == status.HTTP_204_NO_CONTENT
+
+    @pytest.mark.dependency(depends=["TestFiles::test_upload"])
+    async def test_upload_quota(self, client: AsyncClient,
+                                monkeypatch: pytest.MonkeyPatch) -> None:
+        """Tests usage accounting and quota enforcement"""
+        response = await client.post(app.url_path_for('authenticate_user'),
+                                     json={'username': TEST_USERNAME, 'password': TEST_PASSWORD})
+        token = response.json()['token']
+        response = await client.get(app.url_path_for('get_usage'), params={'token': token})
+        assert response.status_code == status.HTTP_200_OK
+        usage = response.json()
+        assert usage['files'] > 0 and usage['size'] > 0 and usage['quota'] is None
+        monkeypatch.setattr(app_settings, 'user_quota', usage['size'] + 10)
+
+        async def chunks():
+            for _ in range(3):
+                yield b'01234'
+
+        params = {'token': token, 'filepath': TEST_QUOTA_FILEPATH}
+        for content in (b'0' * 11, chunks()): # declared and undeclared size
+            response = await client.post(app.url_path_for('upload_file_stream'),
+                                         params=params, content=content)
+            assert response.status_code == status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+        response = await client.post(app.url_path_for('upload_files_batch'),
+                                     params={'token': token, 'directory': 'quota'},
+                                     files=[('files', ('first', b'0' * 6)),
+                                            ('files', ('second', b'1' * 6))])
+        assert response.status_code == status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+        response = await client.post(app.url_path_for('upload_file_stream'),
+                                     params=params, content=b'0' * 10)
+        assert response.status_code == status.HTTP_201_CREATED
+        response = await client.get(app.url_path_for('get_usage'), params={'token': token})
+        assert response.json() == {'size': usage['size'] + 10, 'files': usage['files'] + 1,
+                                   'quota': usage['size'] + 10}
+        response = await client.post(app.url_path_for('presign_upload'),
+                                     params={'token': token, 'filepath': 'quota/presigned'})
+        assert response.status_code == status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+
+    @pytest.mark.dependency(depends=["TestFiles::test_upload"])
+    async def test_upload_batch(self, client: AsyncClient) -> None:
+        """Tests POST /files/upload/batch"""
+        response = await client.post(app.url_path_for('authenticate_user'),
+                                     json={'username': TEST_USERNAME, 'password': TEST_PASSWORD})
+        token = response.json()['token']
+        with open(TEST_FILE, 'rb') as test_file:
+            content = test_file.read()
+        response = await client.post(app.url_path_for('upload_files_batch'),
+                                     params={'token': token, 'directory': 'batch'},
+                                     files=[('files', ('first', content, 'plain/text')),
+                                            ('files', ('second', content, 'plain/text')),
+                                            ('files', ('first', content, 'plain/text'))])
+        assert response.status_code == status.HTTP_200_OK
+        results = response.json()
+        assert [result['filepath'] for result in results] == \
+            [f'{TEST_USERNAME}/batch/first', f'{TEST_USERNAME}/batch/second',
+             f'{TEST_USERNAME}/batch/first']
+        assert results[0]['id'] is not None and results[1]['id'] is not None
+        assert results[2]['id'] is None
+        response = await client.post(app.url_path_for('upload_files_batch'),
+                                     params={'token': token, 'directory': 'batch'},
+                                     files=[('files', ('first', content, 'plain/text'))])
+        assert response.json()[0]['id'] is None
+
+    @pytest.mark.dependency(depends=["TestFiles::test_upload_batch"])
+    async def test_download_archive(self, client: AsyncClient) -> None:
+        """Tests GET /files/download/archive"""
+        response = await client.post(app.url_path_for('authenticate_user'),
+                                     json={'username': TEST_USERNAME, 'password': TEST_PASSWORD})
+        token = response.json()['token']
+        with open(TEST_FILE, 'rb') as test_file:
+            content = test_file.read()
+        response = await client.get(app.url_path_for('download_archive'),
+                                    params={'token': token, 'prefix': 'batch/'})
+        assert response.status_code == status.HTTP_200_OK
+        with zipfile.ZipFile(BytesIO(response.content)) as archive:
+            assert sorted(archive.namelist()) == ['batch/first', 'batch/second']
+            assert archive.read('batch/first') == content
+            date_time = archive.getinfo('batch/first').date_time
+        async for database in app.dependency_overrides[get_session]():
+            modified_at = (await database.execute(select(Files.modified_at).where(
+                Files.filepath == f'{TEST_USERNAME}/batch/first'))).scalar_one()
+        # zip entries hold even seconds
+        assert date_time[:5] == modified_at.astimezone(timezone.utc).timetuple()[:5]
+        archive_content = response.content
+        response = await client.get(app.url_path_for('download_archive'),
+                                    params={'token': token, 'prefix': 'batch/'})
+        assert response.content == archive_content
+        response = await client.get(app.url_path_for('download_archive'),
+                                    params={'token': token})
+        assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+    @pytest.mark.dependency(depends=["TestFiles::test_upload"])
+    @pytest.mark.skipif(app_settings.storage_backend != 'minio',
+                        reason='presigned URLs are supported by the S3 storage only')
+    async def test_presigned_upload_and_download(self, client: AsyncClient) -> None:
+        """Tests POST /files/upload/presigned, POST /files/upload/complete
+            and GET /files/download/presigned"""
+        response = await client.post(app.url_path_for('authenticate_user'),
+                                     json={'username': TEST_USERNAME, 'password': TEST_PASSWORD})
+        token = response.json()['token']
+        with open(TEST_FILE, 'rb') as test_file:
+            content = test_file.read()
+        response = await client.post(app.url_path_for('presign_upload'),
+                                     params={'token': token, 'filepath': TEST_PRESIGNED_FILEPATH})
+        assert response.status_code == status.HTTP_200_OK
+        presigned = response.json()
+        response = await client.post(app.url_path_for('complete_upload'),
+                                     params={'token': token, 'filepath': presigned['filepath']})
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+        async with httpx.AsyncClient() as direct_client:
+            response = await direct_client.put(presigned['url'], content=content)
+            assert response.status_code == status.HTTP_200_OK
+            response = await client.post(app.url_path_for('complete_upload'),
+                                         params={'token': token,
+                                                 'filepath': presigned['filepath']})
+            assert response.status_code == status.HTTP_201_CREATED
+            response = await client.get(app.url_path_for('presign_download'),
+                                        params={'token': token, 'file_id': response.json()['id']})
+            response = await direct_client.get(response.json()['url'])
+            assert response.content == content
+        long_filepath = 'presigned/' + 'a' * app_settings.max_filepath_length
+        response = await client.post(app.url_path_for('presign_upload'),
+                                     params={'token': token, 'filepath': long_filepath})
+        assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+        # uploaded with an URL signed before the limit was lowered
+        long_filepath = f'{TEST_USERNAME}/{long_filepath}'
+        await storage_client.upload_file(long_filepath, content)
+        response = await client.post(app.url_path_for('complete_upload'),
+                                     params={'token': token, 'filepath': long_filepath})
+        assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+        with pytest.raises(FileNotFoundError):
+            await storage_client.stat_file(long_filepath)
+
+    @pytest.mark.dependency(depends=["TestFiles::test_presigned_upload_and_download"])
+    async def test_move_and_delete(self, client: AsyncClient) -> None:
+        """Tests POST /files/move and DELETE /files"""
+        response = await client.post(app.url_path_for('authenticate_user'),
+                                     json={'username': TEST_USERNAME, 'password': TEST_PASSWORD})
+        token = response.json()['token']
+        response = await client.get(app.url_path_for('get_usage'), params={'token': token})
+        usage = response.json()
+        response = await client.post(app.url_path_for('upload_files_batch'),
+                                     params={'token': token, 'directory': 'bulk'},
+                                     files=[('files', ('first', b'first')),
+                                            ('files', ('second', b'second'))])
+        file_ids = [result['id'] for result in response.json()]
+        response = await client.post(app.url_path_for('move_files'),
+                                     params={'token': token, 'prefix': 'bulk/',
+                                             'destination': 'bulk/nested/'})
+        assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+        response = await client.post(app.url_path_for('move_files'),
+                                     params={'token': token, 'file_id': file_ids[0],
+                                             'destination': 'bulk/second'})
+        assert response.status_code == status.HTTP_406_NOT_ACCEPTABLE
+        # the presigned file is stored under its filepath and is copied in the storage
+        response = await client.post(app.url_path_for('move_files'),
+                                     params={'token': token, 'destination': 'bulk/',
+                                             'filepath': f'{TEST_USERNAME}/'
+                                                         f'{TEST_PRESIGNED_FILEPATH}'})
+        assert response.json() == {'files': 1}
+        response = await client.post(app.url_path_for('move_files'),
+                                     params={'token': token, 'prefix': 'bulk/',
+                                             'destination': 'moved/'})
+        assert response.json() == {'files': 3}
+        response = await client.get(app.url_path_for('get_files'),
+                                    params={'token': token, 'prefix': 'moved/'})
+        assert sorted(file['filepath'] for file in response.json()['files']) == [
+            f'{TEST_USERNAME}/moved/first', f'{TEST_USERNAME}/moved/second',
+            f'{TEST_USERNAME}/moved/{os.path.basename(TEST_PRESIGNED_FILEPATH)}']
+        with open(TEST_FILE, 'rb') as test_file:
+            content = test_file.read()
+        for file_id, expected in zip(file_ids, (b'first', b'second')):
+            response = await client.get(app.url_path_for('download_file'),
+                                        params={'token': token, 'file_id': file_id})
+            assert response.content == expected
+        response = await client.get(app.url_path_for('download_file'),
+                                    params={'token': token, 'filepath': f'{TEST_USERNAME}/moved/'
+                                            f'{os.path.basename(TEST_PRESIGNED_FILEPATH)}'})
+        assert response.content == content
+        # moving a file stored under its filepath onto itself keeps its content
+        moved_params = {'token': token, 'filepath': f'{TEST_USERNAME}/moved/'
+                        f'{os.path.basename(TEST_PRESIGNED_FILEPATH)}'}
+        for destination in ('moved/', f'moved/{os.path.basename(TEST_PRESIGNED_FILEPATH)}'):
+            response = await client.post(app.url_path_for('move_files'),
+                                         params={**moved_params, 'destination': destination})
+            assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+        response = await client.get(app.url_path_for('download_file'), params=moved_params)
+        assert response.content == content
+        response = await client.delete(app.url_path_for('delete_files'),
+                                       params={'token': token, 'file_id': file_ids[0]})
+        assert response.json() == {'files': 1}
+        response = await client.delete(app.url_path_for('delete_files'),
+                                       params={'token': token, 'prefix': 'moved/'})
+        assert response.json() == {'files': 2}
+        response = await client.delete(app.url_path_for('delete_files'),
+                                       params={'token': token, 'prefix': 'moved/'})
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+        response = await client.get(app.url_path_for('download_file'),
+                                    params={'token': token, 'file_id': file_ids[1]})
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+        response = await client.get(app.url_path_for('get_usage'), params={'token': token})
+        assert response.json()['files'] == usage['files'] - 1
+        async for database in app.dependency_overrides[get_session]():
+            blobs = await database.execute(select(Blobs).where(Blobs.digest.in_(
+                [hashlib.sha256(content).hexdigest() for content in (b'first', b'second')])))
+            assert not blobs.scalars().all()
+
+    @pytest.mark.dependency(depends=["TestFiles::test_upload"])
+    async def test_reconciliation(self, client: AsyncClient) -> None:
+        """Tests reconciliation of file records with the storage"""
+        response = await client.post(app.url_path_for('authenticate_user'),
+                                     json={'username': TEST_USERNAME, 'password': TEST_PASSWORD})
+        token = response.json()['token']
+        orphan_path = f'{TEST_USERNAME}/orphan'
+        await storage_client.upload_file(orphan_path, b'orphan')
+        response = await client.post(app.url_path_for('upload_file_stream'),
+                                     params={'token': token, 'filepath': 'reconcile/missing'},
+                                     content=b'missing content')
+        file_id = response.json()['id']
+        async for database in app.dependency_overrides[get_session]():
+            file_db = (await database.execute(select(Files).where(Files.id == file_id))).scalar()
+            await storage_client.remove_files([file_db.storage_path])
+        reconciler = Reconciler(
+            session_factory=asynccontextmanager(app.dependency_overrides[get_session]),
+            interval=0, batch_size=2, batch_delay=0, grace_period=0, repair=True)
+        stats = await reconciler.run()
+        assert stats['orphans'] == stats['orphans_removed'] == 1
+        assert stats['missing'] == stats['files_deleted'] == 1
+        with pytest.raises(FileNotFoundError):
+            await storage_client.stat_file(orphan_path)
+        response = await client.get(app.url_path_for('download_file'),
+                                    params={'token': token, 'file_id': file_id})
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+        stats = await reconciler.run()
+        assert stats['objects'] == stats['records'] > 0
+        assert stats['orphans'] == stats['missing'] == 0
+        # another worker is reconciling, the lock is released after each run
+        async for database in app.dependency_overrides[get_session]():
+            connection = await database.connection(
+                execution_options={'isolation_level': 'AUTOCOMMIT'})
+            await connection.execute(text('SELECT pg_advisory_lock(:key)'),
+                                     {'key': RECONCILE_LOCK_KEY})
+            assert await reconciler.run() is None
+            await connection.execute(text('SELECT pg_advisory_unlock(:key)'),
+                                     {'key': RECONCILE_LOCK_KEY})
+        assert await reconciler.run() is not None